@@ -0,0 +1,99 @@
+# api_keys.py
+# YouTube Data API キーのプール。
+# API_KEYS（カンマ/空白区切り）が無ければ従来どおり API_KEY 1本。
+# 当日（PT）の推定使用量が一番少ないキーから使い、quotaExceeded を返したキーは
+# PT の 0:00 まで外す。使用量・枯渇フラグは quota_tracker の台帳（SQLite）にあるので全ワーカー共有。
+# pick() は毎回台帳を読まず、メモリ上の使用量（台帳から読み込んで record() で足す）を見る。
+# 他のワーカーの分は USAGE_SYNC_SEC ごとに台帳から読み直して取り込む。
+import os
+import re
+import time
+import hashlib
+from datetime import datetime
+from typing import Iterable, List
+
+from quota_tracker import COST, LA, QuotaTracker, quota
+
+USAGE_SYNC_SEC = float(os.environ.get("KEY_USAGE_SYNC_SEC") or "30")
+
+
+def _load_keys() -> List[str]:
+    raw = os.environ.get("API_KEYS") or os.environ.get("API_KEY") or ""
+    return list(dict.fromkeys(k for k in re.split(r"[\s,]+", raw) if k))
+
+
+def key_id(key: str) -> str:
+    """台帳・画面に出す識別子（キーそのものは残さない）"""
+    return "k_" + hashlib.sha256(key.encode("utf-8")).hexdigest()[:10]
+
+
+class ApiKeyPool:
+    def __init__(self, keys: Iterable[str], tracker: QuotaTracker = quota):
+        self.keys = list(keys)
+        self._ids = {k: key_id(k) for k in self.keys}
+        self._tracker = tracker
+        self._rr = 0
+        # 当日（PT）のキーごとの使用量 {key_id: [units, exhausted]}
+        self._usage: dict = {}
+        self._usage_day = ""
+        self._synced_at = 0.0
+        tracker.key_count = max(1, len(self.keys))
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def __bool__(self) -> bool:
+        return bool(self.keys)
+
+    @property
+    def primary(self) -> str:
+        return self.keys[0] if self.keys else ""
+
+    def id_of(self, key: str) -> str:
+        return self._ids.get(key) or key_id(key)
+
+    def pick(self, exclude: Iterable[str] = ()) -> str:
+        """
+        枯渇していないキーのうち当日の推定使用量が最少のものを返す（同点はラウンドロビン）。
+        全部ダメなら ""。
+        """
+        exclude = set(exclude)
+        if len(self.keys) <= 1:
+            # 1本だけなら台帳を読むまでもない（枯渇済みでも投げて quotaExceeded を受ける＝従来どおり）
+            return "" if not self.keys or self.keys[0] in exclude else self.keys[0]
+        usage = self._usage_today()
+        self._rr = (self._rr + 1) % len(self.keys)
+        best, best_units = "", None
+        for i in range(len(self.keys)):
+            k = self.keys[(self._rr + i) % len(self.keys)]
+            if k in exclude:
+                continue
+            units, exhausted = usage.get(self._ids[k]) or (0, False)
+            if exhausted:
+                continue
+            if best_units is None or units < best_units:
+                best, best_units = k, units
+        return best
+
+    def _usage_today(self) -> dict:
+        # 日付が変わったら（exhausted も解除）/ 一定時間ごとに台帳（未書き込み分込み）から読み直す
+        day = datetime.now(LA).date().isoformat()
+        if day != self._usage_day or time.monotonic() - self._synced_at >= USAGE_SYNC_SEC:
+            self._usage = {k: [v["units"], v["exhausted"]] for k, v in self._tracker.by_key().items()}
+            self._usage_day = day
+            self._synced_at = time.monotonic()
+        return self._usage
+
+    def mark_exhausted(self, key: str):
+        kid = self.id_of(key)
+        self._tracker.mark_exhausted(kid)
+        self._usage_today().setdefault(kid, [0, False])[1] = True
+
+    def record(self, key: str, method: str, times: int = 1):
+        kid = self.id_of(key) if key else ""
+        self._tracker.add(method, times, key_id=kid)
+        if kid:
+            self._usage_today().setdefault(kid, [0, False])[0] += COST.get(method, 1) * max(1, int(times))
+
+
+pool = ApiKeyPool(_load_keys())
@@ -1,18 +1,32 @@
 import os
 import re
+import csv
 import time
-import uuid
+import hashlib
 import math
 import io
 import asyncio
+import contextlib
+import dataclasses
+import json
 import urllib.parse
 from datetime import datetime, timezone, timedelta
-from typing import Any, Dict, List, Optional, Tuple
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
 
 import aiohttp
-from quart import Quart, request, render_template, Response
-
+from quart import Quart, request, render_template, Response, stream_with_context
+
+import api_keys
+import channel_sync
+import get_comment
+import http_client
+import quota_tracker
+import rate_limit
+import render_cache
 import search_youtube
+import video_index
+from result_set import ResultSet
+from singleflight import SingleFlight
 
 # 画像出力（X用まとめ画像）
 from PIL import Image, ImageDraw, ImageFont
@@ -21,8 +35,26 @@ app = Quart(__name__)
 app.jinja_env.trim_blocks = True
 app.jinja_env.lstrip_blocks = True
 
+
+@app.before_serving
+async def _startup():
+    # 外向きHTTPは全部この共有セッション（コネクションプール）経由
+    await http_client.startup()
+    # ローカル全文インデックスの初回取り込み（重いのでスレッドで）
+    await video_index.startup()
+    # WATCH_CHANNELS があればバックグラウンド同期を始める
+    await channel_sync.startup()
+
+
+@app.after_serving
+async def _shutdown():
+    await channel_sync.shutdown()
+    await http_client.shutdown()
+    # 溜まっているクォータの記録を台帳に書き切る
+    await asyncio.to_thread(quota_tracker.quota.flush)
+
 YT_BASE_URL = (os.environ.get("URL") or "https://www.googleapis.com/youtube/v3/").strip()
-API_KEY = (os.environ.get("API_KEY") or "").strip()
+API_KEY = search_youtube.API_KEY  # 実際に使うキーは api_keys.pool（search_youtube._api_get_json が選ぶ）
 if YT_BASE_URL and not YT_BASE_URL.endswith("/"):
     YT_BASE_URL += "/"
 
@@ -32,58 +64,17 @@ JST = timezone(timedelta(hours=9))
 # Quota (推定) 表示用: YouTube Data API は日次クォータ（通常 10,000 units）が
 # 「米国太平洋時間の 0:00」でリセットされます。
 # ※この値はアプリ内部の“推定”で、正確な残量はAPIからは取得できません。
+# 集計は quota_tracker（全ワーカー共有の台帳）に一本化。
 # ---------------------------
-try:
-    from zoneinfo import ZoneInfo  # py3.9+
-except Exception:  # pragma: no cover
-    ZoneInfo = None  # type: ignore
-
-_YT_QUOTA_LIMIT = int(os.environ.get("YT_QUOTA_LIMIT") or 10000)
-_quota_used_estimate = 0
-_quota_used_by_method = {}
-
-# ざっくり代表値（必要なら増やす）
-_QUOTA_COST = {
-    "search.list": 100,
-    "videos.list": 1,
-    "channels.list": 1,
-    "commentThreads.list": 1,
-    "comments.list": 1,
-}
-
-def quota_add(method: str):
-    global _quota_used_estimate
-    cost = int(_QUOTA_COST.get(method, 1))
-    _quota_used_estimate += cost
-    _quota_used_by_method[method] = int(_quota_used_by_method.get(method, 0)) + cost
-
-def _quota_reset_at_jst_str() -> str:
-    # 次の「米国太平洋時間 0:00」をJSTに変換して文字列化
-    try:
-        if ZoneInfo is None:
-            return "-"
-        pt = ZoneInfo("America/Los_Angeles")
-        now_pt = datetime.now(pt)
-        reset_pt = (now_pt + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
-        reset_jst = reset_pt.astimezone(JST)
-        return reset_jst.strftime("%Y-%m-%d %H:%M:%S JST")
-    except Exception:
-        return "-"
 
 def quota_snapshot_dict() -> dict:
-    remaining = max(0, _YT_QUOTA_LIMIT - _quota_used_estimate)
-    return {
-        "estimate_used": _quota_used_estimate,
-        "estimate_remaining": remaining,
-        "limit": _YT_QUOTA_LIMIT,
-        "reset_at_jst": _quota_reset_at_jst_str(),
-        "by_method": _quota_used_by_method,
-    }
+    return quota_tracker.quota.snapshot_dict()
 
 
 # ---------------------------
 # Cache (search result)
 # ---------------------------
+# search_youtube.search_key(...) -> (ts, SearchResult)
 CACHE: Dict[Tuple[Any, ...], Tuple[float, Any]] = {}
 CACHE_TTL_SEC = 600  # 10分
 
@@ -127,7 +118,10 @@ def share_set(payload: Dict[str, Any]) -> str:
     for k, (ts, _d) in list(SHARE_CACHE.items()):
         if _now_ts() - ts > SHARE_TTL_SEC:
             SHARE_CACHE.pop(k, None)
-    sid = uuid.uuid4().hex
+    # 同じ結果なら同じ sid（描画済みページをキャッシュ・304 で返しても、埋め込んだ sid がそのまま使える）
+    material = {k: v for k, v in payload.items() if k != "meta"}
+    material["query"] = (payload.get("meta") or {}).get("query", "")
+    sid = hashlib.sha256(_compact_json(material).encode("utf-8")).hexdigest()[:32]
     SHARE_CACHE[sid] = (_now_ts(), payload)
     return sid
 
@@ -198,6 +192,8 @@ def default_form() -> Dict[str, str]:
         "to": "",
         "channel_id": "",
         "order": "date",
+        "source": "search",  # search | uploads（チャンネル指定時のみ。1 unit/50件）| index（ローカルのみ。0 unit）
+        "shards": "1",  # 期間分割数（source=search のみ。2以上で並行・深く取る）
         "kind": "",  # ''=両方, 'normal', 'shorts'
         "viewcount_min": "",
         "viewcount_max": "",
@@ -205,6 +201,10 @@ def default_form() -> Dict[str, str]:
         "sub_max": "",
         "video_count": "200",
         "comment_video": "",
+        "stream": "1",  # 取れた分から逐次表示
+        "sort": "",  # ''=検索の並びのまま / date, views, likes, comments, subscribers, duration（サーバ側で並べ替え）
+        "dir": "desc",  # desc | asc
+        "per_page": str(PAGE_SIZE),  # 1ページ（1テーブル）に出す行数
     }
 
 
@@ -218,31 +218,15 @@ def _row_is_shorts(row: Dict[str, Any]) -> bool:
     return False
 
 
-def _normalize_rows(rows: Any) -> List[Dict[str, Any]]:
-    if not isinstance(rows, list):
-        return []
-    out = []
-    for r in rows:
-        if isinstance(r, dict):
-            # APIエラーが紛れた場合に備える
-            if "error" in r:
-                continue
-            out.append(r)
-    return out
-
-
 async def yt_get_video_snippet(video_id: str) -> Tuple[str, str, str]:
     """(title, thumb_url, channel_title)"""
-    if not API_KEY:
+    if not api_keys.pool:
         return "", "", ""
     params = {"part": "snippet", "id": video_id, "key": API_KEY}
-    url = YT_BASE_URL + "videos?" + urllib.parse.urlencode(params)
-    timeout = aiohttp.ClientTimeout(total=20)
-    async with aiohttp.ClientSession(timeout=timeout) as session:
-        async with session.get(url) as resp:
-            if resp.status != 200:
-                return "", "", ""
-            body = await resp.json()
+    try:
+        body = await search_youtube._api_get_json(http_client.get_session(), "videos", params, "videos.list", retries=1)
+    except Exception:
+        return "", "", ""
     items = body.get("items") or []
     if not items:
         return "", "", ""
@@ -255,44 +239,90 @@ async def yt_get_video_snippet(video_id: str) -> Tuple[str, str, str]:
 
 
 # ---------------------------
-# Search invoke (signature-safe)
+# Search invoke (cached)
 # ---------------------------
+# CACHE は「フィルタ前・件数違い」を吸収できるよう、search_youtube.search_key（キーワード/チャンネル/期間/並び順）
+# ごとにフィルタ前の SearchResult を持つ。再生数/登録者数の閾値や少ない video_count はキャッシュから切り出し、
+# キャッシュより多い件数が要るときだけ nextPageToken の続きを API に取りに行く。
 
-def _call_search_youtube_kwargs() -> Dict[str, Any]:
-    """search_youtube.search_youtube の実装差分を吸収するための引数名マップ"""
-    import inspect
+# 同じ検索キーが同時に来たら1本だけ走らせて結果を共有する
+_search_flight = SingleFlight()
 
-    sig = inspect.signature(search_youtube.search_youtube)
-    names = set(sig.parameters.keys())
 
-    # 新しめ（あなたの途中版）
-    if "channel_id_input" in names:
-        return {
-            "style": "new",
-            "channel": "channel_id_input",
-            "keyword": "key_word",
-            "from": "published_from",
-            "to": "published_to",
-            "vmin": "viewcount_min",
-            "vmax": "viewcount_max",
-            "smin": "subscribercount_min",
-            "smax": "subscribercount_max",
-            "count": "video_count",
-            "order": "order",
-        }
+async def run_search_unfiltered(
+    channel_id: str,
+    word: str,
+    from_date: str,
+    to_date: str,
+    video_count: str,
+    order: str,
+    view_min: str = "",
+    source: str = "search",
+    shards: str = "1",
+) -> search_youtube.SearchResult:
+    limit = max(1, safe_int(video_count, 200))
+    vmin = safe_int(view_min, 0)
+    key = search_youtube.search_key(channel_id, word, from_date, to_date, order, source, shards)
+
+    res = None
+    for _ in range(3):
+        res = await _search_flight.do(
+            key, lambda: _run_search_unfiltered(
+                key, channel_id, word, from_date, to_date, video_count, order, view_min, source, shards
+            )
+        )
+        # 相乗りした先行リクエストの件数が足りなければ、キャッシュの続きから取り直す
+        # （notice 付き＝クォータ切れ等で途中までのときは、すぐには取りに行かない）
+        if res.error or res.notice or res.covers(limit, vmin) or not res.can_extend():
+            break
+    return res
 
-    # 旧（最初にもらったやつ）
-    return {
-        "style": "old",
-        "channel": "channel_id",
-        "keyword": "key_word",
-        "from": "published_from",
-        "to": "published_to",
-        "vmin": "viewcount_level",
-        "smin": "subscribercount_level",
-        "count": "video_count",
-        "get_comment": "is_get_comment",
-    }
+
+async def _run_search_unfiltered(
+    key: Tuple[Any, ...],
+    channel_id: str,
+    word: str,
+    from_date: str,
+    to_date: str,
+    video_count: str,
+    order: str,
+    view_min: str,
+    source: str = "search",
+    shards: str = "1",
+) -> search_youtube.SearchResult:
+    limit = max(1, safe_int(video_count, 200))
+
+    entry = CACHE.get(key)
+    res = cache_get(key)
+    if res is not None and res.covers(limit, safe_int(view_min, 0)):
+        return res
+
+    if res is not None and res.can_extend():
+        more = await search_youtube.search_unfiltered(
+            channel_id, word, from_date, to_date, str(limit - res.fetched), order,
+            page_token=res.next_page_token, viewcount_min=view_min, source=source,
+        )
+        if more.error:
+            # 続きが取れなくても（クォータ切れ等）最初から取り直さない（同じ分の search.list をまた払うだけ）。
+            # キャッシュ済みの分を注意書き付きで返す
+            return dataclasses.replace(
+                res, notice=f"続きを取得できませんでした（{res.fetched} 件までの結果です）: {more.error}"
+            )
+        # キャッシュ本体は他の読み手が持っているので、コピーに足してから差し替える
+        res = dataclasses.replace(res, rows=res.rows.copy())
+        res.extend(more)
+        res.notice = more.notice
+        # TTL は最初に取った時点のまま（古い統計が延命しないように）
+        CACHE[key] = (entry[0], res)
+        return res
+
+    # キャッシュが無い / 続きのトークンが無いときだけ最初から
+    res = await search_youtube.search_unfiltered(
+        channel_id, word, from_date, to_date, video_count, order, viewcount_min=view_min, source=source, shards=shards
+    )
+    if not res.error:
+        cache_set(key, res)
+    return res
 
 
 async def run_search(
@@ -306,39 +336,124 @@ async def run_search(
     sub_max: str,
     video_count: str,
     order: str,
-) -> List[Dict[str, Any]]:
-    m = _call_search_youtube_kwargs()
-
-    if m["style"] == "new":
-        kwargs = {
-            m["channel"]: channel_id,
-            m["keyword"]: word,
-            m["from"]: from_date,
-            m["to"]: to_date,
-            m["vmin"]: view_min,
-            m["vmax"]: view_max,
-            m["smin"]: sub_min,
-            m["smax"]: sub_max,
-            m["count"]: video_count,
-            m["order"]: order,
-        }
-        rows = await search_youtube.search_youtube(**kwargs)
-        return _normalize_rows(rows)
-
-    # old
-    # old版は max フィルタや order なし／コメント有りは最初から取る設計だったので False固定
-    args = (
-        channel_id,
-        word,
-        from_date,
-        to_date,
-        safe_int(view_min, 0),
-        safe_int(sub_min, 0),
-        safe_int(video_count, 200),
-        False,
+    source: str = "search",
+    shards: str = "1",
+) -> Tuple[ResultSet, search_youtube.SearchResult]:
+    """return (フィルタ済みの rows, 元の SearchResult（error / notice / stats 用）)"""
+    res = await run_search_unfiltered(channel_id, word, from_date, to_date, video_count, order, view_min, source, shards)
+    if res.error:
+        return ResultSet(), res
+    rows = res.select(max(1, safe_int(video_count, 200)), view_min, view_max, sub_min, sub_max)
+    return rows, res
+
+
+async def iter_run_search(
+    channel_id: str,
+    word: str,
+    from_date: str,
+    to_date: str,
+    view_min: str,
+    view_max: str,
+    sub_min: str,
+    sub_max: str,
+    video_count: str,
+    order: str,
+    source: str = "search",
+    shards: str = "1",
+):
+    """
+    run_search の逐次版。フィルタ済みの行を取れた分から (rows, ここまでの SearchResult) で yield する。
+    キャッシュで足りる/同じ検索が実行中ならまとめて1回、足りなければ search.list のページごとに返す。
+    """
+    limit = max(1, safe_int(video_count, 200))
+    key = search_youtube.search_key(channel_id, word, from_date, to_date, order, source, shards)
+
+    cached = cache_get(key)
+    if key in _search_flight or (
+        cached is not None and (not cached.can_extend() or cached.covers(limit, safe_int(view_min, 0)))
+    ):
+        yield await run_search(
+            channel_id, word, from_date, to_date, view_min, view_max, sub_min, sub_max, video_count, order, source, shards
+        )
+        return
+
+    # 取得本体は _search_flight に載せる（後から来た同じ検索は逐次表示でもそうでなくても最終結果に相乗り）。
+    # ここではそれが出すページを queue から受け取って流すだけ
+    pages: "asyncio.Queue[Any]" = asyncio.Queue()
+    fut = _search_flight.start(
+        key, lambda: _stream_search(
+            key, pages, limit, channel_id, word, from_date, to_date, view_min, view_max, sub_min, sub_max, order, source, shards
+        )
     )
-    rows = await search_youtube.search_youtube(*args)
-    return _normalize_rows(rows)
+    try:
+        while True:
+            item = await pages.get()
+            if item is None:
+                break
+            yield item
+        await fut  # 取得側の例外はここで出す
+    finally:
+        # 途中で切断されたら、相乗りが居なければ取得も止める（取れた分はキャッシュに残っている）
+        if not fut.done() and not _search_flight.waiting(key):
+            fut.cancel()
+
+
+async def _stream_search(
+    key: Tuple[Any, ...],
+    pages: "asyncio.Queue[Any]",
+    limit: int,
+    channel_id: str,
+    word: str,
+    from_date: str,
+    to_date: str,
+    view_min: str,
+    view_max: str,
+    sub_min: str,
+    sub_max: str,
+    order: str,
+    source: str,
+    shards: str,
+) -> search_youtube.SearchResult:
+    """iter_run_search の取得側。(rows, ここまでの SearchResult) を pages に積み、最後の SearchResult を返す"""
+    try:
+        entry = CACHE.get(key)
+        cached = cache_get(key)
+        if cached is not None:
+            # キャッシュ済みの分を先に出し、続きだけ取りに行く（キャッシュ本体は他の読み手がいるのでコピーに足す）
+            acc = dataclasses.replace(cached, rows=cached.rows.copy())
+            pages.put_nowait((acc.select(limit, view_min, view_max, sub_min, sub_max), acc))
+            ts = entry[0]
+        else:
+            acc = search_youtube.SearchResult(source=source)
+            ts = _now_ts()
+
+        async for page in search_youtube.iter_search(
+            channel_id, word, from_date, to_date, str(limit - acc.fetched), order,
+            page_token=acc.next_page_token, viewcount_min=view_min, source=source, shards=shards,
+        ):
+            if page.error:
+                if acc.fetched:
+                    # 続きが取れなくてもキャッシュ済み・取得済みの分（もう流した）は活かす（_run_search_unfiltered と同じ）
+                    acc.notice = f"続きを取得できませんでした（{acc.fetched} 件までの結果です）: {page.error}"
+                    pages.put_nowait((ResultSet(), acc))
+                    return acc
+                pages.put_nowait((ResultSet(), page))
+                return page
+            if page.mode == "rss" or page.shards:
+                cache_set(key, page)
+                pages.put_nowait((page.select(limit, view_min, view_max, sub_min, sub_max), page))
+                return page
+            # このページの rank は acc の続き（acc.fetched から）になるので、limit までの残りで切る
+            # （uploads は絞り込み後も 50 件単位で返ってくるので、ページの途中で limit を超えることがある）
+            remaining = max(0, limit - acc.fetched)
+            acc.extend(page)
+            acc.notice = page.notice or acc.notice
+            # 途中で切断されても取れた分はキャッシュに残す
+            CACHE[key] = (ts, acc)
+            pages.put_nowait((page.select(remaining, view_min, view_max, sub_min, sub_max), acc))
+        return acc
+    finally:
+        pages.put_nowait(None)
 
 
 # ---------------------------
@@ -440,10 +555,11 @@ def _fit_contain(img: Image.Image, box_w: int, box_h: int) -> Image.Image:
 
 async def _fetch_image_bytes(session: aiohttp.ClientSession, url: str) -> Optional[bytes]:
     try:
-        async with session.get(url) as resp:
-            if resp.status != 200:
-                return None
-            return await resp.read()
+        async with rate_limit.limiter("thumb").slot():
+            async with session.get(url) as resp:
+                if resp.status != 200:
+                    return None
+                return await resp.read()
     except Exception:
         return None
 
@@ -497,10 +613,9 @@ async def render_share_image(
     canvas = Image.new("RGB", (out_w, out_h), (255, 255, 255))
     draw = ImageDraw.Draw(canvas)
 
-    timeout = aiohttp.ClientTimeout(total=30)
-    async with aiohttp.ClientSession(timeout=timeout) as session:
-        tasks = [_fetch_image_bytes(session, it.get("thumb") or "") for it in items]
-        blobs = await asyncio.gather(*tasks)
+    session = http_client.get_session()
+    tasks = [_fetch_image_bytes(session, it.get("thumb") or "") for it in items]
+    blobs = await asyncio.gather(*tasks)
 
     for idx, it in enumerate(items):
         r = idx // cols
@@ -563,83 +678,122 @@ async def home():
     )
 
 
-@app.get("/scraping", strict_slashes=False)
-async def scraping():
+def _search_form() -> Dict[str, str]:
+    """/scraping 系のクエリパラメータを form（index.html のフォーム値）にまとめる"""
     form = default_form()
-
-    word = request.args.get("word", "")
-    from_date = request.args.get("from", "")
-    to_date = request.args.get("to", "")
-    channel_id = request.args.get("channel-id", "")
-
-    view_min = request.args.get("viewcount-level", "")
-    view_max = request.args.get("viewcount-max", "")
-    sub_min = request.args.get("subscribercount-level", "")
-    sub_max = request.args.get("subscribercount-max", "")
-    video_count = request.args.get("video-count", "200")
-    order = request.args.get("order", "date")
-    kind = request.args.get("kind", "")  # '', normal, shorts
-
     form.update(
         {
-            "word": word,
-            "from": from_date,
-            "to": to_date,
-            "channel_id": channel_id,
-            "order": order,
-            "kind": kind,
-            "viewcount_min": view_min,
-            "viewcount_max": view_max,
-            "sub_min": sub_min,
-            "sub_max": sub_max,
-            "video_count": video_count,
+            "word": request.args.get("word", ""),
+            "from": request.args.get("from", ""),
+            "to": request.args.get("to", ""),
+            "channel_id": request.args.get("channel-id", ""),
+            "order": request.args.get("order", "date"),
+            "source": request.args.get("source", "search"),
+            "shards": request.args.get("shards", "1"),
+            "kind": request.args.get("kind", ""),  # '', normal, shorts
+            "viewcount_min": request.args.get("viewcount-level", ""),
+            "viewcount_max": request.args.get("viewcount-max", ""),
+            "sub_min": request.args.get("subscribercount-level", ""),
+            "sub_max": request.args.get("subscribercount-max", ""),
+            "video_count": request.args.get("video-count", "200"),
+            # 無指定は default_form と同じ（逐次表示）。フォームのチェックを外すと hidden の "0" だけが来る
+            "stream": (request.args.getlist("stream") or [form["stream"]])[-1],
+            "sort": request.args.get("sort", ""),
+            "dir": request.args.get("dir", "desc"),
+            "per_page": request.args.get("per-page", str(PAGE_SIZE)),
         }
     )
+    return form
 
-    cache_key = (
-        word,
-        from_date,
-        to_date,
-        channel_id,
-        view_min,
-        view_max,
-        sub_min,
-        sub_max,
-        video_count,
-        order,
-    )
 
-    rows = cache_get(cache_key)
-    if rows is None:
-        rows = await run_search(
-            channel_id=channel_id,
-            word=word,
-            from_date=from_date,
-            to_date=to_date,
-            view_min=view_min,
-            view_max=view_max,
-            sub_min=sub_min,
-            sub_max=sub_max,
-            video_count=video_count,
-            order=order,
-        )
-        cache_set(cache_key, rows)
-
-    # split
-    normal_rows: List[Dict[str, Any]] = []
-    shorts_rows: List[Dict[str, Any]] = []
-    for r in _normalize_rows(rows):
-        if _row_is_shorts(r):
-            shorts_rows.append(r)
-        else:
-            normal_rows.append(r)
+def _search_kwargs(form: Dict[str, str]) -> Dict[str, str]:
+    return {
+        "channel_id": form["channel_id"],
+        "word": form["word"],
+        "from_date": form["from"],
+        "to_date": form["to"],
+        "view_min": form["viewcount_min"],
+        "view_max": form["viewcount_max"],
+        "sub_min": form["sub_min"],
+        "sub_max": form["sub_max"],
+        "video_count": form["video_count"],
+        "order": form["order"],
+        "source": form["source"],
+        "shards": form["shards"],
+    }
+
+
+def _split_rows(rows: ResultSet, kind: str) -> Tuple[ResultSet, ResultSet]:
+    # ショート判定は ResultSet の isShorts 列で（行 dict は描画時に作る）
+    normal_rows = rows.filter(kind="normal") if kind != "shorts" else ResultSet()
+    shorts_rows = rows.filter(kind="shorts") if kind != "normal" else ResultSet()
+    return normal_rows, shorts_rows
 
-    if kind == "normal":
-        shorts_rows = []
-    elif kind == "shorts":
-        normal_rows = []
 
+# ---------------------------
+# Result paging (server-side sort)
+# ---------------------------
+# 結果テーブルは1ページ分だけ描画し、並べ替え・ページ送りはキャッシュ済みの ResultSet からサーバ側で切り出す
+# （/scraping/page が1ページ分の <tr> 断片 or JSON を返す）。描画量・転送量は結果件数ではなくページサイズで決まる。
+PAGE_SIZE = max(1, int(os.environ.get("RESULT_PAGE_SIZE") or "50"))
+PAGE_SIZE_MAX = 500
+
+# sort パラメータ → ResultSet の数値列
+SORT_COLUMNS = {
+    "date": "publishedTs",
+    "views": "viewCount",
+    "likes": "likeCount",
+    "comments": "commentCount",
+    "subscribers": "subscriberCount",
+    "duration": "durationSec",
+}
+
+
+@dataclasses.dataclass
+class ResultPage:
+    rows: ResultSet
+    total: int
+    page: int
+    pages: int
+    per_page: int
+    sort: str
+    dir: str
+
+    def meta(self) -> Dict[str, Any]:
+        return {
+            "total": self.total,
+            "page": self.page,
+            "pages": self.pages,
+            "per_page": self.per_page,
+            "sort": self.sort,
+            "dir": self.dir,
+        }
+
+
+def _per_page(form: Dict[str, str]) -> int:
+    return min(PAGE_SIZE_MAX, max(1, safe_int(form.get("per_page"), PAGE_SIZE)))
+
+
+def _page_rows(rows: ResultSet, sort: str, direction: str, page: int, per_page: int) -> ResultPage:
+    """rows を sort 列で並べて page ページ目（1始まり）を切り出す。全体は並べず、そのページまでの上位だけ取る"""
+    sort = sort if sort in SORT_COLUMNS else ""
+    direction = "asc" if direction == "asc" else "desc"
+    total = len(rows)
+    pages = max(1, math.ceil(total / per_page))
+    page = min(max(1, page), pages)
+    start = (page - 1) * per_page
+    end = min(total, start + per_page)
+    if sort:
+        idx = rows.top_k(SORT_COLUMNS[sort], end, descending=direction == "desc")[start:]
+    else:
+        idx = range(start, end)
+    return ResultPage(rows.subset(idx), total, page, pages, per_page, sort, direction)
+
+
+def _share_rows(normal_rows: Iterable[Dict[str, Any]], shorts_rows: Iterable[Dict[str, Any]], word: str) -> str:
     # share payload (タイトル/チャンネル名の出力は後で選べるので、ここでは素材だけ)
+    keys = ("thumbnails", "title", "name")
+
     def to_item(r: Dict[str, Any]) -> Dict[str, Any]:
         return {
             "thumb": r.get("thumbnails") or "",
@@ -647,25 +801,414 @@ async def scraping():
             "channel": r.get("name") or "",
         }
 
+    def items(rows: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        # ResultSet なら要るキーだけ dict にする
+        return [to_item(r) for r in (rows.to_dicts(keys=keys) if isinstance(rows, ResultSet) else rows)]
+
     payload = {
-        "normal": [to_item(r) for r in normal_rows],
-        "shorts": [to_item(r) for r in shorts_rows],
+        "normal": items(normal_rows),
+        "shorts": items(shorts_rows),
         "meta": {
             "createdAt": datetime.now(JST).strftime("%Y-%m-%d %H:%M:%S"),
             "query": word,
         },
     }
-    share_sid = share_set(payload)
+    return share_set(payload)
 
-    return await render_template(
+
+# ---------------------------
+# Rendered output (cache / compression / ETag)
+# ---------------------------
+# 描画済みの本文は render_cache に「表示パラメータ（クエリ全体）＋元データの版」で持つ。
+# 検索結果の版は CACHE の (キー, 取得時刻, 取得件数)。続きを取り足せば件数が変わるので別の版になる。
+# 推定クォータはキャッシュする本文に入れない（ページ側が /api/quota から今の値を取る）。
+SHELL_RENDER_TTL_SEC = 60  # 逐次表示の枠だけのページ
+# /comment は API の今の内容を見せるページなので既定ではキャッシュしない（秒数を入れたときだけ）
+COMMENT_RENDER_TTL_SEC = int(os.environ.get("COMMENT_RENDER_TTL_SEC") or "0")
+
+
+def _search_version(form: Dict[str, str]) -> Optional[Tuple[Any, ...]]:
+    """form の検索がキャッシュにあれば (キー, 取得時刻, 取得件数)。無ければ None"""
+    kw = _search_kwargs(form)
+    key = search_youtube.search_key(
+        kw["channel_id"], kw["word"], kw["from_date"], kw["to_date"], kw["order"], kw["source"], kw["shards"]
+    )
+    res = cache_get(key)
+    if res is None:
+        return None
+    return key, CACHE[key][0], res.fetched
+
+
+def _render_key(name: str, version: Any = None) -> Tuple[Any, ...]:
+    return name, tuple(sorted(request.args.items(multi=True))), version
+
+
+def _search_render_ttl(version: Tuple[Any, ...]) -> float:
+    # 元の検索キャッシュと一緒に切れるように
+    return CACHE_TTL_SEC - (_now_ts() - version[1])
+
+
+def _respond(rendered: render_cache.Rendered, cache_control: str = "private, no-cache") -> Response:
+    """圧縮（Accept-Encoding）・ETag・304 を付けて返す。no-cache = 保存してよいが使う前に ETag で確認"""
+    status, headers, body = rendered.respond(request.headers.get("Accept-Encoding", ""), request.headers.get("If-None-Match", ""))
+    headers["Cache-Control"] = cache_control
+    return Response(body, status=status, headers=headers, mimetype=rendered.mimetype)
+
+
+@app.get("/scraping", strict_slashes=False)
+async def scraping():
+    form = _search_form()
+
+    if form["stream"] == "1":
+        # 逐次表示: ページの枠だけ先に返し、行は /scraping/rows から流し込む
+        rkey = _render_key("scraping-shell")
+        hit = render_cache.cache.get(rkey)
+        if hit is not None:
+            return _respond(hit)
+        html = await render_template(
+            "index.html",
+            title="search_youtube",
+            form=form,
+            normal_rows=[],
+            shorts_rows=[],
+            share_sid="",
+            stream_url="/scraping/rows?" + urllib.parse.urlencode(list(request.args.items(multi=True))),
+        )
+        return _respond(render_cache.cache.put(rkey, html, "text/html", SHELL_RENDER_TTL_SEC))
+
+    version = _search_version(form)
+    hit = render_cache.cache.get(_render_key("scraping", version)) if version else None
+    if hit is not None:
+        return _respond(hit)
+
+    rows, res = await run_search(**_search_kwargs(form))
+    normal_rows, shorts_rows = _split_rows(rows, form["kind"])
+    share_sid = _share_rows(normal_rows, shorts_rows, form["word"])
+    per_page = _per_page(form)
+    normal_page = _page_rows(normal_rows, form["sort"], form["dir"], safe_int(request.args.get("page"), 1), per_page)
+    shorts_page = _page_rows(shorts_rows, form["sort"], form["dir"], safe_int(request.args.get("shorts-page"), 1), per_page)
+
+    html = await render_template(
         "index.html",
-        quota=quota_snapshot_dict(),
         title="search_youtube",
         form=form,
-        normal_rows=normal_rows,
-        shorts_rows=shorts_rows,
+        error=res.error,
+        notice=res.notice,
+        search_stats=res.stats(),
+        normal_rows=normal_page.rows,
+        shorts_rows=shorts_page.rows,
+        normal_page=normal_page.meta(),
+        shorts_page=shorts_page.meta(),
         share_sid=share_sid,
     )
+    version = None if res.error else _search_version(form)
+    if version is None:
+        return _respond(render_cache.Rendered.of(html))
+    return _respond(render_cache.cache.put(_render_key("scraping", version), html, "text/html", _search_render_ttl(version)))
+
+
+@app.get("/scraping/rows", strict_slashes=False)
+async def scraping_rows():
+    """
+    /scraping と同じパラメータで、結果の行（HTML断片）を NDJSON で逐次返す。
+      {"type": "rows", "normal": "<tr>...", "shorts": "<tr>...", "normal_count": n, "shorts_count": n}  … 取れたぶんごと
+      {"type": "done", "error": "", "notice": "", "stats": {...}, "share_sid": "..."}
+    HTML は各テーブルの1ページ目（per-page 行）が埋まるまでの分だけ。それ以降は件数だけ送り、
+    2ページ目以降・並べ替えは /scraping/page で取る。
+    """
+    form = _search_form()
+    per_page = _per_page(form)
+
+    @stream_with_context
+    async def generate():
+        all_normal = ResultSet()
+        all_shorts = ResultSet()
+        res = search_youtube.SearchResult()
+
+        async def first_page_html(rows: ResultSet, shown: int) -> str:
+            room = per_page - shown
+            if room <= 0 or not rows:
+                return ""
+            return await render_template("_result_rows.html", rows=rows.subset(range(min(room, len(rows)))))
+
+        async for rows, res in iter_run_search(**_search_kwargs(form)):
+            normal_rows, shorts_rows = _split_rows(rows, form["kind"])
+            if not normal_rows and not shorts_rows:
+                continue
+            msg = {
+                "type": "rows",
+                "normal": await first_page_html(normal_rows, len(all_normal)),
+                "shorts": await first_page_html(shorts_rows, len(all_shorts)),
+                "normal_count": len(normal_rows),
+                "shorts_count": len(shorts_rows),
+            }
+            all_normal.extend(normal_rows)
+            all_shorts.extend(shorts_rows)
+            yield json.dumps(msg, ensure_ascii=False) + "\n"
+
+        done = {
+            "type": "done",
+            "error": res.error,
+            "notice": res.notice,
+            "stats": res.stats(),
+            "share_sid": _share_rows(all_normal, all_shorts, form["word"]),
+            "per_page": per_page,
+        }
+        yield json.dumps(done, ensure_ascii=False) + "\n"
+
+    # 行ごとに flush しながら圧縮して流す
+    enc = render_cache.negotiate(request.headers.get("Accept-Encoding", ""))
+    headers = {"Cache-Control": "no-store", "X-Accel-Buffering": "no", "Vary": "Accept-Encoding"}
+    if enc:
+        headers["Content-Encoding"] = enc
+    return Response(render_cache.compress_stream(generate(), enc), mimetype="application/x-ndjson", headers=headers)
+
+
+@app.get("/scraping/page", strict_slashes=False)
+async def scraping_page():
+    """
+    /scraping と同じパラメータ＋ kind（normal | shorts）/ page / sort / dir / per-page で、結果テーブルの1ページ分を返す。
+    検索結果はキャッシュ（CACHE）から切り出す（無ければ /scraping と同じく検索する）。
+      format=html (既定) <tr> の断片。ページ情報は X-Result-Total / X-Result-Page / X-Result-Pages / X-Result-Per-Page ヘッダ
+      format=json {"rows": [...], "total", "page", "pages", "per_page", "sort", "dir"}（fields / exclude は /api/search と同じ）
+    """
+    form = _search_form()
+    fmt = (request.args.get("format", "html") or "html").strip().lower()
+    kind = "shorts" if form["kind"] == "shorts" else "normal"
+
+    version = _search_version(form)
+    hit = render_cache.cache.get(_render_key("scraping-page", version)) if version else None
+    if hit is not None:
+        return _respond(hit)
+
+    rows, res = await run_search(**_search_kwargs(form))
+    if res.error:
+        return Response(_compact_json({"error": res.error}), status=502, mimetype="application/json")
+    normal_rows, shorts_rows = _split_rows(rows, kind)
+    page = _page_rows(
+        shorts_rows if kind == "shorts" else normal_rows,
+        form["sort"], form["dir"], safe_int(request.args.get("page"), 1), _per_page(form),
+    )
+
+    if fmt == "json":
+        body = dict(page.meta(), rows=_project_rows(page.rows, request.args.get("fields", ""), request.args.get("exclude", "")))
+        mimetype, out, headers = "application/json", _compact_json(body), {}
+    else:
+        mimetype = "text/html"
+        out = await render_template("_result_rows.html", rows=page.rows)
+        headers = {
+            "X-Result-Total": str(page.total),
+            "X-Result-Page": str(page.page),
+            "X-Result-Pages": str(page.pages),
+            "X-Result-Per-Page": str(page.per_page),
+        }
+    version = _search_version(form)
+    if version is None:
+        return _respond(render_cache.Rendered.of(out, mimetype, headers=headers))
+    return _respond(
+        render_cache.cache.put(_render_key("scraping-page", version), out, mimetype, _search_render_ttl(version), headers)
+    )
+
+
+def _rows_of_kind(rows: Union[ResultSet, List[Dict[str, Any]]], kind: str) -> Union[ResultSet, List[Dict[str, Any]]]:
+    """kind で絞る（並び順はそのまま）"""
+    if isinstance(rows, ResultSet):
+        return rows.filter(kind=kind)
+    if kind == "normal":
+        return [r for r in rows if not _row_is_shorts(r)]
+    if kind == "shorts":
+        return [r for r in rows if _row_is_shorts(r)]
+    return rows
+
+
+def _project_rows(rows: Union[ResultSet, List[Dict[str, Any]]], fields: str, exclude: str) -> List[Dict[str, Any]]:
+    """fields=a,b で指定キーだけ / exclude=a,b で指定キーを除く（両方あれば fields 優先）"""
+    keep = [f for f in (fields or "").split(",") if f.strip()]
+    drop = {f.strip() for f in (exclude or "").split(",") if f.strip()}
+    if keep:
+        keep = [f.strip() for f in keep]
+        if isinstance(rows, ResultSet):
+            # 指定キーの分だけ dict を作る
+            return rows.to_dicts(keys=keep)
+        return [{k: r[k] for k in keep if k in r} for r in rows]
+    if drop:
+        return [{k: v for k, v in r.items() if k not in drop} for r in rows]
+    return rows.to_dicts() if isinstance(rows, ResultSet) else rows
+
+
+def _compact_json(obj: Any) -> str:
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+
+
+@app.get("/api/search", strict_slashes=False)
+async def api_search():
+    """
+    /scraping と同じパラメータで結果を JSON / NDJSON で返す（HTMLを経由しないツール向け）。
+      format=json   (既定) {"rows": [...], "error": "", "notice": "", "stats": {...}, "quota": {...}}
+      format=ndjson 1行1件で取れた分から流し、最後に {"done": true, "count": n, "error": "", "notice": "", "stats": {...}}
+      fields=title,viewCount,...  返すキーを絞る / exclude=description,...  キーを除く
+    """
+    form = _search_form()
+    fmt = (request.args.get("format", "json") or "json").strip().lower()
+    fields = request.args.get("fields", "")
+    exclude = request.args.get("exclude", "")
+
+    if fmt == "ndjson":
+
+        async def generate():
+            count = 0
+            res = search_youtube.SearchResult()
+            async for rows, res in iter_run_search(**_search_kwargs(form)):
+                picked = _rows_of_kind(rows, form["kind"])
+                lines = [_compact_json(r) + "\n" for r in _project_rows(picked, fields, exclude)]
+                count += len(lines)
+                if lines:
+                    yield "".join(lines)
+            done = {"done": True, "count": count, "error": res.error, "notice": res.notice, "stats": res.stats()}
+            yield _compact_json(done) + "\n"
+
+        headers = {"Cache-Control": "no-store", "X-Accel-Buffering": "no"}
+        return Response(generate(), mimetype="application/x-ndjson", headers=headers)
+
+    rows, res = await run_search(**_search_kwargs(form))
+    body = {
+        "rows": _project_rows(_rows_of_kind(rows, form["kind"]), fields, exclude),
+        "error": res.error,
+        "notice": res.notice,
+        "stats": res.stats(),
+        "quota": quota_snapshot_dict(),
+    }
+    return Response(_compact_json(body), mimetype="application/json", headers={"Cache-Control": "no-store"})
+
+
+MULTI_MAX_QUERIES = 20
+
+
+def _multi_queries() -> List[Tuple[str, str]]:
+    """word / channel-id（複数可）と words / channels（改行区切り）から (channel_id, word) の組を作る（両方あれば総当たり）"""
+    def values(single: str, multi: str) -> List[str]:
+        vs = [v.strip() for v in request.args.getlist(single)]
+        vs += [v.strip() for v in (request.args.get(multi, "") or "").splitlines()]
+        return list(dict.fromkeys(v for v in vs if v))
+
+    words = values("word", "words") or [""]
+    channels = values("channel-id", "channels") or [""]
+    return [(c, w) for c in channels for w in words if c or w]
+
+
+@app.get("/api/search/multi", strict_slashes=False)
+async def api_search_multi():
+    """
+    複数キーワード/チャンネルをまとめて検索する。video/channel ID はクエリ間で重複排除してから1回だけ enrich。
+      word=a&word=b / words=改行区切り、channel-id=...（複数可）/ channels=改行区切り（両方あれば総当たり）
+      それ以外のパラメータ（期間・並び順・フィルタ・fields/exclude）は /api/search と同じ
+    {"queries": [{"word", "channel_id", "rows", "error", "notice", "stats"}], "merged": [...], "stats": {...}, "quota": {...}}
+    merged の各行の "queries" は何番目のクエリで出たか。
+    """
+    form = _search_form()
+    fields = request.args.get("fields", "")
+    exclude = request.args.get("exclude", "")
+    queries = _multi_queries()
+    if not queries:
+        return Response(_compact_json({"error": "word または channel-id を指定してください"}), status=400, mimetype="application/json")
+    if len(queries) > MULTI_MAX_QUERIES:
+        return Response(
+            _compact_json({"error": f"クエリが多すぎます（{len(queries)} > {MULTI_MAX_QUERIES}）"}), status=400, mimetype="application/json"
+        )
+
+    kw = _search_kwargs(form)
+    multi = await search_youtube.search_multi(
+        queries, kw["from_date"], kw["to_date"], kw["video_count"], kw["order"], kw["source"]
+    )
+    limit = max(1, safe_int(kw["video_count"], 200))
+
+    out_queries = []
+    for (channel_id, word), res in zip(queries, multi.results):
+        if not res.error:
+            # 単発の検索（/scraping 等）でもそのまま使えるようにキャッシュへ
+            key = search_youtube.search_key(channel_id, word, kw["from_date"], kw["to_date"], kw["order"], kw["source"])
+            if cache_get(key) is None:
+                cache_set(key, res)
+        rows = res.select(limit, kw["view_min"], kw["view_max"], kw["sub_min"], kw["sub_max"])
+        out_queries.append(
+            {
+                "word": word,
+                "channel_id": channel_id,
+                "rows": _project_rows(_rows_of_kind(rows, form["kind"]), fields, exclude),
+                "error": res.error,
+                "notice": res.notice,
+                "stats": res.stats(),
+            }
+        )
+
+    merged = multi.select_merged(kw["view_min"], kw["view_max"], kw["sub_min"], kw["sub_max"])
+    body = {
+        "queries": out_queries,
+        "merged": _project_rows(_rows_of_kind(merged, form["kind"]), fields, exclude),
+        "stats": multi.stats(),
+        "quota": quota_snapshot_dict(),
+    }
+    return Response(_compact_json(body), mimetype="application/json", headers={"Cache-Control": "no-store"})
+
+
+@app.get("/api/quota", strict_slashes=False)
+async def api_quota():
+    """全ワーカー共有のクォータ台帳（推定）。メソッド別内訳と台帳書き込みコスト付き"""
+    return Response(_compact_json(quota_snapshot_dict()), mimetype="application/json", headers={"Cache-Control": "no-store"})
+
+
+@app.get("/api/render_cache", strict_slashes=False)
+async def api_render_cache():
+    """描画済みレスポンスのキャッシュ（件数・バイト数・ヒット/304 の回数・送った圧縮後バイト数）"""
+    return Response(_compact_json(render_cache.cache.stats()), mimetype="application/json", headers={"Cache-Control": "no-store"})
+
+
+@app.get("/api/rate_limit", strict_slashes=False)
+async def api_rate_limit():
+    """外向きHTTPのレート制御の状態（このワーカー分）。待ち時間・429 回数など"""
+    return Response(_compact_json(rate_limit.stats()), mimetype="application/json", headers={"Cache-Control": "no-store"})
+
+
+@app.get("/api/watch", strict_slashes=False)
+async def api_watch():
+    """ウォッチリスト（WATCH_CHANNELS）の同期状況"""
+    return Response(_compact_json(channel_sync.status()), mimetype="application/json", headers={"Cache-Control": "no-store"})
+
+
+# ---------------------------
+# Comments
+# ---------------------------
+def _comment_user_id(author_channel_url: str, author_name: str) -> str:
+    try:
+        if author_channel_url:
+            u = urllib.parse.urlparse(author_channel_url)
+            path = urllib.parse.unquote(u.path or "")
+            m = re.search(r"/@([^/]+)", path)
+            if m:
+                return "@" + m.group(1)
+    except Exception:
+        pass
+    return author_name or ""
+
+
+def _comment_row(comment: Dict[str, Any], no: str, reply_count: int, watch_url: str) -> Dict[str, Any]:
+    """comment リソース（スレッドなら topLevelComment）→ /comment・/comment/export の1行"""
+    sn = comment.get("snippet", {}) or {}
+    aurl = sn.get("authorChannelUrl", "") or ""
+    aname = sn.get("authorDisplayName", "") or ""
+    cid = comment.get("id", "") or ""
+    return {
+        "no": no,
+        "publishedAt": iso_to_jst_str(sn.get("publishedAt", "") or ""),
+        "publishedAtIso": sn.get("publishedAt", "") or "",
+        "text": (sn.get("textOriginal") or sn.get("textDisplay") or "").replace("\r\n", "\n").replace("\r", "\n"),
+        "likeCount": sn.get("likeCount", 0) or 0,
+        "replyCount": reply_count,
+        "userId": _comment_user_id(aurl, aname),
+        "iconUrl": sn.get("authorProfileImageUrl", "") or "",
+        "commentUrl": f"{watch_url}&lc={cid}" if cid else watch_url,
+        "commentId": cid,
+    }
 
 
 @app.get("/comment", strict_slashes=False)
@@ -679,6 +1222,12 @@ async def comment():
     parent_id = (request.args.get("parent-id", "") or "").strip()
     page_token = (request.args.get("pageToken", "") or "").strip()
 
+    # COMMENT_RENDER_TTL_SEC を入れたときだけ、同じ動画・同じページをその間 API も Jinja も通さずに返す
+    rkey = _render_key("comment") if COMMENT_RENDER_TTL_SEC > 0 else None
+    hit = render_cache.cache.get(rkey)
+    if hit is not None:
+        return _respond(hit)
+
     watch_url = f"https://www.youtube.com/watch?v={video_id}"
 
     video_title, video_thumb, channel_title = await yt_get_video_snippet(video_id)
@@ -687,11 +1236,10 @@ async def comment():
     next_token = ""
     error = ""
 
-    if not API_KEY:
+    if not api_keys.pool:
         error = "Missing API_KEY"
-        return await render_template(
+        html = await render_template(
             "comment.html",
-            quota=quota_snapshot_dict(),
             title="Comments",
             error=error,
             video_id=video_id,
@@ -704,31 +1252,11 @@ async def comment():
             rows=[],
             next_page_token="",
         )
+        return _respond(render_cache.Rendered.of(html))
 
     async def yt_get_json(endpoint: str, params: Dict[str, Any]) -> Dict[str, Any]:
-        # quota(推定)カウント
-        _m = {'search':'search.list','videos':'videos.list','channels':'channels.list','commentThreads':'commentThreads.list','comments':'comments.list'}
-        quota_add(_m.get(endpoint, endpoint + '.list'))
-        url = YT_BASE_URL + endpoint + "?" + urllib.parse.urlencode(params)
-        timeout = aiohttp.ClientTimeout(total=30)
-        async with aiohttp.ClientSession(timeout=timeout) as session:
-            async with session.get(url) as resp:
-                txt = await resp.text()
-                if resp.status != 200:
-                    raise RuntimeError(f"{endpoint} failed {resp.status}: {txt}")
-                return await resp.json()
-
-    def user_id(author_channel_url: str, author_name: str) -> str:
-        try:
-            if author_channel_url:
-                u = urllib.parse.urlparse(author_channel_url)
-                path = urllib.parse.unquote(u.path or "")
-                m = re.search(r"/@([^/]+)", path)
-                if m:
-                    return "@" + m.group(1)
-        except Exception:
-            pass
-        return author_name or ""
+        # キー選択・quota(推定)カウント・429/5xxリトライは search_youtube 側と共通
+        return await search_youtube._api_get_json(http_client.get_session(), endpoint, params, endpoint + ".list")
 
     try:
         if mode == "replies":
@@ -746,26 +1274,8 @@ async def comment():
             body = await yt_get_json("comments", params)
             next_token = (body.get("nextPageToken") or "").strip()
 
-            idx = 0
-            for it in (body.get("items") or []):
-                idx += 1
-                sn = it.get("snippet", {}) or {}
-                aurl = sn.get("authorChannelUrl", "") or ""
-                aname = sn.get("authorDisplayName", "") or ""
-                cid = it.get("id", "") or ""
-                rows.append(
-                    {
-                        "no": str(idx),
-                        "publishedAt": iso_to_jst_str(sn.get("publishedAt", "") or ""),
-                        "publishedAtIso": sn.get("publishedAt", "") or "",
-                        "text": (sn.get("textOriginal") or sn.get("textDisplay") or "").replace("\r\n", "\n").replace("\r", "\n"),
-                        "likeCount": sn.get("likeCount", 0) or 0,
-                        "replyCount": 0,
-                        "userId": user_id(aurl, aname),
-                        "iconUrl": sn.get("authorProfileImageUrl", "") or "",
-                        "commentUrl": f"{watch_url}&lc={cid}" if cid else watch_url,
-                    }
-                )
+            for idx, it in enumerate(body.get("items") or [], start=1):
+                rows.append(_comment_row(it, str(idx), 0, watch_url))
         else:
             params = {
                 "part": "snippet",
@@ -780,38 +1290,15 @@ async def comment():
             body = await yt_get_json("commentThreads", params)
             next_token = (body.get("nextPageToken") or "").strip()
 
-            idx = 0
-            for th in (body.get("items") or []):
-                idx += 1
+            for idx, th in enumerate(body.get("items") or [], start=1):
                 sn = th.get("snippet", {}) or {}
-                total_reply = sn.get("totalReplyCount", 0) or 0
-                top = sn.get("topLevelComment", {}) or {}
-                top_sn = top.get("snippet", {}) or {}
-                aurl = top_sn.get("authorChannelUrl", "") or ""
-                aname = top_sn.get("authorDisplayName", "") or ""
-                cid = top.get("id", "") or ""
-
-                rows.append(
-                    {
-                        "no": str(idx),
-                        "publishedAt": iso_to_jst_str(top_sn.get("publishedAt", "") or ""),
-                        "publishedAtIso": top_sn.get("publishedAt", "") or "",
-                        "text": (top_sn.get("textOriginal") or top_sn.get("textDisplay") or "").replace("\r\n", "\n").replace("\r", "\n"),
-                        "likeCount": top_sn.get("likeCount", 0) or 0,
-                        "replyCount": total_reply,
-                        "userId": user_id(aurl, aname),
-                        "iconUrl": top_sn.get("authorProfileImageUrl", "") or "",
-                        "commentUrl": f"{watch_url}&lc={cid}" if cid else watch_url,
-                        "commentId": cid,
-                    }
-                )
+                rows.append(_comment_row(sn.get("topLevelComment", {}) or {}, str(idx), sn.get("totalReplyCount", 0) or 0, watch_url))
 
     except Exception as e:
         error = str(e)
 
-    return await render_template(
+    html = await render_template(
         "comment.html",
-        quota=quota_snapshot_dict(),
         title="Comments",
         error=error,
         video_id=video_id,
@@ -824,6 +1311,88 @@ async def comment():
         rows=rows,
         next_page_token=next_token,
     )
+    if error:
+        return _respond(render_cache.Rendered.of(html))
+    return _respond(render_cache.cache.put(rkey, html, "text/html", COMMENT_RENDER_TTL_SEC))
+
+
+COMMENT_EXPORT_FIELDS = ("no", "publishedAt", "text", "likeCount", "replyCount", "userId", "commentUrl")
+COMMENT_EXPORT_CHUNK_ROWS = 200  # この行数ごとにまとめて送る
+
+
+@app.get("/comment/export", strict_slashes=False)
+async def comment_export():
+    """
+    動画のコメントを全件 CSV / JSONL で流す（取りながら送る。ワーカーは全件を持たない）。
+      video-id=...  format=csv（既定）| jsonl  replies=1 返信も  bom=1 CSV の先頭に UTF-8 BOM（Excel 用）  limit=n
+    列は /comment の行と同じ: no, publishedAt, text, likeCount, replyCount, userId, commentUrl
+    途中で失敗したら、CSV は no="error" の行、JSONL は {"error": "...", "mode": "error"} を最後に付けて終える。
+    """
+    video_id = extract_video_id(request.args.get("video-id", ""))
+    if not video_id:
+        return Response("invalid video-id", status=400)
+    if not api_keys.pool:
+        return Response("Missing API_KEY", status=503)
+    fmt = (request.args.get("format", "csv") or "csv").strip().lower()
+    if fmt not in ("csv", "jsonl"):
+        return Response("format must be csv or jsonl", status=400)
+    replies = (request.args.get("replies", "") or "").strip() in ("1", "true", "on")
+    bom = fmt == "csv" and (request.args.get("bom", "") or "").strip() in ("1", "true", "on")
+    limit = max(0, safe_int(request.args.get("limit"), 0))
+    watch_url = f"https://www.youtube.com/watch?v={video_id}"
+
+    def make_row(comment: Dict[str, Any], no: str, reply_count: int) -> Dict[str, Any]:
+        row = _comment_row(comment, no, reply_count, watch_url)
+        return {k: row[k] for k in COMMENT_EXPORT_FIELDS}
+
+    async def generate():
+        buf = io.StringIO()
+        writer = csv.writer(buf)
+        if bom:
+            buf.write("\ufeff")
+        if fmt == "csv":
+            writer.writerow(COMMENT_EXPORT_FIELDS)
+
+        def add(row: Dict[str, Any]):
+            if fmt == "csv":
+                writer.writerow([row.get(k, "") for k in COMMENT_EXPORT_FIELDS])
+            else:
+                buf.write(_compact_json(row) + "\n")
+
+        def take() -> str:
+            out = buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+            return out
+
+        n = 0
+        it = get_comment.iter_comments(video_id, replies=replies, limit=limit, make_row=make_row)
+        try:
+            # 接続が切れたらここで止まり、先読み中のページ・返信チェーンも捨てる
+            async with contextlib.aclosing(it):
+                async for row in it:
+                    add(row)
+                    n += 1
+                    if n % COMMENT_EXPORT_CHUNK_ROWS == 0:
+                        yield take()
+        except Exception as e:
+            err = str(e) if isinstance(e, search_youtube.QuotaExceededError) else f"{type(e).__name__}: {e}"
+            add({"no": "error", "text": err} if fmt == "csv" else {"error": err, "mode": "error"})
+        rest = take()
+        if rest:
+            yield rest
+
+    mimetype = "text/csv" if fmt == "csv" else "application/x-ndjson"
+    enc = render_cache.negotiate(request.headers.get("Accept-Encoding", ""))
+    headers = {
+        "Cache-Control": "no-store",
+        "X-Accel-Buffering": "no",
+        "Vary": "Accept-Encoding",
+        "Content-Disposition": f'attachment; filename="comments_{video_id}.{fmt}"',
+    }
+    if enc:
+        headers["Content-Encoding"] = enc
+    return Response(render_cache.compress_stream(generate(), enc), mimetype=mimetype, headers=headers)
 
 
 @app.get("/share_image", strict_slashes=False)
@@ -0,0 +1,68 @@
+# batch_executor.py
+# videos.list / channels.list のような「IDを最大50件ずつ投げる」系の呼び出しを
+# 同時実行数を絞りつつ並列に捌くための小さなヘルパー。
+import os
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Iterable, List
+
+# 既定の同時実行数（YouTube API 側のレート制限に当たらない程度に控えめ）
+DEFAULT_CONCURRENCY = max(1, int(os.environ.get("YT_BATCH_CONCURRENCY") or "4"))
+DEFAULT_CHUNK_SIZE = 50  # videos.list / channels.list の id 上限
+
+ChunkFetcher = Callable[[List[str]], Awaitable[Dict[str, Any]]]
+
+
+def chunked(ids: Iterable[str], size: int = DEFAULT_CHUNK_SIZE) -> List[List[str]]:
+    """重複を除きつつ順序を保って size 件ずつに分割"""
+    seen = set()
+    uniq = []
+    for x in ids:
+        if x and x not in seen:
+            seen.add(x)
+            uniq.append(x)
+    return [uniq[i : i + size] for i in range(0, len(uniq), size)]
+
+
+def merge_results(results: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+    """チャンク順にマージ（同じIDが複数回返っても後勝ちで決定的）"""
+    out: Dict[str, Any] = {}
+    for r in results:
+        out.update(r)
+    return out
+
+
+class BatchExecutor:
+    """
+    チャンク単位の取得関数 fetch(chunk) -> {id: entry} を
+    Semaphore で同時実行数を制限しながら走らせる。
+    リトライは fetch 側（_api_get_json）に任せる。
+    """
+
+    def __init__(self, concurrency: int = DEFAULT_CONCURRENCY, chunk_size: int = DEFAULT_CHUNK_SIZE):
+        self.concurrency = max(1, int(concurrency))
+        self.chunk_size = max(1, int(chunk_size))
+        self._sem = asyncio.Semaphore(self.concurrency)
+
+    async def _guarded(self, fetch: ChunkFetcher, chunk: List[str]) -> Dict[str, Any]:
+        async with self._sem:
+            return await fetch(chunk)
+
+    def submit(self, fetch: ChunkFetcher, chunk: List[str]) -> "asyncio.Task[Dict[str, Any]]":
+        """1チャンクをバックグラウンドで投げる（パイプライン用）"""
+        return asyncio.create_task(self._guarded(fetch, chunk))
+
+    async def run(self, ids: Iterable[str], fetch: ChunkFetcher) -> Dict[str, Any]:
+        """ids をチャンクに分けて並列取得し、チャンク順でマージして返す"""
+        tasks = [self.submit(fetch, c) for c in chunked(ids, self.chunk_size)]
+        try:
+            results = await asyncio.gather(*tasks)
+        except BaseException:
+            cancel_all(tasks)
+            raise
+        return merge_results(results)
+
+
+def cancel_all(tasks: Iterable["asyncio.Task[Any]"]):
+    for t in tasks:
+        if not t.done():
+            t.cancel()
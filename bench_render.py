@@ -0,0 +1,86 @@
+# bench_render.py
+# /scraping の描画コストと転送量を、描画キャッシュ・圧縮・ETag の有無で比べる（API は叩かない）。
+#   python bench_render.py [行数=1000] [回数=20]
+# 合成した検索結果を CACHE に直接入れ、Quart のテストクライアントで同じ URL を繰り返し取る。
+#   before      : 描画キャッシュなし・無圧縮（毎回 Jinja で描画）
+#   miss+gzip   : 1回目（描画＋gzip して登録）
+#   hit+gzip/br : 2回目以降（描画も圧縮もしない）
+#   304         : If-None-Match 付き（本文なし）
+import os
+import sys
+import time
+import asyncio
+import tempfile
+
+# 本番の DATA_DIR（SQLite）を汚さない
+os.environ.setdefault("DATA_DIR", os.path.join(tempfile.gettempdir(), "search_youtube_bench"))
+
+import app as webapp
+import render_cache
+import search_youtube
+
+
+def _rows(n: int):
+    for i in range(n):
+        vid = f"{i:011d}"
+        yield {
+            "publishedAt": f"2024-{1 + i % 12:02d}-{1 + i % 28:02d} 12:00:00",
+            "title": f"ベンチマーク用の動画タイトル {i}",
+            "description": ("概要欄のテキスト。" * 40) + str(i),
+            "viewCount": (i * 7919) % 1000000,
+            "likeCount": i % 5000,
+            "commentCount": i % 300,
+            "videoDuration": f"{i % 60}:{i % 60:02d}",
+            "thumbnails": f"https://i.ytimg.com/vi/{vid}/hqdefault.jpg",
+            "video_url": f"https://www.youtube.com/watch?v={vid}",
+            "name": f"channel {i % 50}",
+            "subscriberCount": (i * 31) % 100000,
+            "channel_icon": [f"https://www.youtube.com/channel/UC{i % 50:022d}", "images/logo.svg"],
+        }
+
+
+async def _run(n_rows: int, iterations: int):
+    word, d_from, d_to = "bench", "2024-01-01", "2024-12-31"
+    key = search_youtube.search_key("", word, d_from, d_to, "date", "search", "1")
+    res = search_youtube.SearchResult(rows=list(_rows(n_rows)), complete=True)
+    res.fetched = len(res.rows)
+    webapp.cache_set(key, res)
+
+    client = webapp.app.test_client()
+
+    async def measure(label: str, url: str, headers=None, before=None):
+        total = 0.0
+        size = status = 0
+        for _ in range(iterations):
+            if before:
+                before()
+            t0 = time.perf_counter()
+            r = await client.get(url, headers=headers or {})
+            body = await r.get_data()
+            total += time.perf_counter() - t0
+            size, status = len(body), r.status_code
+        print(f"  {label:<14} status={status} bytes={size:>9,} avg={total / iterations * 1000:7.2f} ms")
+        return r
+
+    for per_page in (str(n_rows), ""):
+        url = f"/scraping?word={word}&from={d_from}&to={d_to}&video-count={n_rows}&stream=0"
+        if per_page:
+            url += f"&per-page={per_page}"
+        print(f"{n_rows} rows, per-page={per_page or webapp.PAGE_SIZE}")
+
+        render_cache.ENABLED = False
+        await measure("before", url)
+        render_cache.ENABLED = True
+        render_cache.cache.clear()
+        await measure("miss+gzip", url, {"Accept-Encoding": "gzip"}, before=render_cache.cache.clear)
+        r = await measure("hit+gzip", url, {"Accept-Encoding": "gzip"})
+        if render_cache.brotli is not None:
+            await measure("hit+br", url, {"Accept-Encoding": "br, gzip"})
+        await measure("304", url, {"Accept-Encoding": "gzip", "If-None-Match": r.headers.get("ETag", "")})
+    print("render_cache:", render_cache.cache.stats())
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    k = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    asyncio.run(_run(n, k))
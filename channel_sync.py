@@ -0,0 +1,210 @@
+# channel_sync.py
+# ウォッチリスト（WATCH_CHANNELS）のチャンネルを裏で同期し続ける。
+#   - 新着: アップロード再生リストを前回の最新公開日時（high-water mark）まで辿る（1 unit/50件）
+#   - 統計: 保存済み動画の statistics を 50件ずつ定期的に取り直す（1 unit/50件）
+# 取れた動画は metadata_store / video_index に入るので、ウォッチ中チャンネルの検索は
+# search.list を叩かずローカルから返せる（search_youtube.iter_search が watch_store.serves() を見る）。
+# Hypercorn の複数ワーカーで動いても、同期するのは SQLite のリースを取った1プロセスだけ。
+import os
+import time
+import socket
+import asyncio
+import functools
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+
+import api_keys
+import http_client
+import metadata_store
+import search_youtube
+from batch_executor import BatchExecutor
+from watch_store import STALE_SEC, SYNC_INTERVAL_SEC, WATCH_CHANNELS
+from watch_store import db as _db
+
+STATS_INTERVAL_SEC = int(os.environ.get("WATCH_STATS_INTERVAL_SEC") or "3600")  # 統計の取り直し（既定 1時間）
+STATS_MAX_VIDEOS = int(os.environ.get("WATCH_STATS_MAX_VIDEOS") or "1000")  # 統計を取り直すのは新しい順にこの件数まで
+MAX_VIDEOS_PER_SYNC = int(os.environ.get("WATCH_MAX_VIDEOS") or "5000")  # 初回の遡り上限
+BACKFILL_FROM = (os.environ.get("WATCH_BACKFILL_FROM") or "2005-04-01").strip()  # 初回はこの日から
+
+_OWNER = f"{socket.gethostname()}:{os.getpid()}"
+# channel を解決できていない入力の行（エラーを /api/watch に出すため）。channel_id 列にはこれ＋入力を入れておく
+_UNRESOLVED = "?"
+_task: Optional[asyncio.Task] = None
+
+
+def _iso_utc(jst_str: str) -> str:
+    """metadata_store の publishedAt（JST 'YYYY-MM-DD HH:MM:SS'）→ playlistItems と比べられる UTC ISO"""
+    try:
+        dt = datetime.strptime(jst_str, "%Y-%m-%d %H:%M:%S").replace(tzinfo=search_youtube.JST)
+        return dt.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+    except Exception:
+        return ""
+
+
+# ---------------------------
+# 状態（/api/watch）
+# ---------------------------
+def status() -> List[Dict[str, Any]]:
+    cur = _db().execute(
+        "SELECT channel_id, input, high_water, covered_from, synced_at, stats_at, last_error FROM watch_channels ORDER BY input"
+    )
+    now = time.time()
+    return [
+        {
+            "channel_id": "" if cid.startswith(_UNRESOLVED) else cid,
+            "input": inp,
+            "high_water": hw,
+            "covered_from": cf,
+            "synced_ago_sec": round(now - sa) if sa else None,
+            "stats_ago_sec": round(now - st) if st else None,
+            "serving": bool(cf) and now - sa <= STALE_SEC,
+            "last_error": err,
+        }
+        for cid, inp, hw, cf, sa, st, err in cur
+    ]
+
+
+# ---------------------------
+# 同期本体
+# ---------------------------
+def _acquire_lease(ttl: float) -> bool:
+    now = time.time()
+    _db().execute(
+        "INSERT INTO sync_lease (name, owner, expires) VALUES ('watch', ?, ?) "
+        "ON CONFLICT(name) DO UPDATE SET owner=excluded.owner, expires=excluded.expires "
+        "WHERE sync_lease.expires < ? OR sync_lease.owner = excluded.owner",
+        (_OWNER, now + ttl, now),
+    )
+    r = _db().execute("SELECT owner FROM sync_lease WHERE name='watch'").fetchone()
+    return bool(r) and r[0] == _OWNER
+
+
+def _release_lease():
+    _db().execute("DELETE FROM sync_lease WHERE name='watch' AND owner=?", (_OWNER,))
+
+
+async def sync_channel(session, executor: BatchExecutor, channel_input: str) -> Dict[str, Any]:
+    """1チャンネル分: 新着を取り込み、期限が来ていれば統計を取り直す"""
+    channel_id = await search_youtube._resolve_channel_id(session, channel_input)
+    if not channel_id:
+        raise RuntimeError(f"channel を解決できませんでした: {channel_input}")
+
+    conn = _db()
+    conn.execute("DELETE FROM watch_channels WHERE channel_id=?", (_UNRESOLVED + channel_input,))
+    conn.execute("INSERT INTO watch_channels (channel_id, input) VALUES (?, ?) ON CONFLICT(channel_id) DO NOTHING", (channel_id, channel_input))
+    high_water, covered_from, stats_at = conn.execute(
+        "SELECT high_water, covered_from, stats_at FROM watch_channels WHERE channel_id=?", (channel_id,)
+    ).fetchone()
+
+    # 1) 新着（初回は BACKFILL_FROM から MAX_VIDEOS_PER_SYNC 件まで遡る）
+    playlist_id = await search_youtube._uploads_playlist_id(session, executor, channel_id)
+    if not playlist_id:
+        raise RuntimeError("アップロード再生リストが見つかりませんでした")
+    after = high_water or (BACKFILL_FROM + "T00:00:00Z")
+    ids: List[str] = []
+    reached_end = True
+    async for vids, _chs, next_token in search_youtube._iter_upload_pages(
+        session, playlist_id, channel_id, "", after, "9999-12-31T23:59:59Z", MAX_VIDEOS_PER_SYNC
+    ):
+        ids.extend(vids)
+        reached_end = not next_token
+    entries = await search_youtube._enrich_videos(session, executor, ids)
+    await search_youtube._enrich_channels(session, executor, [channel_id])
+
+    published = sorted(p for p in (_iso_utc(e.get("publishedAt") or "") for e in entries.values()) if p)
+    if published:
+        high_water = max(high_water, published[-1])
+    if not covered_from:
+        # 初回: 最後まで辿れたら BACKFILL_FROM から、上限で止まったら取れた一番古い日の翌日から
+        if reached_end or not published:
+            covered_from = BACKFILL_FROM
+        else:
+            covered_from = (date.fromisoformat(published[0][:10]) + timedelta(days=1)).isoformat()
+    now = time.time()
+    conn.execute(
+        "UPDATE watch_channels SET high_water=?, covered_from=?, synced_at=?, last_error='' WHERE channel_id=?",
+        (high_water, covered_from, now, channel_id),
+    )
+
+    # 2) 統計（新しい順に STATS_MAX_VIDEOS 件まで。今回取り込んだ分は取りたてなので対象外）
+    refreshed = 0
+    if now - stats_at >= STATS_INTERVAL_SEC:
+        stale = [x for x in metadata_store.video_ids_for_channel(channel_id, STATS_MAX_VIDEOS) if x not in entries]
+        stats = await executor.run(stale, functools.partial(search_youtube._fetch_video_stats_chunk, session))
+        metadata_store.put_video_stats(stats)
+        ch_stats = await executor.run([channel_id], functools.partial(search_youtube._fetch_channel_stats_chunk, session))
+        metadata_store.put_channel_stats(ch_stats)
+        refreshed = len(stats)
+        conn.execute("UPDATE watch_channels SET stats_at=? WHERE channel_id=?", (time.time(), channel_id))
+
+    return {"channel_id": channel_id, "new": len(entries), "stats_refreshed": refreshed}
+
+
+async def run_once() -> List[Dict[str, Any]]:
+    """ウォッチリスト全体を1周（チャンネルは順番に。1本の失敗で止めない。クォータ切れなら打ち切り）"""
+    session = http_client.get_session()
+    executor = BatchExecutor()
+    out: List[Dict[str, Any]] = []
+    for channel_input in WATCH_CHANNELS:
+        try:
+            out.append(await sync_channel(session, executor, channel_input))
+        except search_youtube.QuotaExceededError as e:
+            _record_error(channel_input, str(e))
+            break
+        except Exception as e:
+            _record_error(channel_input, str(e))
+    return out
+
+
+def _record_error(channel_input: str, err: str):
+    conn = _db()
+    if conn.execute("UPDATE watch_channels SET last_error=? WHERE input=?", (err[:500], channel_input)).rowcount == 0:
+        # 一度も解決できていない（行が無い）チャンネルのエラーも落とさない
+        conn.execute(
+            "INSERT INTO watch_channels (channel_id, input, last_error) VALUES (?, ?, ?) "
+            "ON CONFLICT(channel_id) DO UPDATE SET last_error=excluded.last_error",
+            (_UNRESOLVED + channel_input, channel_input, err[:500]),
+        )
+
+
+async def _loop():
+    while True:
+        try:
+            if _acquire_lease(SYNC_INTERVAL_SEC * 2):
+                await run_once()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # 次の周期でやり直す
+            pass
+        await asyncio.sleep(SYNC_INTERVAL_SEC)
+
+
+async def startup():
+    global _task
+    if WATCH_CHANNELS and api_keys.pool and _task is None:
+        _task = asyncio.create_task(_loop())
+
+
+async def shutdown():
+    global _task
+    if _task is not None:
+        _task.cancel()
+        try:
+            await _task
+        except (asyncio.CancelledError, Exception):
+            pass
+        _task = None
+        _release_lease()
+
+
+if __name__ == "__main__":
+    # 手動で1周: python channel_sync.py
+    async def _main():
+        try:
+            return await run_once()
+        finally:
+            await http_client.shutdown()
+
+    for r in asyncio.run(_main()):
+        print(r)
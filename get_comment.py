@@ -1,74 +1,125 @@
-import requests
-import os
-from dotenv import load_dotenv
+# get_comment.py
+# 動画のコメントをページごとに流す async ジェネレータ（全件をリストに溜めない）。
+#   async with contextlib.aclosing(iter_comments(video_id, replies=True)) as it:
+#       async for row in it:
+#           ...
+# 途中で抜けたら（break して aclose / limit / キャンセル）その先のページ・返信は取りに行かない。
+# 手元に持つのは今のページと先読み中の次の1ページ、走らせている返信チェーン（concurrency 本まで）だけ。
+# 返信の取り方（埋め込みで足りれば comments.list を呼ばない・Semaphore で並列）は get_comment_by_id と同じ。
+#   python get_comment.py VIDEO_ID [件数]
+import sys
+import time
+import asyncio
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Set
 
-def print_video_comment(url,no, video_id, next_page_token):
-      
-  load_dotenv('.env') 
+import http_client
+from batch_executor import cancel_all
+from get_comment_by_id import (
+    REPLY_CONCURRENCY,
+    CrawlStats,
+    _api,
+    _replies_of,
+    _reply_row,
+    _thread_params,
+    _thread_row,
+)
 
-  url = os.environ.get("URL")
-  api_key = os.environ.get("API_KEY")
-  params = {
-    'key': api_key,
-    'part': 'snippet',
-    'videoId': video_id,
-    'order': 'relevance',
-    'textFormat': 'plaintext',
-    'maxResults': 100,
-  }
-  if next_page_token is not None:
-    params['pageToken'] = next_page_token
-  response = requests.get(url + 'commentThreads', params=params)
-  resource = response.json()
-  comments = []
+# make_row(comment, no, reply_count) -> 行。comment は API の comment リソース（id + snippet）
+RowBuilder = Callable[[Dict[str, Any], str, int], Dict[str, Any]]
 
-  for comment_info in resource['items']:
-    # コメント
-    text = comment_info['snippet']['topLevelComment']['snippet']['textDisplay']
-    # # グッド数
-    # like_cnt = comment_info['snippet']['topLevelComment']['snippet']['likeCount']
-    # # 返信数
-    # reply_cnt = comment_info['snippet']['totalReplyCount']
-    # # ユーザー名
-    # user_name = comment_info['snippet']['topLevelComment']['snippet']['authorDisplayName']
-    # # Id
-    # parentId = comment_info['snippet']['topLevelComment']['id']
-    comments.append(text.replace('\r', '\n').replace('\n', ' '))
-    # comments.append(text)
-    # if reply_cnt > 0:
-    #   cno = 1
-    #   print_video_reply(no, cno, video_id, None, parentId)
-    no = no + 1
 
-  if 'nextPageToken' in resource:
-    print_video_comment(no, video_id, resource["nextPageToken"])
-  return comments
+async def iter_comments(
+    video_id: str,
+    replies: bool = False,
+    limit: int = 0,
+    order: str = "relevance",
+    concurrency: int = REPLY_CONCURRENCY,
+    make_row: Optional[RowBuilder] = None,
+    stats: Optional[CrawlStats] = None,
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    スレッド（replies=True なら直後にその返信）を1件ずつ返す。limit>0 ならその件数で止める。
+    行は make_row が無ければ get_comment_by_id と同じ形（no は "3" / "3-1"）。
+    stats を渡すと取得の統計をそこに積む。
+    """
+    stats = stats if stats is not None else CrawlStats(video_id)
+    t0 = time.perf_counter()
+    session = http_client.get_session()
+    sem = asyncio.Semaphore(max(1, concurrency))
+    pending: Set["asyncio.Task[Any]"] = set()
 
-def print_video_reply(no, cno, video_id, next_page_token, id,api_key):
-  params = {
-    'key': api_key,
-    'part': 'snippet',
-    'videoId': video_id,
-    'textFormat': 'plaintext',
-    'maxResults': 50,
-    'parentId': id,
-  }
+    def track(task: "asyncio.Task[Any]") -> "asyncio.Task[Any]":
+        pending.add(task)
+        task.add_done_callback(pending.discard)
+        return task
 
-  if next_page_token is not None:
-    params['pageToken'] = next_page_token
-  url = os.environ.get("URL")
-  response = requests.get(url + 'comments', params=params)
-  resource = response.json()
+    def thread_page(params: Dict[str, Any]) -> "asyncio.Task[Dict[str, Any]]":
+        return track(asyncio.create_task(_api(session, "commentThreads", params, "commentThreads.list", stats)))
 
-  for comment_info in resource['items']:
-    # コメント
-    text = comment_info['snippet']['textDisplay']
-    # グッド数
-    like_cnt = comment_info['snippet']['likeCount']
-    # ユーザー名
-    user_name = comment_info['snippet']['authorDisplayName']
+    params = _thread_params(video_id, order)
+    next_page: Optional["asyncio.Task[Dict[str, Any]]"] = thread_page(params)
+    sent = 0
+    no = 0
+    try:
+        while next_page is not None:
+            resource = await next_page
+            stats.thread_pages += 1
+            items = resource.get("items") or []
+            next_page = None
+            # 次のページは今のページを流している間に取る（limit まで今のページで足りるなら取らない）
+            if resource.get("nextPageToken") and not (limit and sent + len(items) >= limit):
+                params = dict(params, pageToken=resource["nextPageToken"])
+                next_page = thread_page(params)
 
-    cno = cno + 1
+            # 返信チェーンは今のスレッドから concurrency 本先までだけ走らせておく（止めたときの無駄を抑える）
+            reps_ahead: List[Any] = []
+            for i, comment_info in enumerate(items):
+                while replies and len(reps_ahead) < min(len(items), i + 1 + concurrency):
+                    reps = _replies_of(session, items[len(reps_ahead)], sem, stats)
+                    if isinstance(reps, asyncio.Task):
+                        track(reps)
+                    reps_ahead.append(reps)
+                no += 1
+                stats.threads += 1
+                top = comment_info["snippet"]["topLevelComment"]
+                if make_row is None:
+                    row = _thread_row(comment_info)
+                    row["no"] = str(no)
+                else:
+                    row = make_row(top, str(no), comment_info["snippet"]["totalReplyCount"])
+                yield row
+                sent += 1
+                if limit and sent >= limit:
+                    return
+                if not replies:
+                    continue
+                reps = reps_ahead[i]
+                reps_ahead[i] = None
+                reply_items: List[Dict[str, Any]] = (await reps) if isinstance(reps, asyncio.Task) else reps
+                for cno, reply in enumerate(reply_items, start=1):
+                    stats.replies += 1
+                    if make_row is None:
+                        yield _reply_row(reply, f"{no}-{cno}", top["id"])
+                    else:
+                        yield make_row(reply, f"{no}-{cno}", 0)
+                    sent += 1
+                    if limit and sent >= limit:
+                        return
+    finally:
+        # 途中で止めたら先読みのページ・返信チェーンは捨てる
+        cancel_all(pending)
+        stats.elapsed_sec = time.perf_counter() - t0
 
-  if 'nextPageToken' in resource:
-    print_video_reply(no, cno, video_id, resource["nextPageToken"], id,api_key)
+
+if __name__ == "__main__":
+
+    async def _main(video_id: str, limit: int):
+        stats = CrawlStats(video_id)
+        try:
+            async for row in iter_comments(video_id, replies=True, limit=limit, stats=stats):
+                print(row["no"], row["comment"].replace("\n", " ")[:80])
+        finally:
+            await http_client.shutdown()
+        print(stats.as_dict())
+
+    asyncio.run(_main(sys.argv[1], int(sys.argv[2]) if len(sys.argv) > 2 else 0))
@@ -1,109 +1,195 @@
-import aiohttp
-import asyncio
+# get_comment_by_id.py
+# 動画1本のコメントを返信まで全部取る。
+#   - commentThreads は pageToken で順に辿るしかないので1本の流れで進める（part=snippet,replies）
+#   - 返信が totalReplyCount 件ぶん埋め込まれて返ってきたスレッドは comments.list を呼ばない
+#   - 足りないスレッドの返信だけ comments.list で辿る。スレッドのページ取得と並走させ、同時数は Semaphore で絞る
+# 行の形・並び（スレッド → その返信、no は "3" / "3-1"）は従来どおり。
+# 呼び出しは search_youtube._api_get_json（キーのプール・クォータ計上・レート制御・リトライ）を通す。
+#   python get_comment_by_id.py VIDEO_ID
 import os
-from dotenv import load_dotenv
-import common
-import datetime
-
-async def fetch(session, url, params):
-    async with session.get(url, params=params) as response:
-        return await response.json()
-
-async def get_comment_by_id(video_id):
-    print(datetime.datetime.now())
-    load_dotenv('.env')
-    url = os.environ.get("URL") + 'commentThreads'
-    api_key = os.environ.get("API_KEY")
+import sys
+import time
+import asyncio
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, List, Tuple, Union
+
+import http_client
+import search_youtube
+from batch_executor import cancel_all
+
+# 返信チェーンを同時に辿るスレッド数（外向きの総量は rate_limit の "api" 側でも絞られる）
+REPLY_CONCURRENCY = max(1, int(os.environ.get("COMMENT_REPLY_CONCURRENCY") or "8"))
+
+
+@dataclass
+class CrawlStats:
+    video_id: str
+    threads: int = 0
+    replies: int = 0
+    thread_pages: int = 0  # commentThreads.list の回数
+    reply_calls: int = 0  # comments.list の回数
+    embedded_threads: int = 0  # 埋め込みの返信で足りて comments.list を呼ばなかったスレッド
+    quota_units: int = 0  # この取得で使った推定ユニット
+    elapsed_sec: float = 0.0
+
+    @property
+    def comments(self) -> int:
+        return self.threads + self.replies
+
+    @property
+    def comments_per_sec(self) -> float:
+        return self.comments / self.elapsed_sec if self.elapsed_sec > 0 else 0.0
+
+    def as_dict(self) -> Dict[str, Any]:
+        return dict(
+            asdict(self),
+            comments=self.comments,
+            elapsed_sec=round(self.elapsed_sec, 3),
+            comments_per_sec=round(self.comments_per_sec, 1),
+        )
+
+
+def _thread_row(comment_info: Dict[str, Any]) -> Dict[str, Any]:
+    snippet = comment_info["snippet"]["topLevelComment"]["snippet"]
+    return {
+        "no": "",
+        "publishedAt": search_youtube._iso_to_jst_str(snippet["publishedAt"]),
+        "comment": snippet["textDisplay"],
+        "like_cnt": snippet["likeCount"],
+        "reply_cnt": comment_info["snippet"]["totalReplyCount"],
+        "user_name": snippet["authorDisplayName"],
+        "user_img": snippet["authorProfileImageUrl"],
+        "user_url": snippet.get("authorChannelUrl", ""),
+        "parentId": comment_info["snippet"]["topLevelComment"]["id"],
+    }
+
+
+def _reply_row(comment_info: Dict[str, Any], no: str, parent_id: str) -> Dict[str, Any]:
+    snippet = comment_info["snippet"]
+    return {
+        "no": no,
+        "publishedAt": search_youtube._iso_to_jst_str(snippet["publishedAt"]),
+        "comment": snippet["textDisplay"].replace("\r", "\n").replace("\n", " "),
+        "like_cnt": snippet["likeCount"],
+        "reply_cnt": 0,
+        "user_name": snippet["authorDisplayName"],
+        "user_img": snippet["authorProfileImageUrl"],
+        "user_url": snippet.get("authorChannelUrl", ""),
+        "parentId": parent_id,
+    }
+
+
+async def _api(session, endpoint: str, params: Dict[str, Any], quota_method: str, stats: CrawlStats) -> Dict[str, Any]:
+    # ユニットは _api_get_json_once が実際に投げた分だけ stats に積む（相乗りは 0、リトライ・キー切り替えは回数分）
+    token = search_youtube.quota_meter.set(stats)
+    try:
+        return await search_youtube._api_get_json(session, endpoint, params, quota_method)
+    finally:
+        search_youtube.quota_meter.reset(token)
+
+
+def _thread_params(video_id: str, order: str = "relevance") -> Dict[str, Any]:
+    return {
+        "part": "snippet,replies",
+        "videoId": video_id,
+        "order": order,
+        "textFormat": "plainText",
+        "maxResults": 100,
+        "key": search_youtube.API_KEY,
+    }
+
+
+async def _fetch_replies(session, parent_id: str, sem: asyncio.Semaphore, stats: CrawlStats) -> List[Dict[str, Any]]:
+    """1スレッドの返信を comments.list で最後まで辿る（sem の枠を取ってから）"""
+    items: List[Dict[str, Any]] = []
     params = {
-        'key': api_key,
-        'part': 'snippet',
-        'videoId': video_id,
-        'order': 'relevance',
-        'textFormat': 'plaintext',
-        'maxResults': 100,
+        "part": "snippet",
+        "parentId": parent_id,
+        "textFormat": "plainText",
+        "maxResults": 100,
+        "key": search_youtube.API_KEY,
     }
+    async with sem:
+        while True:
+            resource = await _api(session, "comments", params, "comments.list", stats)
+            stats.reply_calls += 1
+            items.extend(resource.get("items") or [])
+            if not resource.get("nextPageToken"):
+                return items
+            params["pageToken"] = resource["nextPageToken"]
+
 
-    comments = []
-    no = 1
-    next_page_token = None
+def _replies_of(
+    session, comment_info: Dict[str, Any], sem: asyncio.Semaphore, stats: CrawlStats
+) -> Union[List[Dict[str, Any]], "asyncio.Task[List[Dict[str, Any]]]"]:
+    """
+    スレッドの返信: 無ければ []、埋め込みで全部そろっていればそのリスト、
+    足りなければ comments.list を辿るタスク（作った時点で走り出す）
+    """
+    total = comment_info["snippet"]["totalReplyCount"]
+    embedded = (comment_info.get("replies") or {}).get("comments") or []
+    if total <= 0:
+        return []
+    if len(embedded) >= total:
+        stats.embedded_threads += 1
+        return embedded
+    return asyncio.create_task(_fetch_replies(session, comment_info["snippet"]["topLevelComment"]["id"], sem, stats))
 
-    async with aiohttp.ClientSession() as session:
+
+async def crawl(video_id: str, concurrency: int = REPLY_CONCURRENCY) -> Tuple[List[Dict[str, Any]], CrawlStats]:
+    """コメント全件（スレッド＋返信）と取得の統計を返す"""
+    t0 = time.perf_counter()
+    stats = CrawlStats(video_id)
+    session = http_client.get_session()
+    sem = asyncio.Semaphore(max(1, concurrency))
+
+    # (スレッドの行, 返信: 埋め込みのリスト or comments.list を辿っているタスク)
+    threads: List[Tuple[Dict[str, Any], Union[List[Dict[str, Any]], "asyncio.Task[List[Dict[str, Any]]]"]]] = []
+    tasks: List["asyncio.Task[List[Dict[str, Any]]]"] = []
+    params = _thread_params(video_id)
+    try:
         while True:
-            if next_page_token:
-                params['pageToken'] = next_page_token
-            resource = await fetch(session, url, params)
-
-            for comment_info in resource['items']:
-                publishedAt = comment_info['snippet']['topLevelComment']['snippet']['publishedAt']
-                text = comment_info['snippet']['topLevelComment']['snippet']['textDisplay']
-                like_cnt = comment_info['snippet']['topLevelComment']['snippet']['likeCount']
-                reply_cnt = comment_info['snippet']['totalReplyCount']
-                user_name = comment_info['snippet']['topLevelComment']['snippet']['authorDisplayName']
-                user_img = comment_info['snippet']['topLevelComment']['snippet']['authorProfileImageUrl']
-                user_url = comment_info['snippet']['topLevelComment']['snippet']['authorChannelUrl']
-                parentId = comment_info['snippet']['topLevelComment']['id']
-                comments.append({
-                    'no': str(no),
-                    'publishedAt': common.change_time(publishedAt),
-                    'comment': text,
-                    'like_cnt': like_cnt,
-                    'reply_cnt': reply_cnt,
-                    'user_name': user_name,
-                    'user_img': user_img,
-                    'user_url': user_url,
-                    'parentId': parentId,
-                })
-
-                if reply_cnt > 0:
-                    cno = 0
-                    await print_video_reply(no, cno, video_id, None, parentId, api_key, comments, session)
-                no += 1
-
-            if 'nextPageToken' in resource:
-                next_page_token = resource['nextPageToken']
-            else:
+            resource = await _api(session, "commentThreads", params, "commentThreads.list", stats)
+            stats.thread_pages += 1
+            for comment_info in resource.get("items") or []:
+                replies = _replies_of(session, comment_info, sem, stats)
+                if isinstance(replies, asyncio.Task):
+                    tasks.append(replies)
+                threads.append((_thread_row(comment_info), replies))
+            if not resource.get("nextPageToken"):
                 break
+            params["pageToken"] = resource["nextPageToken"]
+        if tasks:
+            await asyncio.gather(*tasks)
+    except BaseException:
+        cancel_all(tasks)
+        raise
+
+    comments: List[Dict[str, Any]] = []
+    for no, (row, replies) in enumerate(threads, start=1):
+        row["no"] = str(no)
+        comments.append(row)
+        items = replies.result() if isinstance(replies, asyncio.Task) else replies
+        for cno, comment_info in enumerate(items, start=1):
+            comments.append(_reply_row(comment_info, f"{no}-{cno}", row["parentId"]))
+        stats.replies += len(items)
+    stats.threads = len(threads)
+    stats.elapsed_sec = time.perf_counter() - t0
+    return comments, stats
+
 
+async def get_comment_by_id(video_id: str) -> List[Dict[str, Any]]:
+    comments, _stats = await crawl(video_id)
     return comments
 
-async def print_video_reply(no, cno, video_id, next_page_token, parentId, api_key, comments, session):
-    url = os.environ.get("URL") + 'comments'
-    while True:
-        params = {
-            'key': api_key,
-            'part': 'snippet',
-            'videoId': video_id,
-            'textFormat': 'plaintext',
-            'maxResults': 50,
-            'parentId': parentId,
-        }
-
-        if next_page_token:
-            params['pageToken'] = next_page_token
-        resource = await fetch(session, url, params)
-
-        for comment_info in resource['items']:
-            publishedAt = comment_info['snippet']['publishedAt']
-            text = comment_info['snippet']['textDisplay']
-            like_cnt = comment_info['snippet']['likeCount']
-            user_name = comment_info['snippet']['authorDisplayName']
-            user_img = comment_info['snippet']['authorProfileImageUrl']
-            user_url = comment_info['snippet']['authorChannelUrl']
-
-            cno += 1
-            comments.append({
-                'no': str(no) + '-' + str(cno),
-                'publishedAt': common.change_time(publishedAt),
-                'comment': text.replace('\r', '\n').replace('\n', ' '),
-                'like_cnt': like_cnt,
-                'reply_cnt': 0,
-                'user_name': user_name,
-                'user_img': user_img,
-                'user_url': user_url,
-                'parentId': parentId,
-            })
-
-        if 'nextPageToken' in resource:
-            next_page_token = resource["nextPageToken"]
-        else:
-            break
+
+if __name__ == "__main__":
+
+    async def _main(video_id: str):
+        try:
+            return await crawl(video_id)
+        finally:
+            await http_client.shutdown()
+
+    _comments, _crawl_stats = asyncio.run(_main(sys.argv[1]))
+    print(_crawl_stats.as_dict())
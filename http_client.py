@@ -0,0 +1,54 @@
+# http_client.py
+# アプリ全体で使い回す aiohttp.ClientSession（コネクションプール）。
+# googleapis.com / i.ytimg.com へのTCP+TLSハンドシェイクやDNS解決を毎回やらないようにする。
+import os
+import asyncio
+from typing import Optional
+
+import aiohttp
+
+POOL_LIMIT = int(os.environ.get("HTTP_POOL_LIMIT") or "100")  # 全体の同時接続数
+POOL_LIMIT_PER_HOST = int(os.environ.get("HTTP_POOL_LIMIT_PER_HOST") or "20")  # ホストごと
+KEEPALIVE_SEC = float(os.environ.get("HTTP_KEEPALIVE_SEC") or "60")
+DNS_TTL_SEC = int(os.environ.get("HTTP_DNS_TTL_SEC") or "300")
+TIMEOUT_SEC = float(os.environ.get("HTTP_TIMEOUT_SEC") or "30")
+
+_session: Optional[aiohttp.ClientSession] = None
+_session_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+def _new_session() -> aiohttp.ClientSession:
+    connector = aiohttp.TCPConnector(
+        limit=POOL_LIMIT,
+        limit_per_host=POOL_LIMIT_PER_HOST,
+        keepalive_timeout=KEEPALIVE_SEC,
+        use_dns_cache=True,
+        ttl_dns_cache=DNS_TTL_SEC,
+    )
+    return aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=TIMEOUT_SEC))
+
+
+def get_session() -> aiohttp.ClientSession:
+    """
+    共有セッションを返す。
+    Quart の起動フック前（スクリプトから直接呼んだ場合など）は遅延生成する。
+    イベントループが変わっていたら（asyncio.run を複数回など）作り直す。
+    """
+    global _session, _session_loop
+    loop = asyncio.get_running_loop()
+    if _session is None or _session.closed or _session_loop is not loop:
+        _session = _new_session()
+        _session_loop = loop
+    return _session
+
+
+async def startup():
+    get_session()
+
+
+async def shutdown():
+    global _session, _session_loop
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session = None
+    _session_loop = None
@@ -0,0 +1,41 @@
+# local_db.py
+# ローカル永続ストア用の SQLite 接続ヘルパー。
+# WAL モードなので Hypercorn の複数ワーカー（別プロセス）から同じファイルを安全に共有できる。
+import os
+import sqlite3
+import threading
+
+DATA_DIR = os.environ.get("DATA_DIR") or os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+DB_PATH = os.environ.get("LOCAL_DB_PATH") or os.path.join(DATA_DIR, "youtube_search.sqlite3")
+
+_local = threading.local()
+
+
+def connect() -> sqlite3.Connection:
+    """スレッド（＋プロセス）ごとに1本の接続を使い回す。autocommit。"""
+    conn = getattr(_local, "conn", None)
+    if conn is not None and getattr(_local, "pid", None) == os.getpid():
+        return conn
+
+    os.makedirs(os.path.dirname(DB_PATH) or ".", exist_ok=True)
+    conn = sqlite3.connect(DB_PATH, timeout=10, isolation_level=None, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA busy_timeout=10000")
+    _local.conn = conn
+    _local.pid = os.getpid()
+    _local.schemas = set()
+    return conn
+
+
+def ensure_schema(name: str, ddl: str) -> sqlite3.Connection:
+    """name ごとに1回だけ DDL（CREATE ... IF NOT EXISTS）を流してから接続を返す"""
+    conn = connect()
+    if name not in _local.schemas:
+        conn.executescript(ddl)
+        _local.schemas.add(name)
+    return conn
+
+
+def placeholders(n: int) -> str:
+    return ",".join("?" * n)
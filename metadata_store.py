@@ -0,0 +1,244 @@
+# metadata_store.py
+# videos.list / channels.list の結果をローカル（SQLite）に持っておき、
+# 変わりにくい項目（タイトル・概要・動画時間・アイコン等）は長め、
+# 変わりやすい項目（再生数・高評価・登録者数等）は短めの TTL で使い回す。
+import os
+import json
+import time
+from typing import Any, Dict, Iterable, List, Tuple
+
+import local_db
+
+ENABLED = (os.environ.get("META_STORE") or "1").strip() != "0"
+STATIC_TTL_SEC = int(os.environ.get("META_STATIC_TTL_SEC") or str(3 * 24 * 3600))  # 既定 3日
+STATS_TTL_SEC = int(os.environ.get("META_STATS_TTL_SEC") or "3600")  # 既定 1時間
+HANDLE_TTL_SEC = int(os.environ.get("HANDLE_TTL_SEC") or str(30 * 24 * 3600))  # @handle → UC 解決（既定 30日）
+HANDLE_NEG_TTL_SEC = int(os.environ.get("HANDLE_NEG_TTL_SEC") or str(24 * 3600))  # 解決できなかった入力（既定 1日）
+
+VIDEO_STATIC_FIELDS = ("publishedAt", "title", "description", "thumbnails", "channelId", "channelTitle", "videoDuration")
+VIDEO_STATS_FIELDS = ("viewCount", "likeCount", "commentCount")
+CHANNEL_STATIC_FIELDS = ("channel_icon", "uploads")
+CHANNEL_STATS_FIELDS = ("subscriberCount",)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS videos (
+    id TEXT PRIMARY KEY,
+    channel_id TEXT NOT NULL DEFAULT '',
+    published_at TEXT NOT NULL DEFAULT '',
+    static_json TEXT,
+    static_at REAL NOT NULL DEFAULT 0,
+    stats_json TEXT,
+    stats_at REAL NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS videos_channel ON videos (channel_id, published_at);
+CREATE TABLE IF NOT EXISTS channels (
+    id TEXT PRIMARY KEY,
+    static_json TEXT,
+    static_at REAL NOT NULL DEFAULT 0,
+    stats_json TEXT,
+    stats_at REAL NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS channel_handles (
+    handle TEXT PRIMARY KEY,
+    channel_id TEXT NOT NULL DEFAULT '',
+    resolved_at REAL NOT NULL DEFAULT 0
+);
+"""
+
+_SQL_CHUNK = 500  # SQLite の変数上限に当たらない程度
+
+
+def _db():
+    return local_db.ensure_schema("metadata_store", _SCHEMA)
+
+
+def _pick(entry: Dict[str, Any], fields: Tuple[str, ...]) -> Dict[str, Any]:
+    return {k: entry[k] for k in fields if k in entry}
+
+
+def _lookup(table: str, ids: Iterable[str]) -> Tuple[Dict[str, Dict[str, Any]], List[str], Dict[str, Dict[str, Any]]]:
+    """
+    return (fresh, need_full, need_stats)
+      fresh      : 両方とも TTL 内 → そのまま使える {id: entry}
+      need_full  : 未取得 or 静的項目が古い → 全 part で取り直す
+      need_stats : 静的項目は新しいが統計が古い → statistics だけ取り直す {id: 静的項目}
+    """
+    ids = [x for x in dict.fromkeys(ids) if x]
+    if not ENABLED or not ids:
+        return {}, ids, {}
+
+    now = time.time()
+    rows: Dict[str, Tuple[Any, ...]] = {}
+    conn = _db()
+    for i in range(0, len(ids), _SQL_CHUNK):
+        chunk = ids[i : i + _SQL_CHUNK]
+        cur = conn.execute(
+            f"SELECT id, static_json, static_at, stats_json, stats_at FROM {table} WHERE id IN ({local_db.placeholders(len(chunk))})",
+            chunk,
+        )
+        for r in cur:
+            rows[r[0]] = r
+
+    fresh: Dict[str, Dict[str, Any]] = {}
+    need_full: List[str] = []
+    need_stats: Dict[str, Dict[str, Any]] = {}
+    for x in ids:
+        r = rows.get(x)
+        if not r or not r[1] or now - r[2] > STATIC_TTL_SEC:
+            need_full.append(x)
+        elif not r[3] or now - r[4] > STATS_TTL_SEC:
+            need_stats[x] = json.loads(r[1])
+        else:
+            entry = json.loads(r[1])
+            entry.update(json.loads(r[3]))
+            fresh[x] = entry
+    return fresh, need_full, need_stats
+
+
+def lookup_videos(ids: Iterable[str]):
+    return _lookup("videos", ids)
+
+
+def lookup_channels(ids: Iterable[str]):
+    return _lookup("channels", ids)
+
+
+def _get(table: str, ids: Iterable[str], defaults: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    """TTL を見ずに保存済みの entry（静的項目＋統計）を返す。統計が無ければ defaults"""
+    ids = [x for x in dict.fromkeys(ids) if x]
+    out: Dict[str, Dict[str, Any]] = {}
+    if not ENABLED or not ids:
+        return out
+    conn = _db()
+    for i in range(0, len(ids), _SQL_CHUNK):
+        chunk = ids[i : i + _SQL_CHUNK]
+        cur = conn.execute(
+            f"SELECT id, static_json, stats_json FROM {table} WHERE id IN ({local_db.placeholders(len(chunk))}) AND static_json IS NOT NULL",
+            chunk,
+        )
+        for x, static_json, stats_json in cur:
+            entry = dict(defaults)
+            entry.update(json.loads(static_json))
+            if stats_json:
+                entry.update(json.loads(stats_json))
+            out[x] = entry
+    return out
+
+
+def get_videos(ids: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+    """API を使わない検索（source=index 等）用。古くても手元の値を返す"""
+    return _get("videos", ids, {"viewCount": 0, "likeCount": 0, "commentCount": 0})
+
+
+def get_channels(ids: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+    return _get("channels", ids, {"subscriberCount": 0})
+
+
+def video_ids_for_channel(channel_id: str, limit: int = 1000) -> List[str]:
+    """保存済みの動画ID（新しい順）"""
+    if not ENABLED or not channel_id:
+        return []
+    cur = _db().execute(
+        "SELECT id FROM videos WHERE channel_id=? ORDER BY published_at DESC LIMIT ?", (channel_id, int(limit))
+    )
+    return [r[0] for r in cur]
+
+
+def put_videos(entries: Dict[str, Dict[str, Any]]):
+    """videos.list(snippet,statistics,contentDetails) を正規化した entry をまとめて保存"""
+    if not ENABLED or not entries:
+        return
+    now = time.time()
+    _db().executemany(
+        "INSERT INTO videos (id, channel_id, published_at, static_json, static_at, stats_json, stats_at) VALUES (?,?,?,?,?,?,?) "
+        "ON CONFLICT(id) DO UPDATE SET channel_id=excluded.channel_id, published_at=excluded.published_at, "
+        "static_json=excluded.static_json, static_at=excluded.static_at, stats_json=excluded.stats_json, stats_at=excluded.stats_at",
+        [
+            (
+                vid,
+                e.get("channelId") or "",
+                e.get("publishedAt") or "",
+                json.dumps(_pick(e, VIDEO_STATIC_FIELDS), ensure_ascii=False),
+                now,
+                json.dumps(_pick(e, VIDEO_STATS_FIELDS)),
+                now,
+            )
+            for vid, e in entries.items()
+            if vid
+        ],
+    )
+
+
+def put_channels(entries: Dict[str, Dict[str, Any]]):
+    if not ENABLED or not entries:
+        return
+    now = time.time()
+    _db().executemany(
+        "INSERT INTO channels (id, static_json, static_at, stats_json, stats_at) VALUES (?,?,?,?,?) "
+        "ON CONFLICT(id) DO UPDATE SET static_json=excluded.static_json, static_at=excluded.static_at, "
+        "stats_json=excluded.stats_json, stats_at=excluded.stats_at",
+        [
+            (
+                cid,
+                json.dumps(_pick(e, CHANNEL_STATIC_FIELDS), ensure_ascii=False),
+                now,
+                json.dumps(_pick(e, CHANNEL_STATS_FIELDS)),
+                now,
+            )
+            for cid, e in entries.items()
+            if cid
+        ],
+    )
+
+
+def _put_stats(table: str, fields: Tuple[str, ...], stats: Dict[str, Dict[str, Any]]):
+    if not ENABLED or not stats:
+        return
+    now = time.time()
+    _db().executemany(
+        f"UPDATE {table} SET stats_json=?, stats_at=? WHERE id=?",
+        [(json.dumps(_pick(st, fields)), now, x) for x, st in stats.items() if x],
+    )
+
+
+def put_video_stats(stats: Dict[str, Dict[str, Any]]):
+    """statistics だけ取り直した分を保存（静的項目はそのまま）"""
+    _put_stats("videos", VIDEO_STATS_FIELDS, stats)
+
+
+def put_channel_stats(stats: Dict[str, Dict[str, Any]]):
+    _put_stats("channels", CHANNEL_STATS_FIELDS, stats)
+
+
+
+# ---------------------------
+# @handle → UC... 解決キャッシュ（channel_id='' は「解決できなかった」ネガティブキャッシュ）
+# ---------------------------
+def _handle_key(handle: str) -> str:
+    # handle は大文字小文字を区別しない
+    return (handle or "").strip().lstrip("@").lower()
+
+
+def get_handle(handle: str) -> Tuple[bool, str]:
+    """return (hit, channel_id)  hit=True かつ channel_id='' はネガティブキャッシュ"""
+    key = _handle_key(handle)
+    if not ENABLED or not key:
+        return False, ""
+    r = _db().execute("SELECT channel_id, resolved_at FROM channel_handles WHERE handle=?", (key,)).fetchone()
+    if not r:
+        return False, ""
+    ttl = HANDLE_TTL_SEC if r[0] else HANDLE_NEG_TTL_SEC
+    if time.time() - r[1] > ttl:
+        return False, ""
+    return True, r[0]
+
+
+def put_handle(handle: str, channel_id: str):
+    key = _handle_key(handle)
+    if not ENABLED or not key:
+        return
+    _db().execute(
+        "INSERT INTO channel_handles (handle, channel_id, resolved_at) VALUES (?,?,?) "
+        "ON CONFLICT(handle) DO UPDATE SET channel_id=excluded.channel_id, resolved_at=excluded.resolved_at",
+        (key, channel_id or "", time.time()),
+    )
@@ -1,23 +1,60 @@
 # quota_tracker.py
+# YouTube Data API のクォータ使用量（推定）を一元管理する台帳。
+# 全ての外向き API 呼び出しがここに add() し、SQLite（WAL）に書くので
+# Hypercorn の複数ワーカーからも同じ数字が見える。日付は PT（米国太平洋時間）で切り替わる。
+# イベントループ上の add() はメモリに溜めるだけで、書き込みは FLUSH_SEC ごとに1トランザクション（スレッドで）。
+# ループの外（スクリプト・スレッド）の add() はその場で書く。
+# このプロセスの読み出しは未書き込み分も足して返す。他のワーカーからは最大 FLUSH_SEC 遅れて見える。
 import os
-from dataclasses import dataclass
+import time
+import atexit
+import asyncio
+import logging
+import threading
+from dataclasses import dataclass, field
 from datetime import datetime, timedelta
 from zoneinfo import ZoneInfo
 
+import local_db
+
 LA = ZoneInfo("America/Los_Angeles")  # PT (PST/PDT を自動吸収)
 JST = ZoneInfo("Asia/Tokyo")
 
-DEFAULT_LIMIT = int(os.environ.get("QUOTA_LIMIT", "10000"))  # 既定 10,000/日
+DEFAULT_LIMIT = int(os.environ.get("QUOTA_LIMIT") or os.environ.get("YT_QUOTA_LIMIT") or "10000")  # 既定 10,000/日
+KEEP_DAYS = 14  # これより古い日の行は消す
+FLUSH_SEC = float(os.environ.get("QUOTA_FLUSH_SEC") or "1.0")  # add() を台帳に書き出す間隔
+
+log = logging.getLogger(__name__)
 
 # 代表的なコスト（必要に応じて増やしてOK）
 COST = {
     "search.list": 100,           # 超高い
     "videos.list": 1,
     "channels.list": 1,
+    "playlistItems.list": 1,
     "commentThreads.list": 1,
     "comments.list": 1,
 }
 
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS quota_usage (
+    day_pt TEXT NOT NULL,
+    method TEXT NOT NULL,
+    units INTEGER NOT NULL DEFAULT 0,
+    calls INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (day_pt, method)
+);
+CREATE TABLE IF NOT EXISTS quota_usage_keys (
+    day_pt TEXT NOT NULL,
+    key_id TEXT NOT NULL,
+    units INTEGER NOT NULL DEFAULT 0,
+    calls INTEGER NOT NULL DEFAULT 0,
+    exhausted INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (day_pt, key_id)
+);
+"""
+
+
 @dataclass
 class QuotaSnapshot:
     limit: int
@@ -25,43 +62,231 @@ class QuotaSnapshot:
     remaining_est: int
     next_reset_pt: str
     next_reset_jst: str
+    by_method: dict = field(default_factory=dict)
+    by_key: dict = field(default_factory=dict)
+    # add() 1回あたりのコスト（このプロセスでの実測）
+    add_avg_us: float = 0.0
+    add_max_us: float = 0.0
+
 
 class QuotaTracker:
     def __init__(self, limit: int = DEFAULT_LIMIT):
-        self.limit = limit
-        self.used = 0
-        self._day_pt = self._today_pt()
+        self.limit = limit  # APIキー1本あたり
+        self.key_count = 1  # api_keys.ApiKeyPool が本数をセットする
+        self._day_pt = ""
+        # 未書き込みの分: {(day_pt, method): [units, calls]} / {(day_pt, key_id): [units, calls]}
+        self._lock = threading.Lock()
+        self._pending: dict = {}
+        self._pending_keys: dict = {}
+        self._flush_armed = False
+        self._flush_future: "asyncio.Future | None" = None
+        self._add_calls = 0
+        self._add_ns_total = 0
+        self._add_ns_max = 0
 
-    def _today_pt(self):
-        return datetime.now(LA).date()
+    def _db(self):
+        return local_db.ensure_schema("quota_tracker", _SCHEMA)
 
-    def _rollover_if_needed(self):
-        today = self._today_pt()
+    def _today_pt(self) -> str:
+        return datetime.now(LA).date().isoformat()
+
+    def _rollover_if_needed(self, today: str):
+        # 日付が変わったら古い行を掃除（当日分はキーが変わるだけなので勝手に 0 から）
         if today != self._day_pt:
             self._day_pt = today
-            self.used = 0
+            cutoff = (datetime.now(LA).date() - timedelta(days=KEEP_DAYS)).isoformat()
+            self._db().execute("DELETE FROM quota_usage WHERE day_pt < ?", (cutoff,))
+            self._db().execute("DELETE FROM quota_usage_keys WHERE day_pt < ?", (cutoff,))
 
-    def add(self, method: str, times: int = 1):
-        self._rollover_if_needed()
+    def add(self, method: str, times: int = 1, key_id: str = ""):
+        t0 = time.perf_counter_ns()
+        today = self._today_pt()
+        n = max(1, int(times))
         cost = COST.get(method, 1)
-        self.used += cost * max(1, int(times))
+        with self._lock:
+            v = self._pending.setdefault((today, method), [0, 0])
+            v[0] += cost * n
+            v[1] += n
+            if key_id:
+                v = self._pending_keys.setdefault((today, key_id), [0, 0])
+                v[0] += cost * n
+                v[1] += n
+            arm = not self._flush_armed
+            self._flush_armed = True
+        if arm:
+            self._arm_flush()
+        dt = time.perf_counter_ns() - t0
+        self._add_calls += 1
+        self._add_ns_total += dt
+        self._add_ns_max = max(self._add_ns_max, dt)
+
+    def _arm_flush(self):
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # ループの外（スクリプト・スレッド）: 後で書いてくれるものが無いのでここで書く
+            self.flush()
+            return
+        loop.call_later(FLUSH_SEC, self._flush_in_executor, loop)
+
+    def _flush_in_executor(self, loop: asyncio.AbstractEventLoop):
+        self._flush_future = loop.run_in_executor(None, self.flush)
+        self._flush_future.add_done_callback(self._flush_done)
+
+    def _flush_done(self, fut: "asyncio.Future"):
+        if fut.cancelled():
+            # 走らずに終わった（ループ終了など）: 溜まった分は次の add() / 終了時の flush() で書く
+            with self._lock:
+                self._flush_armed = False
+            return
+        exc = fut.exception()
+        if exc is not None:
+            # 書けなかった分は flush() が未書き込みに戻している。次の add() でまた予約される
+            log.error("quota ledger flush failed", exc_info=exc)
+
+    def flush(self):
+        """溜まった add() を1トランザクションで台帳に書く"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            pending_keys, self._pending_keys = self._pending_keys, {}
+            self._flush_armed = False
+        if not pending and not pending_keys:
+            return
+        try:
+            self._write(pending, pending_keys)
+        except BaseException:
+            # 書けなかった分は次の flush に回す（古い行の掃除や接続で失敗しても捨てない）
+            with self._lock:
+                for src, dst in ((pending, self._pending), (pending_keys, self._pending_keys)):
+                    for k, (u, c) in src.items():
+                        v = dst.setdefault(k, [0, 0])
+                        v[0] += u
+                        v[1] += c
+            raise
+
+    def _write(self, pending: dict, pending_keys: dict):
+        self._rollover_if_needed(self._today_pt())
+        conn = self._db()
+        # 読んでから書く遅延トランザクションは他スレッドの書き込みと競ると busy_timeout を待たずに locked になる
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(
+                "INSERT INTO quota_usage (day_pt, method, units, calls) VALUES (?,?,?,?) "
+                "ON CONFLICT(day_pt, method) DO UPDATE SET units=units+excluded.units, calls=calls+excluded.calls",
+                [(d, m, u, c) for (d, m), (u, c) in pending.items()],
+            )
+            conn.executemany(
+                "INSERT INTO quota_usage_keys (day_pt, key_id, units, calls) VALUES (?,?,?,?) "
+                "ON CONFLICT(day_pt, key_id) DO UPDATE SET units=units+excluded.units, calls=calls+excluded.calls",
+                [(d, k, u, c) for (d, k), (u, c) in pending_keys.items()],
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _pending_today(self, pending: dict) -> dict:
+        today = self._today_pt()
+        with self._lock:
+            return {k: tuple(v) for (d, k), v in pending.items() if d == today}
+
+    def by_method(self) -> dict:
+        cur = self._db().execute("SELECT method, units, calls FROM quota_usage WHERE day_pt=?", (self._today_pt(),))
+        out = {m: {"units": u, "calls": c} for m, u, c in cur}
+        for m, (u, c) in self._pending_today(self._pending).items():
+            v = out.setdefault(m, {"units": 0, "calls": 0})
+            v["units"] += u
+            v["calls"] += c
+        return dict(sorted(out.items(), key=lambda kv: -kv[1]["units"]))
+
+    def by_key(self) -> dict:
+        """{key_id: {"units", "calls", "exhausted"}}  当日（PT）分のみ＝日付が変われば exhausted も自動で解除"""
+        cur = self._db().execute("SELECT key_id, units, calls, exhausted FROM quota_usage_keys WHERE day_pt=?", (self._today_pt(),))
+        out = {k: {"units": u, "calls": c, "exhausted": bool(x)} for k, u, c, x in cur}
+        for k, (u, c) in self._pending_today(self._pending_keys).items():
+            v = out.setdefault(k, {"units": 0, "calls": 0, "exhausted": False})
+            v["units"] += u
+            v["calls"] += c
+        return out
+
+    def mark_exhausted(self, key_id: str):
+        """quotaExceeded を返したキーを PT の日付が変わるまで使わない（全ワーカー共有）"""
+        self._db().execute(
+            "INSERT INTO quota_usage_keys (day_pt, key_id, exhausted) VALUES (?,?,1) "
+            "ON CONFLICT(day_pt, key_id) DO UPDATE SET exhausted=1",
+            (self._today_pt(), key_id),
+        )
+
+    @property
+    def total_limit(self) -> int:
+        return self.limit * max(1, self.key_count)
+
+    @property
+    def used(self) -> int:
+        r = self._db().execute("SELECT COALESCE(SUM(units), 0) FROM quota_usage WHERE day_pt=?", (self._today_pt(),)).fetchone()
+        return int(r[0]) + sum(u for u, _c in self._pending_today(self._pending).values())
 
     def snapshot(self) -> QuotaSnapshot:
-        self._rollover_if_needed()
+        by_method = self.by_method()
+        used = sum(v["units"] for v in by_method.values())
 
         now_pt = datetime.now(LA)
         next_midnight_pt = (now_pt + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
 
         next_midnight_jst = next_midnight_pt.astimezone(JST)
 
-        remaining = max(0, self.limit - self.used)
+        remaining = max(0, self.total_limit - used)
 
         return QuotaSnapshot(
-            limit=self.limit,
-            used_est=self.used,
+            limit=self.total_limit,
+            used_est=used,
             remaining_est=remaining,
             next_reset_pt=next_midnight_pt.strftime("%Y-%m-%d %H:%M:%S PT"),
             next_reset_jst=next_midnight_jst.strftime("%Y-%m-%d %H:%M:%S JST"),
+            by_method=by_method,
+            by_key=self.by_key(),
+            add_avg_us=round(self._add_ns_total / self._add_calls / 1000, 1) if self._add_calls else 0.0,
+            add_max_us=round(self._add_ns_max / 1000, 1),
         )
 
+    def snapshot_dict(self) -> dict:
+        q = self.snapshot()
+        return {
+            "limit": q.limit,
+            "used_est": q.used_est,
+            "remaining_est": q.remaining_est,
+            "next_reset_pt": q.next_reset_pt,
+            "next_reset_jst": q.next_reset_jst,
+            "by_method": q.by_method,
+            "by_key": q.by_key,
+            "add_avg_us": q.add_avg_us,
+            "add_max_us": q.add_max_us,
+            # 画面（index.html / comment.html）用の別名
+            "estimate_used": q.used_est,
+            "estimate_remaining": q.remaining_est,
+            "reset_at_jst": q.next_reset_jst,
+        }
+
 quota = QuotaTracker()
+atexit.register(quota.flush)
+
+
+if __name__ == "__main__":
+    # add() のホットパスのコスト計測: python quota_tracker.py [回数]
+    import sys
+
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    t = QuotaTracker()
+
+    async def bench() -> float:
+        # サーバーと同じくループ上で（ループの外の add() は毎回書くので）
+        t0 = time.perf_counter()
+        for i in range(n):
+            t.add("_bench")
+        return time.perf_counter() - t0
+
+    dt = asyncio.run(bench())
+    t.flush()
+    s = t.snapshot()
+    t._db().execute("DELETE FROM quota_usage WHERE method='_bench'")  # 計測分は台帳に残さない
+    print(f"{n} adds: {dt * 1e6 / n:.1f} us/add (avg {s.add_avg_us} us, max {s.add_max_us} us) db={local_db.DB_PATH}")
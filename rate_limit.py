@@ -0,0 +1,195 @@
+# rate_limit.py
+# 外向きHTTPのプロセス全体のレート制御。ホスト種別ごとに
+#   - トークンバケット（秒間リクエスト数＋バースト）
+#   - 同時実行数
+#   - 共有バックオフ（429/5xx を見たら全呼び出し元がまとめて待つ。Retry-After 優先、無ければジッタ付き指数）
+# を持つ。個々のコルーチンがバラバラにリトライして嵐になるのを防ぐ。
+import os
+import time
+import random
+import asyncio
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional
+from urllib.parse import urlparse
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.environ.get(name) or default)
+    except ValueError:
+        return default
+
+
+BACKOFF_BASE_SEC = _env_float("RL_BACKOFF_BASE_SEC", 0.5)
+BACKOFF_MAX_SEC = _env_float("RL_BACKOFF_MAX_SEC", 8.0)
+RETRY_AFTER_MAX_SEC = _env_float("RL_RETRY_AFTER_MAX_SEC", 60.0)  # 異常に長い Retry-After はここで頭打ち
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Retry-After（秒数 or HTTP-date）→ 待つ秒数。読めなければ None"""
+    v = (value or "").strip()
+    if not v:
+        return None
+    try:
+        return max(0.0, float(v))
+    except ValueError:
+        pass
+    try:
+        dt = parsedate_to_datetime(v)
+        if dt.tzinfo is None:
+            dt = dt.replace(tzinfo=timezone.utc)
+        return max(0.0, (dt - datetime.now(timezone.utc)).total_seconds())
+    except Exception:
+        return None
+
+
+class HostLimiter:
+    def __init__(self, name: str, rps: float, burst: float, concurrency: int):
+        self.name = name
+        self.rps = max(0.001, rps)
+        self.burst = max(1.0, burst)
+        self.concurrency = max(1, concurrency)
+        self._tokens = self.burst
+        self._refilled = time.monotonic()
+        self._pause_until = 0.0
+        self._failures = 0
+        self._sem: Optional[asyncio.Semaphore] = None
+        self._sem_loop: Optional[asyncio.AbstractEventLoop] = None
+        # metrics
+        self.acquired = 0
+        self.waiting = 0
+        self.in_flight = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.throttled = 0
+        self.retry_after_honored = 0
+
+    def _semaphore(self) -> asyncio.Semaphore:
+        # asyncio.run を複数回呼ぶスクリプトでもループごとに作り直す（http_client と同じ考え方）
+        loop = asyncio.get_running_loop()
+        if self._sem is None or self._sem_loop is not loop:
+            self._sem = asyncio.Semaphore(self.concurrency)
+            self._sem_loop = loop
+        return self._sem
+
+    def _refill(self, now: float):
+        self._tokens = min(self.burst, self._tokens + (now - self._refilled) * self.rps)
+        self._refilled = now
+
+    async def _take_token(self):
+        while True:
+            now = time.monotonic()
+            if now < self._pause_until:
+                await asyncio.sleep(self._pause_until - now)
+                continue
+            self._refill(now)
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+            await asyncio.sleep((1 - self._tokens) / self.rps)
+
+    @asynccontextmanager
+    async def slot(self):
+        """トークン＋同時実行枠を取ってから中身を実行する"""
+        t0 = time.monotonic()
+        self.waiting += 1
+        sem = self._semaphore()
+        try:
+            await sem.acquire()
+            try:
+                await self._take_token()
+            except BaseException:
+                sem.release()
+                raise
+        finally:
+            self.waiting -= 1
+        waited = time.monotonic() - t0
+        self.acquired += 1
+        self.wait_total += waited
+        self.wait_max = max(self.wait_max, waited)
+        self.in_flight += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            sem.release()
+
+    def backoff(self, retry_after: Optional[str] = None) -> float:
+        """
+        429/5xx を受けたときに呼ぶ。ホスト全体の再開時刻を後ろへずらし、待つ秒数を返す。
+        呼び出し元はそのまま slot() を取り直せば、他の呼び出し元と一緒に待たされる。
+        """
+        self.throttled += 1
+        self._failures += 1
+        delay = parse_retry_after(retry_after)
+        if delay is not None:
+            self.retry_after_honored += 1
+            delay = min(delay, RETRY_AFTER_MAX_SEC)
+        else:
+            # full jitter: [0.5, 1.0) * min(max, base * 2^n)
+            cap = min(BACKOFF_MAX_SEC, BACKOFF_BASE_SEC * (2 ** (self._failures - 1)))
+            delay = cap * (0.5 + random.random() / 2)
+        self._pause_until = max(self._pause_until, time.monotonic() + delay)
+        # 再開直後にバーストで叩き直さないようトークンも空にしておく
+        self._tokens = min(self._tokens, 0.0)
+        return delay
+
+    def ok(self):
+        # 成功したら失敗カウントを戻す（次の 429 はまた短い待ちから）
+        if self._failures:
+            self._failures = 0
+
+    def stats(self) -> Dict[str, float]:
+        now = time.monotonic()
+        return {
+            "rps": self.rps,
+            "burst": self.burst,
+            "concurrency": self.concurrency,
+            "acquired": self.acquired,
+            "waiting": self.waiting,
+            "in_flight": self.in_flight,
+            "wait_avg_ms": round(self.wait_total / self.acquired * 1000, 2) if self.acquired else 0.0,
+            "wait_max_ms": round(self.wait_max * 1000, 2),
+            "throttled": self.throttled,
+            "retry_after_honored": self.retry_after_honored,
+            "paused_for_sec": round(max(0.0, self._pause_until - now), 3),
+        }
+
+
+def _limiter_from_env(name: str, rps: float, burst: float, concurrency: int) -> HostLimiter:
+    p = "RL_" + name.upper() + "_"
+    return HostLimiter(
+        name,
+        rps=_env_float(p + "RPS", rps),
+        burst=_env_float(p + "BURST", burst),
+        concurrency=int(_env_float(p + "CONCURRENCY", concurrency)),
+    )
+
+
+# ホスト種別: api = googleapis.com / thumb = サムネ・アイコン画像 / feed = YouTube RSS
+LIMITERS: Dict[str, HostLimiter] = {
+    "api": _limiter_from_env("api", rps=20, burst=40, concurrency=16),
+    "thumb": _limiter_from_env("thumb", rps=50, burst=100, concurrency=32),
+    "feed": _limiter_from_env("feed", rps=10, burst=20, concurrency=8),
+}
+
+_THUMB_HOSTS = ("ytimg.com", "ggpht.com", "googleusercontent.com")
+
+
+def host_class(url: str) -> str:
+    host = (urlparse(url).hostname or "").lower()
+    if host.endswith("googleapis.com"):
+        return "api"
+    if host.endswith(_THUMB_HOSTS):
+        return "thumb"
+    return "feed"
+
+
+def limiter(name_or_url: str) -> HostLimiter:
+    return LIMITERS.get(name_or_url) or LIMITERS[host_class(name_or_url)]
+
+
+def stats() -> Dict[str, Dict[str, float]]:
+    return {name: lim.stats() for name, lim in LIMITERS.items()}
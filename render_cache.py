@@ -0,0 +1,228 @@
+# render_cache.py
+# 描画済みレスポンス（/scraping のページ・結果の断片・/comment）のキャッシュと、圧縮・ETag・304。
+#   - キーは呼び出し側で作る（検索キャッシュのキー＋データの版＋表示パラメータ）。同じキーなら Jinja を通さない
+#   - 本文は1回だけ描画し、gzip / br は要求されたときに1回だけ作って一緒に持つ
+#   - ETag は本文の sha256（強い検証子）。圧縮した表現は別のバイト列なので "-gz" / "-br" を付けて区別する
+#   - If-None-Match が今返す表現の ETag と（強い比較で）合えば 304（本文なし）
+#   - 圧縮した表現もキャッシュの容量に数える（あとから作った分も含めて LRU で追い出す）
+# brotli は入っていれば使う（pip install brotli）。無ければ gzip だけ。
+import os
+import gzip
+import time
+import zlib
+import hashlib
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Dict, Hashable, Optional, Tuple, Union
+
+try:
+    import brotli
+except ImportError:  # 任意
+    brotli = None
+
+ENABLED = (os.environ.get("RENDER_CACHE") or "1").strip() != "0"
+MAX_BYTES = int(os.environ.get("RENDER_CACHE_MAX_BYTES") or str(64 * 1024 * 1024))
+MIN_COMPRESS_BYTES = 1024  # これより小さい本文は圧縮しない
+GZIP_LEVEL = 6
+BR_QUALITY = 5  # 11 は遅すぎる。5 で gzip -6 より小さく速い
+
+_SUFFIX = {"br": "-br", "gzip": "-gz"}
+
+
+def _encodings() -> Tuple[str, ...]:
+    return ("br", "gzip") if brotli is not None else ("gzip",)
+
+
+def negotiate(accept_encoding: str) -> str:
+    """Accept-Encoding から使う圧縮を選ぶ（br > gzip）。どれも受け付けなければ ''"""
+    accepted: Dict[str, float] = {}
+    for part in (accept_encoding or "").split(","):
+        name, _, params = part.strip().partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[name] = q
+    for enc in _encodings():
+        q = accepted.get(enc, accepted.get("*", 0.0))
+        if q > 0:
+            return enc
+    return ""
+
+
+def encode(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=BR_QUALITY)
+    if encoding == "gzip":
+        # mtime=0: 同じ本文なら同じバイト列（強い ETag を表現ごとに固定できる）
+        return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+    return body
+
+
+def etag_of(body: bytes) -> str:
+    return hashlib.sha256(body).hexdigest()[:32]
+
+
+def _matches(if_none_match: str, etag: str) -> bool:
+    # 強い比較: 返す表現（圧縮ごとに別）の ETag そのものだけ。W/ 付きは一致としない（弱い ETag は出さない）
+    v = (if_none_match or "").strip()
+    if not v:
+        return False
+    if v == "*":
+        return True
+    return f'"{etag}"' in {t.strip() for t in v.split(",")}
+
+
+@dataclass
+class Rendered:
+    body: bytes
+    mimetype: str
+    etag: str  # 本文（無圧縮）の ETag（引用符なし）
+    expires: float = 0.0
+    headers: Dict[str, str] = field(default_factory=dict)  # 本文と一緒に返すヘッダ（ページ情報など）
+    variants: Dict[str, bytes] = field(default_factory=dict)  # encoding -> 圧縮済み本文
+    owner: Optional["RenderCache"] = field(default=None, repr=False, compare=False)  # 登録先（容量の数え直し用）
+
+    @classmethod
+    def of(
+        cls, body: Union[str, bytes], mimetype: str = "text/html", ttl: float = 0.0, headers: Optional[Dict[str, str]] = None
+    ) -> "Rendered":
+        b = body.encode("utf-8") if isinstance(body, str) else body
+        return cls(b, mimetype, etag_of(b), time.time() + ttl, dict(headers or {}))
+
+    def size(self) -> int:
+        return len(self.body) + sum(len(v) for v in self.variants.values())
+
+    def encoded(self, encoding: str) -> bytes:
+        if not encoding or len(self.body) < MIN_COMPRESS_BYTES:
+            return self.body
+        v = self.variants.get(encoding)
+        if v is None:
+            v = encode(self.body, encoding)
+            self.variants[encoding] = v
+            if self.owner is not None:
+                self.owner._evict()
+        return v
+
+    def respond(self, accept_encoding: str, if_none_match: str) -> Tuple[int, Dict[str, str], bytes]:
+        """return (status, headers, body)。304 なら body は空"""
+        enc = negotiate(accept_encoding) if len(self.body) >= MIN_COMPRESS_BYTES else ""
+        etag = self.etag + _SUFFIX.get(enc, "")
+        headers = dict(self.headers, ETag=f'"{etag}"', Vary="Accept-Encoding")
+        if _matches(if_none_match, etag):
+            _stats["not_modified"] += 1
+            return 304, headers, b""
+        body = self.encoded(enc)
+        if enc:
+            headers["Content-Encoding"] = enc
+        _stats["bytes_raw"] += len(self.body)
+        _stats["bytes_sent"] += len(body)
+        return 200, headers, body
+
+
+# ---------------------------
+# stats
+# ---------------------------
+_stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0, "not_modified": 0, "bytes_raw": 0, "bytes_sent": 0}
+
+
+# ---------------------------
+# cache (memory, LRU + TTL)
+# ---------------------------
+class RenderCache:
+    def __init__(self, max_bytes: int = MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._items: "OrderedDict[Hashable, Rendered]" = OrderedDict()
+
+    def get(self, key: Optional[Hashable]) -> Optional[Rendered]:
+        if not ENABLED or key is None:
+            return None
+        r = self._items.get(key)
+        if r is None or r.expires <= time.time():
+            if r is not None:
+                self._items.pop(key, None)
+            _stats["misses"] += 1
+            return None
+        self._items.move_to_end(key)
+        _stats["hits"] += 1
+        return r
+
+    def put(
+        self,
+        key: Optional[Hashable],
+        body: Union[str, bytes],
+        mimetype: str,
+        ttl: float,
+        headers: Optional[Dict[str, str]] = None,
+    ) -> Rendered:
+        """描画結果を登録して返す（キャッシュ無効・key=None なら登録せずに返す）"""
+        r = Rendered.of(body, mimetype, ttl, headers)
+        if not ENABLED or key is None or ttl <= 0:
+            return r
+        r.owner = self
+        self._items[key] = r
+        self._items.move_to_end(key)
+        _stats["stores"] += 1
+        self._evict()
+        return r
+
+    def _evict(self):
+        # 圧縮した分はあとから増えるので、登録・圧縮のたびに全体を数え直す（件数は多くない）
+        now = time.time()
+        for k in [k for k, r in self._items.items() if r.expires <= now]:
+            self._items.pop(k, None)
+        total = sum(r.size() for r in self._items.values())
+        while total > self.max_bytes and self._items:
+            _k, r = self._items.popitem(last=False)
+            total -= r.size()
+            _stats["evictions"] += 1
+
+    def clear(self):
+        self._items.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return dict(
+            _stats,
+            entries=len(self._items),
+            bytes=sum(r.size() for r in self._items.values()),
+            max_bytes=self.max_bytes,
+            encodings=list(_encodings()),
+            enabled=ENABLED,
+        )
+
+
+cache = RenderCache()
+
+
+# ---------------------------
+# streaming (NDJSON)
+# ---------------------------
+async def compress_stream(chunks: AsyncIterator[Union[str, bytes]], encoding: str) -> AsyncIterator[bytes]:
+    """
+    逐次レスポンスを圧縮しながら流す。チャンクごとに flush するので、受け手は行単位で読み進められる。
+    encoding='' ならそのまま（bytes にして）流す。
+    """
+    if encoding == "br":
+        comp = brotli.Compressor(quality=BR_QUALITY)
+        async for c in chunks:
+            out = comp.process(c.encode("utf-8") if isinstance(c, str) else c) + comp.flush()
+            if out:
+                yield out
+        yield comp.finish()
+        return
+    if encoding == "gzip":
+        comp = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)  # wbits=31: gzip ヘッダ付き
+        async for c in chunks:
+            out = comp.compress(c.encode("utf-8") if isinstance(c, str) else c) + comp.flush(zlib.Z_SYNC_FLUSH)
+            if out:
+                yield out
+        yield comp.flush()
+        return
+    async for c in chunks:
+        yield c.encode("utf-8") if isinstance(c, str) else c
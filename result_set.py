@@ -0,0 +1,310 @@
+# result_set.py
+# 検索結果の行を列ごとに持つ入れ物（SearchResult.rows の中身・CACHE に載る形）。
+#   - 再生数・高評価・コメント・登録者・長さ（秒）・公開日時・search.list の順位・ショートかどうかは NumPy の型付き配列
+#   - タイトル等の文字列は列ごとの list（行ごとの dict を持たない＝キー文字列を行数ぶん抱えない）
+# フィルタ・並べ替え・上位k件は配列演算で行い、dict の行は描画/出力する分だけ作る（to_dicts / iter）。
+# 1件ずつ append する経路（ページごとの組み立て）は Python の list に溜めておき、配列演算の直前にまとめて配列へ移す。
+from datetime import datetime, timedelta, timezone
+from operator import itemgetter
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence
+
+import numpy as np
+
+JST = timezone(timedelta(hours=9))
+
+# 行 dict のキー（search_youtube._build_row と同じ並び）
+ROW_KEYS = (
+    "publishedAt",
+    "title",
+    "description",
+    "viewCount",
+    "likeCount",
+    "commentCount",
+    "videoDuration",
+    "thumbnails",
+    "video_url",
+    "name",
+    "subscriberCount",
+    "channel_icon",
+)
+
+# 数値列（行 dict のキーと同名のものはそのまま値になる）
+_NUM_COLS: Dict[str, Any] = {
+    "viewCount": np.int64,
+    "likeCount": np.int64,
+    "commentCount": np.int64,
+    "subscriberCount": np.int64,
+    "durationSec": np.int32,  # -1 = 長さ不明（videoDuration が ""）
+    "publishedTs": np.int64,  # UNIX 秒。publishedAt が読めなければ 0
+    "rank": np.int64,  # search.list の何件目か（SearchResult.take の件数判定用）
+    "isShorts": np.bool_,
+}
+_OBJ_COLS = ("publishedAt", "title", "description", "thumbnails", "video_url", "name", "channel_icon")
+_ROW_NUM = ("viewCount", "likeCount", "commentCount", "subscriberCount")
+_ROW_KEY_SET = frozenset(ROW_KEYS)
+
+# 並べ替えに使える列
+SORT_KEYS = ("viewCount", "likeCount", "commentCount", "subscriberCount", "durationSec", "publishedTs", "rank")
+
+
+def _int(x: Any) -> int:
+    try:
+        return int(x or 0)
+    except (TypeError, ValueError):
+        try:
+            return int(float(x))
+        except (TypeError, ValueError):
+            return 0
+
+
+def _duration_to_sec(s: str) -> int:
+    """'1:02:03' / '3:02' → 秒。'' は -1"""
+    if not s:
+        return -1
+    sec = 0
+    try:
+        for part in s.split(":"):
+            sec = sec * 60 + int(part)
+    except ValueError:
+        return -1
+    return sec
+
+
+def _sec_to_duration(sec: int) -> str:
+    # search_youtube._duration_iso8601_to_hms と同じ表記に戻す
+    if sec < 0:
+        return ""
+    h, rest = divmod(sec, 3600)
+    m, s = divmod(rest, 60)
+    if h > 0:
+        return f"{h}:{m:02d}:{s:02d}"
+    return f"{m}:{s:02d}"
+
+
+def _published_ts(s: str) -> int:
+    # publishedAt は JST の 'YYYY-MM-DD HH:MM:SS'（_iso_to_jst_str）
+    try:
+        return int(datetime.strptime(s, "%Y-%m-%d %H:%M:%S").replace(tzinfo=JST).timestamp())
+    except (TypeError, ValueError):
+        return 0
+
+
+def _is_shorts(row: Dict[str, Any]) -> bool:
+    # app._row_is_shorts と同じ判定
+    return "/shorts/" in (row.get("video_url") or "") or row.get("isShorts") is True
+
+
+class ResultSet:
+    __slots__ = ("_num", "_pending", "_obj", "_extra", "_duration_str")
+
+    def __init__(self):
+        self._num: Dict[str, np.ndarray] = {k: np.empty(0, dtype=t) for k, t in _NUM_COLS.items()}
+        self._pending: Dict[str, list] = {k: [] for k in _NUM_COLS}
+        self._obj: Dict[str, list] = {k: [] for k in _OBJ_COLS}
+        # 固定キー以外（"mode": "rss" 等）を持つ行だけ: {行番号: {key: value}}
+        self._extra: Dict[int, Dict[str, Any]] = {}
+        # 秒に直せなかった videoDuration（形式違い）: {行番号: 元の文字列}
+        self._duration_str: Dict[int, str] = {}
+
+    # ---------------------------
+    # build
+    # ---------------------------
+    @classmethod
+    def from_rows(cls, rows: Iterable[Dict[str, Any]], ranks: Optional[Iterable[int]] = None) -> "ResultSet":
+        rs = cls()
+        if ranks is None:
+            for i, row in enumerate(rows):
+                rs.append(row, i)
+        else:
+            for row, rank in zip(rows, ranks):
+                rs.append(row, rank)
+        return rs
+
+    def append(self, row: Dict[str, Any], rank: Optional[int] = None):
+        i = len(self)
+        p = self._pending
+        for k in _ROW_NUM:
+            p[k].append(_int(row.get(k)))
+        dur = row.get("videoDuration") or ""
+        sec = _duration_to_sec(dur)
+        if sec < 0 and dur:
+            self._duration_str[i] = dur
+        p["durationSec"].append(sec)
+        p["publishedTs"].append(_published_ts(row.get("publishedAt") or ""))
+        p["rank"].append(i if rank is None else rank)
+        p["isShorts"].append(_is_shorts(row))
+        for k in _OBJ_COLS:
+            self._obj[k].append(row.get(k, ""))
+        extra = {k: v for k, v in row.items() if k not in _ROW_KEY_SET}
+        if extra:
+            self._extra[i] = extra
+
+    def extend(self, other: "ResultSet", rank_offset: int = 0):
+        """other の行を後ろに足す（rank は rank_offset だけずらす）"""
+        if other is self:
+            other = other.copy()
+        base = len(self)
+        self._flush()
+        other._flush()
+        for k in _NUM_COLS:
+            col = other._num[k]
+            if k == "rank" and rank_offset:
+                col = col + rank_offset
+            self._num[k] = np.concatenate([self._num[k], col])
+        for k in _OBJ_COLS:
+            self._obj[k].extend(other._obj[k])
+        self._extra.update({base + i: e for i, e in other._extra.items()})
+        self._duration_str.update({base + i: d for i, d in other._duration_str.items()})
+
+    def copy(self) -> "ResultSet":
+        return self.subset(np.arange(len(self)))
+
+    def _flush(self):
+        if not self._pending["rank"]:
+            return
+        for k, t in _NUM_COLS.items():
+            self._num[k] = np.concatenate([self._num[k], np.asarray(self._pending[k], dtype=t)])
+            self._pending[k] = []
+
+    # ---------------------------
+    # read
+    # ---------------------------
+    def __len__(self) -> int:
+        return len(self._obj["video_url"])
+
+    def __bool__(self) -> bool:
+        return len(self) > 0
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        # テンプレート（{% for row in rows %}）等からは dict の行として1件ずつ見える
+        for i in range(len(self)):
+            yield self.row(i)
+
+    def column(self, name: str) -> np.ndarray:
+        self._flush()
+        return self._num[name]
+
+    def ranks(self) -> np.ndarray:
+        return self.column("rank")
+
+    def row(self, i: int, keys: Optional[Sequence[str]] = None) -> Dict[str, Any]:
+        self._flush()
+        out: Dict[str, Any] = {}
+        for k in keys or ROW_KEYS:
+            if k in _OBJ_COLS:
+                out[k] = self._obj[k][i]
+            elif k in _ROW_NUM:
+                out[k] = int(self._num[k][i])
+            elif k == "videoDuration":
+                out[k] = self._duration_str.get(i) or _sec_to_duration(int(self._num["durationSec"][i]))
+            elif keys and i in self._extra and k in self._extra[i]:
+                out[k] = self._extra[i][k]
+        if not keys and i in self._extra:
+            out.update(self._extra[i])
+        return out
+
+    def to_dicts(self, idx: Optional[Iterable[int]] = None, keys: Optional[Sequence[str]] = None) -> List[Dict[str, Any]]:
+        """idx の行だけ dict にする（idx 省略で全行）。keys を渡すとそのキーだけ作る"""
+        rng = range(len(self)) if idx is None else idx
+        return [self.row(int(i), keys) for i in rng]
+
+    def subset(self, idx: Iterable[int], rerank: bool = False) -> "ResultSet":
+        """
+        idx の行だけの ResultSet（文字列は参照を共有するのでコピーは軽い）。
+        rerank=True なら rank を新しい並び順（0..n-1）に振り直す（並べ替えた結果をそのまま件数で切りたいとき）。
+        """
+        self._flush()
+        idx = np.asarray(idx, dtype=np.intp)
+        rs = ResultSet()
+        for k in _NUM_COLS:
+            rs._num[k] = self._num[k][idx]
+        if rerank:
+            rs._num["rank"] = np.arange(len(idx), dtype=np.int64)
+        pos = idx.tolist()
+        pick = itemgetter(*pos) if len(pos) > 1 else None
+        for k in _OBJ_COLS:
+            col = self._obj[k]
+            rs._obj[k] = list(pick(col)) if pick else [col[i] for i in pos]
+        if self._extra or self._duration_str:
+            for j, i in enumerate(pos):
+                if i in self._extra:
+                    rs._extra[j] = self._extra[i]
+                if i in self._duration_str:
+                    rs._duration_str[j] = self._duration_str[i]
+        return rs
+
+    # ---------------------------
+    # vectorized filter / sort / top-k
+    # ---------------------------
+    def mask(
+        self,
+        viewcount_min: int = 0,
+        viewcount_max: int = -1,
+        subscribercount_min: int = 0,
+        subscribercount_max: int = -1,
+        max_rank: Optional[int] = None,
+        kind: str = "",
+    ) -> np.ndarray:
+        """
+        条件に合う行の bool 配列。max が負なら上限なし（search_youtube.filter_rows と同じ約束）。
+        max_rank: rank < max_rank の行だけ / kind: normal=ショート以外 shorts=ショートだけ
+        """
+        self._flush()
+        vc = self._num["viewCount"]
+        sc = self._num["subscriberCount"]
+        m = np.ones(len(self), dtype=np.bool_)
+        if viewcount_min > 0:
+            m &= vc >= viewcount_min
+        if viewcount_max >= 0:
+            m &= vc <= viewcount_max
+        if subscribercount_min > 0:
+            m &= sc >= subscribercount_min
+        if subscribercount_max >= 0:
+            m &= sc <= subscribercount_max
+        if max_rank is not None:
+            m &= self._num["rank"] < max_rank
+        if kind == "normal":
+            m &= ~self._num["isShorts"]
+        elif kind == "shorts":
+            m &= self._num["isShorts"]
+        return m
+
+    def filter(self, **kwargs) -> "ResultSet":
+        """mask(**kwargs) に合う行だけの ResultSet（並び順はそのまま）。全行合っても別の ResultSet を返す"""
+        # CACHE に載っている本体を呼び出し側に渡さない（足したり並べ替えたりされても困らないように）
+        return self.subset(np.flatnonzero(self.mask(**kwargs)))
+
+    def argsort(self, by: str, descending: bool = True, idx: Optional[np.ndarray] = None) -> np.ndarray:
+        """by 列で並べた行番号（安定ソート＝同じ値は元の順のまま）。idx を渡すとその行だけを並べる"""
+        col = self.column(by)
+        if idx is None:
+            idx = np.arange(len(self))
+        vals = col[idx].astype(np.int64)
+        order = np.argsort(-vals if descending else vals, kind="stable")
+        return idx[order]
+
+    def top_k(self, by: str, k: int, descending: bool = True, idx: Optional[np.ndarray] = None) -> np.ndarray:
+        """by 列の上位 k 件の行番号（並べた状態で）。全体を並べずに argpartition で候補を絞ってから並べる"""
+        col = self.column(by)
+        if idx is None:
+            idx = np.arange(len(self))
+        if k <= 0:
+            return idx[:0]
+        if k >= len(idx):
+            return self.argsort(by, descending, idx)
+        vals = col[idx].astype(np.int64)
+        keyed = -vals if descending else vals
+        # 境界の同点を取りこぼさないよう、k 番目の値以下（降順なら以上）を全部候補にしてから安定ソート
+        kth = np.partition(keyed, k - 1)[k - 1]
+        cand = np.flatnonzero(keyed <= kth)
+        cand = cand[np.argsort(keyed[cand], kind="stable")][:k]
+        return idx[cand]
+
+    def sorted(self, by: str, descending: bool = True) -> "ResultSet":
+        """by 列で並べ直した ResultSet（rank も並べた順に振り直す）"""
+        return self.subset(self.argsort(by, descending), rerank=True)
+
+    def nbytes(self) -> int:
+        """数値列の配列サイズ（文字列は含まない）"""
+        self._flush()
+        return int(sum(a.nbytes for a in self._num.values()))
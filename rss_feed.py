@@ -0,0 +1,248 @@
+# rss_feed.py
+# YouTube チャンネル RSS（feeds/videos.xml）の取得・キャッシュ。
+# クォータ切れ時の唯一の経路なので、何百チャンネルでも回るように
+#   - チャンネルごとに解析済みエントリを持つ（キーワード/期間違いの検索はメモリ上で絞るだけ）
+#   - 期限が切れたら ETag / Last-Modified で条件付き GET（304 なら本文なし）
+#   - 受信しながら XMLPullParser で逐次パース（本文を丸ごと文字列にしない）
+#   - fetch_many で複数チャンネルを並行取得（複数クエリ検索がクォータ切れしたときのフォールバック）
+# 解析済みエントリは SQLite（local_db）にも置くので、別ワーカーや再起動後も条件付き GET から始められる。
+import os
+import json
+import time
+import asyncio
+import urllib.parse
+import xml.etree.ElementTree as ET
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import aiohttp
+
+import local_db
+import rate_limit
+from http_client import get_session
+from singleflight import SingleFlight
+
+FEED_URL = "https://www.youtube.com/feeds/videos.xml?channel_id="
+FRESH_SEC = int(os.environ.get("RSS_FRESH_SEC") or "300")  # この間は再検証もしない
+CONCURRENCY = int(os.environ.get("RSS_CONCURRENCY") or "16")  # fetch_many の同時取得数
+TIMEOUT_SEC = float(os.environ.get("RSS_TIMEOUT_SEC") or "25")
+_CHUNK = 16 * 1024
+
+_ATOM = "{http://www.w3.org/2005/Atom}"
+_YT = "{http://www.youtube.com/xml/schemas/2015}"
+_MEDIA = "{http://search.yahoo.com/mrss/}"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS rss_feeds (
+    channel_id TEXT PRIMARY KEY,
+    etag TEXT NOT NULL DEFAULT '',
+    last_modified TEXT NOT NULL DEFAULT '',
+    entries_json TEXT NOT NULL DEFAULT '[]',
+    fetched_at REAL NOT NULL DEFAULT 0
+);
+"""
+
+
+@dataclass
+class Feed:
+    channel_id: str
+    entries: List[dict] = field(default_factory=list)
+    etag: str = ""
+    last_modified: str = ""
+    fetched_at: float = 0.0
+
+
+# ---------------------------
+# stats
+# ---------------------------
+_stats = {"memory_hits": 0, "db_hits": 0, "fetched": 0, "not_modified": 0, "stale_served": 0, "errors": 0}
+
+
+def stats() -> Dict[str, int]:
+    return dict(_stats, cached_channels=len(_feeds))
+
+
+# ---------------------------
+# cache (memory + SQLite)
+# ---------------------------
+_feeds: Dict[str, Feed] = {}
+_flight = SingleFlight()
+
+
+def _db():
+    return local_db.ensure_schema("rss_feed", _SCHEMA)
+
+
+def _load(channel_id: str) -> Optional[Feed]:
+    """メモリの分より SQLite の分（他ワーカーが取り直した分）が新しければそちらを使う"""
+    feed = _feeds.get(channel_id)
+    r = _db().execute(
+        "SELECT etag, last_modified, entries_json, fetched_at FROM rss_feeds WHERE channel_id=?", (channel_id,)
+    ).fetchone()
+    if not r or (feed is not None and feed.fetched_at >= r[3]):
+        return feed
+    feed = Feed(channel_id, json.loads(r[2]), r[0], r[1], r[3])
+    _feeds[channel_id] = feed
+    return feed
+
+
+def _save(feed: Feed, entries_changed: bool = True):
+    _feeds[feed.channel_id] = feed
+    if entries_changed:
+        _db().execute(
+            "INSERT INTO rss_feeds (channel_id, etag, last_modified, entries_json, fetched_at) VALUES (?,?,?,?,?) "
+            "ON CONFLICT(channel_id) DO UPDATE SET etag=excluded.etag, last_modified=excluded.last_modified, "
+            "entries_json=excluded.entries_json, fetched_at=excluded.fetched_at",
+            (feed.channel_id, feed.etag, feed.last_modified, json.dumps(feed.entries, ensure_ascii=False), feed.fetched_at),
+        )
+    else:
+        _db().execute("UPDATE rss_feeds SET fetched_at=? WHERE channel_id=?", (feed.fetched_at, feed.channel_id))
+
+
+# ---------------------------
+# parse
+# ---------------------------
+def _entry_of(e: ET.Element) -> Optional[dict]:
+    video_id = (e.findtext(_YT + "videoId") or "").strip()
+    if not video_id:
+        return None
+    desc = ""
+    thumb = ""
+    mg = e.find(_MEDIA + "group")
+    if mg is not None:
+        desc = (mg.findtext(_MEDIA + "description") or "").strip()
+        th = mg.find(_MEDIA + "thumbnail")
+        if th is not None:
+            thumb = (th.attrib.get("url") or "").strip()
+    return {
+        "videoId": video_id,
+        "title": (e.findtext(_ATOM + "title") or "").strip(),
+        "description": desc,
+        "publishedAt": (e.findtext(_ATOM + "published") or "").strip(),
+        "authorName": (e.findtext(_ATOM + "author/" + _ATOM + "name") or "").strip(),
+        "thumbnail": thumb,
+    }
+
+
+class _EntryParser:
+    """受け取ったバイト列を順に流し込み、<entry> が閉じるたびに取り出して要素は捨てる"""
+
+    def __init__(self):
+        self._parser = ET.XMLPullParser(events=("start", "end"))
+        self._root: Optional[ET.Element] = None
+        self.entries: List[dict] = []
+
+    def feed(self, data: bytes):
+        self._parser.feed(data)
+        self._drain()
+
+    def close(self) -> List[dict]:
+        self._parser.close()
+        self._drain()
+        return self.entries
+
+    def _drain(self):
+        for event, el in self._parser.read_events():
+            if event == "start":
+                if self._root is None:
+                    self._root = el
+                continue
+            if el.tag == _ATOM + "entry":
+                entry = _entry_of(el)
+                if entry:
+                    self.entries.append(entry)
+                if self._root is not None:
+                    self._root.remove(el)
+
+
+def parse_feed(xml: bytes) -> List[dict]:
+    p = _EntryParser()
+    p.feed(xml)
+    return p.close()
+
+
+# ---------------------------
+# fetch
+# ---------------------------
+async def _fetch_remote(channel_id: str, cached: Optional[Feed]) -> Feed:
+    url = FEED_URL + urllib.parse.quote(channel_id)
+    headers = {}
+    if cached is not None:
+        if cached.etag:
+            headers["If-None-Match"] = cached.etag
+        if cached.last_modified:
+            headers["If-Modified-Since"] = cached.last_modified
+
+    timeout = aiohttp.ClientTimeout(total=TIMEOUT_SEC)
+    async with rate_limit.limiter("feed").slot():
+        async with get_session().get(url, headers=headers, timeout=timeout) as resp:
+            if resp.status == 304 and cached is not None:
+                _stats["not_modified"] += 1
+                cached.fetched_at = time.time()
+                _save(cached, entries_changed=False)
+                return cached
+            if resp.status != 200:
+                raise RuntimeError(f"RSS failed {resp.status}: {await resp.text()}")
+            p = _EntryParser()
+            async for chunk in resp.content.iter_chunked(_CHUNK):
+                p.feed(chunk)
+            entries = p.close()
+            etag = resp.headers.get("ETag") or ""
+            last_modified = resp.headers.get("Last-Modified") or ""
+
+    _stats["fetched"] += 1
+    feed = Feed(channel_id, entries, etag, last_modified, time.time())
+    _save(feed)
+    return feed
+
+
+async def _get(channel_id: str) -> Feed:
+    cached = _load(channel_id)
+    try:
+        return await _fetch_remote(channel_id, cached)
+    except Exception:
+        if cached is None:
+            raise
+        # 取れなくても手元にあれば古いまま返す（フォールバック経路なので止めない）
+        _stats["stale_served"] += 1
+        return cached
+
+
+async def fetch(channel_id: str) -> List[dict]:
+    """チャンネルのエントリ（新しい順）。FRESH_SEC 以内はネットに出ない"""
+    cached = _feeds.get(channel_id)
+    if cached is not None and time.time() - cached.fetched_at < FRESH_SEC:
+        _stats["memory_hits"] += 1
+        return cached.entries
+    cached = _load(channel_id)
+    if cached is not None and time.time() - cached.fetched_at < FRESH_SEC:
+        _stats["db_hits"] += 1
+        return cached.entries
+    try:
+        feed = await _flight.do(channel_id, lambda: _get(channel_id))
+    except Exception:
+        _stats["errors"] += 1
+        raise
+    return feed.entries
+
+
+async def fetch_many(channel_ids: Iterable[str], concurrency: int = CONCURRENCY) -> Dict[str, List[dict]]:
+    """
+    複数チャンネルを並行取得して {channel_id: entries} を返す。
+    失敗したチャンネルは結果に含めない（errors で数える）。
+    """
+    ids = [c for c in dict.fromkeys(channel_ids) if c]
+    sem = asyncio.Semaphore(max(1, concurrency))
+
+    async def one(cid: str) -> Tuple[str, Optional[List[dict]]]:
+        async with sem:
+            try:
+                return cid, await fetch(cid)
+            except Exception:
+                return cid, None
+
+    out: Dict[str, List[dict]] = {}
+    for cid, entries in await asyncio.gather(*(one(c) for c in ids)):
+        if entries is not None:
+            out[cid] = entries
+    return out
@@ -3,87 +3,43 @@ import re
 import time
 import urllib.parse
 import asyncio
-from dataclasses import dataclass
-from datetime import datetime, timedelta
+import functools
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
 from zoneinfo import ZoneInfo
-import xml.etree.ElementTree as ET
 
 import aiohttp
 
+import api_keys
+from batch_executor import BatchExecutor, cancel_all
+from http_client import get_session
+import metadata_store
+import rate_limit
+import rss_feed
+import video_index
+import watch_store
+from result_set import ResultSet
+from quota_tracker import COST, quota
+from singleflight import SingleFlight
+
 # ---------------------------
 # Config
 # ---------------------------
 YT_BASE_URL = (os.environ.get("URL") or "https://www.googleapis.com/youtube/v3/").strip()
-API_KEY = (os.environ.get("API_KEY") or "").strip()
+# API_KEYS（複数）/ API_KEY（1本）。呼び出し側の params["key"] は _api_get_json でプールのキーに差し替わる
+API_KEY = api_keys.pool.primary
 if YT_BASE_URL and not YT_BASE_URL.endswith("/"):
     YT_BASE_URL += "/"
 
-# 推定クォータ表示（正確な残量はAPIから取れないので推定）
-QUOTA_LIMIT = int(os.environ.get("QUOTA_LIMIT") or "10000")
-
-# YouTube公式フィード（チャンネル指定ありの場合のフォールバック）
-FEED_URL = "https://www.youtube.com/feeds/videos.xml?channel_id="
+# 期間分割（shards）: search.list が1つの検索で返すのはおおよそ 500 件まで
+SHARD_CAP = int(os.environ.get("YT_SHARD_CAP") or "500")
+MAX_SHARDS = int(os.environ.get("YT_MAX_SHARDS") or "32")
 
 LA = ZoneInfo("America/Los_Angeles")  # PT (PST/PDT自動)
 JST = ZoneInfo("Asia/Tokyo")
 
 
-# ---------------------------
-# Quota tracker (estimated)
-# ---------------------------
-COST = {
-    "search.list": 100,
-    "videos.list": 1,
-    "channels.list": 1,
-    "commentThreads.list": 1,
-    "comments.list": 1,
-}
-
-
-@dataclass
-class QuotaSnapshot:
-    limit: int
-    used_est: int
-    remaining_est: int
-    next_reset_pt: str
-    next_reset_jst: str
-
-
-class QuotaTracker:
-    def __init__(self, limit: int):
-        self.limit = limit
-        self.used = 0
-        self._day_pt = datetime.now(LA).date()
-
-    def _rollover_if_needed(self):
-        today = datetime.now(LA).date()
-        if today != self._day_pt:
-            self._day_pt = today
-            self.used = 0
-
-    def add(self, method: str, times: int = 1):
-        self._rollover_if_needed()
-        self.used += COST.get(method, 1) * max(1, int(times))
-
-    def snapshot(self) -> QuotaSnapshot:
-        self._rollover_if_needed()
-        now_pt = datetime.now(LA)
-        next_midnight_pt = (now_pt + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
-        next_midnight_jst = next_midnight_pt.astimezone(JST)
-
-        remaining = max(0, self.limit - self.used)
-        return QuotaSnapshot(
-            limit=self.limit,
-            used_est=self.used,
-            remaining_est=remaining,
-            next_reset_pt=next_midnight_pt.strftime("%Y-%m-%d %H:%M:%S PT"),
-            next_reset_jst=next_midnight_jst.strftime("%Y-%m-%d %H:%M:%S JST"),
-        )
-
-
-quota = QuotaTracker(QUOTA_LIMIT)
-
-
 # ---------------------------
 # Helpers
 # ---------------------------
@@ -143,14 +99,7 @@ def _duration_iso8601_to_hms(dur: str) -> str:
 
 
 def quota_snapshot_dict() -> dict:
-    q = quota.snapshot()
-    return {
-        "limit": q.limit,
-        "used_est": q.used_est,
-        "remaining_est": q.remaining_est,
-        "next_reset_pt": q.next_reset_pt,
-        "next_reset_jst": q.next_reset_jst,
-    }
+    return quota.snapshot_dict()
 
 
 def _is_quota_exceeded(status: int, body_json: dict | None, body_text: str) -> bool:
@@ -166,29 +115,61 @@ def _is_quota_exceeded(status: int, body_json: dict | None, body_text: str) -> b
     return "quotaExceeded" in (body_text or "")
 
 
-async def _api_get_json(session: aiohttp.ClientSession, endpoint: str, params: dict, quota_method: str, retries: int = 4):
-    # 429/5xxは少しリトライ
-    for attempt in range(retries + 1):
-        quota.add(quota_method)
-        url = YT_BASE_URL + endpoint + "?" + urllib.parse.urlencode(params)
-        async with session.get(url) as resp:
-            text = await resp.text()
-            try:
-                js = await resp.json()
-            except Exception:
-                js = None
+_api_flight = SingleFlight()
 
-            if _is_quota_exceeded(resp.status, js, text):
-                raise QuotaExceededError(f"{endpoint} failed 403: {text}")
+# 呼び出し元ごとのユニット計上先（quota_units 属性を持つもの。get_comment_by_id の CrawlStats など）。
+# 実際に投げた回数だけ積む: 相乗り（single-flight の待ち手）は 0、リトライ・キー切り替えは投げた分。
+quota_meter: "ContextVar[object | None]" = ContextVar("quota_meter", default=None)
 
-            if resp.status == 200 and js is not None and "error" not in js:
-                return js
 
-            if resp.status in (429, 500, 502, 503, 504) and attempt < retries:
-                await asyncio.sleep(min(2 ** attempt, 8))
-                continue
+async def _api_get_json(session: aiohttp.ClientSession, endpoint: str, params: dict, quota_method: str, retries: int = 4):
+    # 同じ endpoint+params+retries の呼び出しが実行中なら相乗りする（key は除いて比較）
+    flight_key = (endpoint, tuple(sorted((k, str(v)) for k, v in params.items() if k != "key")), retries)
+    return await _api_flight.do(flight_key, lambda: _api_get_json_once(session, endpoint, params, quota_method, retries))
+
+
+async def _api_get_json_once(session: aiohttp.ClientSession, endpoint: str, params: dict, quota_method: str, retries: int = 4):
+    # キーはプールから選ぶ。quotaExceeded のキーは当日枯渇扱いにして次のキーで即リトライ。
+    # 429/5xx は rate_limit の共有バックオフ（Retry-After 優先）を入れてから少しリトライ
+    limiter = rate_limit.limiter("api")
+    tried = set()
+    attempt = 0
+    last_quota_text = ""
+    while True:
+        key = api_keys.pool.pick(exclude=tried)
+        if not key:
+            raise QuotaExceededError(f"{endpoint} failed 403: {last_quota_text or 'all API keys exhausted'}")
+        url = YT_BASE_URL + endpoint + "?" + urllib.parse.urlencode({**params, "key": key})
+        async with limiter.slot():
+            api_keys.pool.record(key, quota_method)
+            meter = quota_meter.get()
+            if meter is not None:
+                meter.quota_units += COST.get(quota_method, 1)
+            async with session.get(url) as resp:
+                text = await resp.text()
+                try:
+                    js = await resp.json()
+                except Exception:
+                    js = None
+                retry_after = resp.headers.get("Retry-After")
+
+        if _is_quota_exceeded(resp.status, js, text):
+            api_keys.pool.mark_exhausted(key)
+            tried.add(key)
+            last_quota_text = text
+            continue
 
-            raise RuntimeError(f"{endpoint} failed {resp.status}: {text}")
+        if resp.status == 200 and js is not None and "error" not in js:
+            limiter.ok()
+            return js
+
+        if resp.status in (429, 500, 502, 503, 504) and attempt < retries:
+            # 次の slot() が共有の再開時刻まで待たせる
+            limiter.backoff(retry_after)
+            attempt += 1
+            continue
+
+        raise RuntimeError(f"{endpoint} failed {resp.status}: {text}")
 
 
 def _extract_channel_id_from_input(channel_input: str) -> tuple[str, str]:
@@ -232,6 +213,7 @@ async def _resolve_channel_id(session: aiohttp.ClientSession, channel_input: str
     - UC... ならそのまま
     - /channel/UC... URLなら抽出
     - @handle なら channels.list(forHandle) → ダメなら search(type=channel)
+      （結果は metadata_store に永続キャッシュ。解決できなかった handle もネガティブキャッシュ）
     - それ以外は「そのままUCじゃない」ので空扱い（app側でバリデーションしてもOK）
     """
     uc, handle = _extract_channel_id_from_input(channel_input)
@@ -239,13 +221,18 @@ async def _resolve_channel_id(session: aiohttp.ClientSession, channel_input: str
         return uc
 
     if handle:
+        hit, cached = metadata_store.get_handle(handle)
+        if hit:
+            return cached
+
         # まず channels.list(forHandle=...) を試す（軽い）
         try:
             params = {"part": "id", "forHandle": handle, "key": API_KEY}
             body = await _api_get_json(session, "channels", params, "channels.list")
             items = body.get("items") or []
-            if items:
-                return items[0].get("id") or ""
+            if items and items[0].get("id"):
+                metadata_store.put_handle(handle, items[0]["id"])
+                return items[0]["id"]
         except Exception:
             pass
 
@@ -259,64 +246,23 @@ async def _resolve_channel_id(session: aiohttp.ClientSession, channel_input: str
         }
         body = await _api_get_json(session, "search", params, "search.list")
         items = body.get("items") or []
-        if items:
-            return (((items[0].get("id") or {}).get("channelId")) or "").strip()
+        cid = (((items[0].get("id") or {}).get("channelId")) or "").strip() if items else ""
+        metadata_store.put_handle(handle, cid)
+        return cid
 
     return ""
 
 
-async def _rss_fetch_entries(channel_id_uc: str) -> list[dict]:
-    url = FEED_URL + urllib.parse.quote(channel_id_uc)
-    timeout = aiohttp.ClientTimeout(total=25)
-    async with aiohttp.ClientSession(timeout=timeout) as s:
-        async with s.get(url) as resp:
-            if resp.status != 200:
-                raise RuntimeError(f"RSS failed {resp.status}: {await resp.text()}")
-            xml_text = await resp.text()
-
-    ns = {
-        "atom": "http://www.w3.org/2005/Atom",
-        "yt": "http://www.youtube.com/xml/schemas/2015",
-        "media": "http://search.yahoo.com/mrss/",
-    }
-    root = ET.fromstring(xml_text)
-    entries = []
-    for e in root.findall("atom:entry", ns):
-        video_id = (e.findtext("yt:videoId", default="", namespaces=ns) or "").strip()
-        title = (e.findtext("atom:title", default="", namespaces=ns) or "").strip()
-        published = (e.findtext("atom:published", default="", namespaces=ns) or "").strip()
-        author_name = (e.findtext("atom:author/atom:name", default="", namespaces=ns) or "").strip()
-
-        desc = ""
-        thumb = ""
-        mg = e.find("media:group", ns)
-        if mg is not None:
-            desc = (mg.findtext("media:description", default="", namespaces=ns) or "").strip()
-            th = mg.find("media:thumbnail", ns)
-            if th is not None:
-                thumb = (th.attrib.get("url") or "").strip()
-
-        if video_id:
-            entries.append(
-                {
-                    "videoId": video_id,
-                    "title": title,
-                    "description": desc,
-                    "publishedAt": published,
-                    "authorName": author_name,
-                    "thumbnail": thumb,
-                }
-            )
-    return entries
+async def _search_via_rss(channel_id_uc: str, keyword: str, date_from: str, date_to: str, limit: int) -> list[dict]:
+    # 取得・キャッシュ・条件付き GET は rss_feed 側。ここはメモリ上で絞るだけ
+    return _rss_rows(channel_id_uc, await rss_feed.fetch(channel_id_uc), keyword, date_from, date_to, limit)
 
 
-async def _search_via_rss(channel_id_uc: str, keyword: str, date_from: str, date_to: str, limit: int) -> list[dict]:
-    kw = (keyword or "").strip().lower()
+def _rss_rows(channel_id_uc: str, entries: list[dict], keyword: str, date_from: str, date_to: str, limit: int) -> list[dict]:
+    terms = video_index.keyword_terms(keyword)
     d_from = _parse_date_yyyy_mm_dd(date_from)
     d_to = _parse_date_yyyy_mm_dd(date_to)
 
-    entries = await _rss_fetch_entries(channel_id_uc)
-
     out = []
     for it in entries:
         pub_dt = None
@@ -331,10 +277,8 @@ async def _search_via_rss(channel_id_uc: str, keyword: str, date_from: str, date
         if d_to and pub_date and pub_date > d_to:
             continue
 
-        if kw:
-            hay = (it["title"] + "\n" + it["description"]).lower()
-            if kw not in hay:
-                continue
+        if not video_index.keyword_match(terms, it["title"] + "\n" + it["description"]):
+            continue
 
         out.append(
             {
@@ -357,204 +301,1164 @@ async def _search_via_rss(channel_id_uc: str, keyword: str, date_from: str, date
     return out[: max(0, int(limit))]
 
 
+# ---------------------------
+# Enrichment (videos.list / channels.list)
+# ---------------------------
+def _video_entry(it: dict) -> dict:
+    sn = it.get("snippet") or {}
+    st = it.get("statistics") or {}
+    cd = it.get("contentDetails") or {}
+    return {
+        "publishedAt": _iso_to_jst_str(sn.get("publishedAt", "")),
+        "title": sn.get("title", ""),
+        "description": sn.get("description", ""),
+        "thumbnails": (((sn.get("thumbnails") or {}).get("high") or {}).get("url")) or "",
+        "channelId": sn.get("channelId", ""),
+        "channelTitle": sn.get("channelTitle", ""),
+        "viewCount": _to_int(st.get("viewCount", 0), 0),
+        "likeCount": _to_int(st.get("likeCount", 0), 0),
+        "commentCount": _to_int(st.get("commentCount", 0), 0),
+        "videoDuration": _duration_iso8601_to_hms(cd.get("duration", "")),
+    }
+
+
+def _video_stats_entry(it: dict) -> dict:
+    st = it.get("statistics") or {}
+    return {
+        "viewCount": _to_int(st.get("viewCount", 0), 0),
+        "likeCount": _to_int(st.get("likeCount", 0), 0),
+        "commentCount": _to_int(st.get("commentCount", 0), 0),
+    }
+
+
+def _channel_entry(cid: str, it: dict) -> dict:
+    sn = it.get("snippet") or {}
+    st = it.get("statistics") or {}
+    cd = it.get("contentDetails") or {}
+    icon = (((sn.get("thumbnails") or {}).get("default") or {}).get("url")) or ""
+    return {
+        "subscriberCount": _to_int(st.get("subscriberCount", 0), 0),
+        "channel_icon": [f"https://www.youtube.com/channel/{cid}", icon or "images/logo.svg"],
+        "uploads": ((cd.get("relatedPlaylists") or {}).get("uploads")) or "",
+    }
+
+
+def _channel_stats_entry(it: dict) -> dict:
+    st = it.get("statistics") or {}
+    return {"subscriberCount": _to_int(st.get("subscriberCount", 0), 0)}
+
+
+async def _fetch_videos_chunk(session: aiohttp.ClientSession, chunk: list[str]) -> dict[str, dict]:
+    params = {"part": "snippet,statistics,contentDetails", "id": ",".join(chunk), "key": API_KEY}
+    body = await _api_get_json(session, "videos", params, "videos.list")
+    out: dict[str, dict] = {}
+    for it in (body.get("items") or []):
+        vid = (it.get("id") or "").strip()
+        out[vid] = _video_entry(it)
+    return out
+
+
+async def _fetch_channels_chunk(session: aiohttp.ClientSession, chunk: list[str]) -> dict[str, dict]:
+    # contentDetails（アップロード再生リスト）も同じ 1 unit で取れるので一緒に取っておく
+    params = {"part": "snippet,statistics,contentDetails", "id": ",".join(chunk), "key": API_KEY}
+    body = await _api_get_json(session, "channels", params, "channels.list")
+    out: dict[str, dict] = {}
+    for it in (body.get("items") or []):
+        cid = (it.get("id") or "").strip()
+        out[cid] = _channel_entry(cid, it)
+    return out
+
+
+async def _fetch_video_stats_chunk(session: aiohttp.ClientSession, chunk: list[str]) -> dict[str, dict]:
+    params = {"part": "statistics", "id": ",".join(chunk), "key": API_KEY}
+    body = await _api_get_json(session, "videos", params, "videos.list")
+    out: dict[str, dict] = {}
+    for it in (body.get("items") or []):
+        out[(it.get("id") or "").strip()] = _video_stats_entry(it)
+    return out
+
+
+async def _fetch_channel_stats_chunk(session: aiohttp.ClientSession, chunk: list[str]) -> dict[str, dict]:
+    params = {"part": "statistics", "id": ",".join(chunk), "key": API_KEY}
+    body = await _api_get_json(session, "channels", params, "channels.list")
+    out: dict[str, dict] = {}
+    for it in (body.get("items") or []):
+        out[(it.get("id") or "").strip()] = _channel_stats_entry(it)
+    return out
+
+
+async def _enrich(ids: list[str], lookup, fetch_full, fetch_stats, put_full, put_stats, executor: BatchExecutor) -> dict[str, dict]:
+    """
+    ローカルストアで TTL 内のものはそのまま使い、
+    未取得/静的項目が古いものは全 part、統計だけ古いものは statistics だけ API に投げる。
+    """
+    # SQLite の読み書き（と全文インデックス）は同期なのでイベントループの外で
+    fresh, need_full, need_stats = await asyncio.to_thread(lookup, ids)
+    full, stats = await asyncio.gather(
+        executor.run(need_full, fetch_full),
+        executor.run(list(need_stats), fetch_stats),
+    )
+    await asyncio.to_thread(_put_both, put_full, full, put_stats, stats)
+
+    out = dict(fresh)
+    out.update(full)
+    for x, st in stats.items():
+        if x in need_stats:
+            out[x] = {**need_stats[x], **st}
+    return out
+
+
+def _put_both(put_full, full: dict[str, dict], put_stats, stats: dict[str, dict]):
+    # 同じスレッドで続けて書く（接続はスレッドごと）
+    put_full(full)
+    put_stats(stats)
+
+
+def _put_videos(entries: dict[str, dict]):
+    metadata_store.put_videos(entries)
+    # 取れた動画はローカル全文インデックス（source=index）にも入れる
+    video_index.index_videos(entries)
+
+
+async def _enrich_videos(session: aiohttp.ClientSession, executor: BatchExecutor, ids: list[str]) -> dict[str, dict]:
+    return await _enrich(
+        ids,
+        metadata_store.lookup_videos,
+        functools.partial(_fetch_videos_chunk, session),
+        functools.partial(_fetch_video_stats_chunk, session),
+        _put_videos,
+        metadata_store.put_video_stats,
+        executor,
+    )
+
+
+async def _enrich_channels(session: aiohttp.ClientSession, executor: BatchExecutor, ids: list[str]) -> dict[str, dict]:
+    return await _enrich(
+        ids,
+        metadata_store.lookup_channels,
+        functools.partial(_fetch_channels_chunk, session),
+        functools.partial(_fetch_channel_stats_chunk, session),
+        metadata_store.put_channels,
+        metadata_store.put_channel_stats,
+        executor,
+    )
+
+
+async def _iter_search_pages(session: aiohttp.ClientSession, base_params: dict, limit: int, page_token: str = ""):
+    """
+    search.list を nextPageToken で辿り、1ページごとに (video_ids, channel_ids, next_page_token) を yield する。
+    channel_ids はページ内の出現順（重複なし）。page_token を渡すと途中のページから再開する。
+    """
+    fetched = 0
+    while fetched < limit:
+        params = dict(base_params)
+        params["maxResults"] = min(50, limit - fetched)
+        if page_token:
+            params["pageToken"] = page_token
+
+        body = await _api_get_json(session, "search", params, "search.list")
+        vids: list[str] = []
+        chs: list[str] = []
+        for item in (body.get("items") or []):
+            vid = (((item.get("id") or {}).get("videoId")) or "").strip()
+            ch = (((item.get("snippet") or {}).get("channelId")) or "").strip()
+            if vid:
+                vids.append(vid)
+            if ch and ch not in chs:
+                chs.append(ch)
+        fetched += len(vids)
+        page_token = (body.get("nextPageToken") or "").strip()
+
+        yield vids, chs, page_token
+
+        if not page_token:
+            break
+
+
+async def _uploads_playlist_id(session: aiohttp.ClientSession, executor: BatchExecutor, channel_id: str) -> str:
+    """チャンネルのアップロード再生リスト（UU...）。metadata_store にあればそれを使う"""
+    ch = (await _enrich_channels(session, executor, [channel_id])).get(channel_id) or {}
+    if not ch.get("uploads"):
+        # uploads を持つ前に保存された行 → 取り直して上書き
+        fresh = await _fetch_channels_chunk(session, [channel_id])
+        metadata_store.put_channels(fresh)
+        ch = fresh.get(channel_id) or {}
+    return ch.get("uploads") or ""
+
+
+async def _iter_upload_pages(
+    session: aiohttp.ClientSession,
+    playlist_id: str,
+    channel_id: str,
+    key_word: str,
+    after: str,
+    before: str,
+    limit: int,
+    page_token: str = "",
+):
+    """
+    アップロード再生リストを playlistItems.list（1 unit/50件）で新しい順に辿り、
+    キーワード（タイトル+概要）と期間をローカルで絞って _iter_search_pages と同じ形で yield する。
+    公開日時が after より前の動画が出てきたら、そのページで打ち切る（それ以降は全部期間外）。
+    limit は絞り込み後の件数。ページ内で limit を超えた分も返す（件数で切るのは SearchResult.take）。
+    """
+    terms = video_index.keyword_terms(key_word)
+    fetched = 0
+    while fetched < limit:
+        params = {"part": "snippet,contentDetails", "playlistId": playlist_id, "maxResults": 50, "key": API_KEY}
+        if page_token:
+            params["pageToken"] = page_token
+
+        body = await _api_get_json(session, "playlistItems", params, "playlistItems.list")
+        vids: list[str] = []
+        reached_start = False
+        for item in (body.get("items") or []):
+            cd = item.get("contentDetails") or {}
+            sn = item.get("snippet") or {}
+            vid = (cd.get("videoId") or "").strip()
+            published = (cd.get("videoPublishedAt") or "").strip()
+            if not vid or not published:
+                # 非公開・削除済み
+                continue
+            if published > before:
+                continue
+            if published < after:
+                reached_start = True
+                continue
+            if not video_index.keyword_match(terms, (sn.get("title") or "") + "\n" + (sn.get("description") or "")):
+                continue
+            vids.append(vid)
+        fetched += len(vids)
+        page_token = "" if reached_start else (body.get("nextPageToken") or "").strip()
+
+        yield vids, [channel_id], page_token
+
+        if not page_token:
+            break
+
+
 # ---------------------------
 # Main search
 # ---------------------------
-async def search_youtube(
+@dataclass
+class SearchResult:
+    """
+    フィルタ前の検索結果。
+    rows は search.list の並び順の ResultSet（列持ち）で、rank 列は各行が search.list の何件目（0始まり）だったか。
+    （削除済み動画などで videos.list が返さなかった分は rows に無いので、件数で切るときは rank を見る）
+    rows に dict のリストを渡すと、並び順どおりの rank で ResultSet にする。
+    """
+    rows: ResultSet = field(default_factory=ResultSet)
+    fetched: int = 0  # search.list から取り出した videoId 数
+    complete: bool = False  # これ以上ページが無い
+    next_page_token: str = ""
+    error: str = ""
+    notice: str = ""  # エラーではないが画面に出したい注意（クォータ切れで途中まで等）
+    mode: str = "api"  # api | rss
+    source: str = "search"  # search (search.list) | uploads (アップロード再生リスト)
+    shards: int = 0  # 期間分割して取った場合の最終的な分割数
+    pages: int = 0  # 叩いた search.list のページ数
+    # order=viewCount + 再生数Min で打ち切った場合: 最後のページの最小再生数と、打ち切りで浮いたページ数/クォータ
+    view_floor: int | None = None
+    pages_saved: int = 0
+    quota_saved: int = 0
+
+    def __post_init__(self):
+        if not isinstance(self.rows, ResultSet):
+            self.rows = ResultSet.from_rows(self.rows)
+
+    def covers(self, limit: int, viewcount_min: int = 0) -> bool:
+        """
+        video_count=limit（再生数Min=viewcount_min）の検索をこの結果だけで賄えるか。
+        再生数順で打ち切った結果は、打ち切り時の最小再生数より大きい Min の検索なら賄える
+        （その先のページは全部フィルタで落ちるため）。
+        """
+        if self.error:
+            return False
+        if self.complete or self.fetched >= limit:
+            return True
+        return self.view_floor is not None and viewcount_min > self.view_floor
+
+    def stats(self) -> dict:
+        return {
+            "source": self.source,
+            "shards": self.shards,
+            "pages": self.pages,
+            "stopped_early": self.view_floor is not None,
+            "pages_saved": self.pages_saved,
+            "quota_saved": self.quota_saved,
+        }
+
+    def can_extend(self) -> bool:
+        return not self.error and not self.complete and bool(self.next_page_token)
+
+    def extend(self, more: "SearchResult"):
+        """next_page_token から続きを取った結果を後ろに足す"""
+        self.rows.extend(more.rows, rank_offset=self.fetched)
+        self.fetched += more.fetched
+        self.complete = more.complete
+        self.next_page_token = more.next_page_token
+        self.pages += more.pages
+        self.source = more.source
+        self.view_floor = more.view_floor
+        self.pages_saved = more.pages_saved
+        self.quota_saved = more.quota_saved
+
+    def take(self, limit: int) -> ResultSet:
+        """video_count=limit で検索した場合に得られる行（フィルタ前）"""
+        return self.select(limit)
+
+    def select(
+        self,
+        limit: int | None = None,
+        viewcount_min: str = "",
+        viewcount_max: str = "",
+        subscribercount_min: str = "",
+        subscribercount_max: str = "",
+        kind: str = "",
+    ) -> ResultSet:
+        """
+        video_count=limit で取った行を再生数/登録者数でフィルタし、kind（normal/shorts）で絞った ResultSet。
+        RSS には再生数/登録者数が無いので、先頭 limit 件を取るだけでフィルタしない。
+        """
+        if self.mode == "rss":
+            rows = self.rows if limit is None else self.rows.subset(range(min(len(self.rows), max(0, limit))))
+            return rows.filter(kind=kind)
+        return self.rows.filter(
+            viewcount_min=_to_int(viewcount_min, 0),
+            viewcount_max=_to_int(viewcount_max, -1),
+            subscribercount_min=_to_int(subscribercount_min, 0),
+            subscribercount_max=_to_int(subscribercount_max, -1),
+            max_rank=limit,
+            kind=kind,
+        )
+
+
+def _normalize_order(order: str) -> str:
+    o = (order or "date").strip()
+    if o.lower() in ("viewcount", "view", "views"):
+        return "viewCount"
+    if o.lower() in ("relevance",):
+        return "relevance"
+    return "date"
+
+
+def _normalize_source(source: str) -> str:
+    s = (source or "").strip().lower()
+    if s in ("uploads", "upload", "playlist"):
+        return "uploads"
+    if s in ("index", "local"):
+        return "index"
+    return "search"
+
+
+def _default_dates(published_from: str, published_to: str) -> tuple[str, str]:
+    published_from = (published_from or "").strip() or "2005-04-01"
+    published_to = (published_to or "").strip() or datetime.now(JST).strftime("%Y-%m-%d")
+    return published_from, published_to
+
+
+def search_key(
     channel_id_input: str,
     key_word: str,
     published_from: str,
     published_to: str,
-    viewcount_min: str,
-    subscribercount_min: str,
-    video_count: str,
-    viewcount_max: str = "",
-    subscribercount_max: str = "",
     order: str = "date",
-) -> list[dict]:
+    source: str = "search",
+    shards: int | str = 1,
+) -> tuple:
     """
-    返す dict は index.html の cols に合わせて固定キーで返す。
+    フィルタ（再生数/登録者数）と件数を含まない検索キー。
+    同じキーの結果はフィルタ違い・件数違いの検索で使い回せる。
     """
-    if not API_KEY:
-        return [{"error": "Missing API_KEY", "mode": "error"}]
+    published_from, published_to = _default_dates(published_from, published_to)
+    kw = " ".join((key_word or "").split())
+    src = _normalize_source(source)
+    # uploads は常に新しい順（order は効かない）
+    o = "date" if src == "uploads" else _normalize_order(order)
+    key = (kw, (channel_id_input or "").strip(), published_from, published_to, o, src)
+    n = _to_int(shards, 1)
+    # 期間分割した結果は並びも件数上限も違うので別扱い
+    return key + (n,) if src == "search" and n > 1 else key
+
+
+def _build_row(vid: str, v: dict, channels_map: dict[str, dict]) -> dict:
+    cid = v.get("channelId") or ""
+    ch = channels_map.get(cid, {}) or {}
+    return {
+        "publishedAt": v["publishedAt"],
+        "title": v["title"],
+        "description": v["description"],
+        "viewCount": int(v["viewCount"]),
+        "likeCount": v["likeCount"],
+        "commentCount": v["commentCount"],
+        "videoDuration": v["videoDuration"],
+        "thumbnails": v["thumbnails"],
+        "video_url": f"https://www.youtube.com/watch?v={vid}",
+        "name": v.get("channelTitle", ""),
+        "subscriberCount": int(ch.get("subscriberCount", 0) or 0),
+        "channel_icon": ch.get("channel_icon", [f"https://www.youtube.com/channel/{cid}", "images/logo.svg"]),
+    }
 
-    limit = max(1, _to_int(video_count, 200))
+
+def filter_rows(
+    rows: list[dict],
+    viewcount_min: str = "",
+    viewcount_max: str = "",
+    subscribercount_min: str = "",
+    subscribercount_max: str = "",
+) -> list[dict]:
+    """dict の行のリスト用（search_multi の merged 等）。SearchResult の行は SearchResult.select で"""
     vmin = _to_int(viewcount_min, 0)
     vmax = _to_int(viewcount_max, -1)
     smin = _to_int(subscribercount_min, 0)
     smax = _to_int(subscribercount_max, -1)
 
-    # 日付デフォルト
-    if not (published_from or "").strip():
-        published_from = "2005-04-01"
-    if not (published_to or "").strip():
-        published_to = datetime.now(JST).strftime("%Y-%m-%d")
+    out: list[dict] = []
+    for r in rows:
+        vc = int(r["viewCount"])
+        sc = int(r["subscriberCount"])
+        if vc < vmin:
+            continue
+        if vmax >= 0 and vc > vmax:
+            continue
+        if sc < smin:
+            continue
+        if smax >= 0 and sc > smax:
+            continue
+        out.append(r)
+    return out
 
-    after = published_from + "T00:00:00Z"
-    before = published_to + "T23:59:59Z"
 
-    # order 正規化
-    o = (order or "date").strip()
-    if o.lower() in ("viewcount", "view", "views"):
-        o = "viewCount"
-    elif o.lower() in ("relevance",):
-        o = "relevance"
-    else:
-        o = "date"
+def _cached_channel_id(channel_input: str) -> str:
+    """API を使わずに分かる範囲の UC...（直指定・URL・解決済み handle）"""
+    uc, handle = _extract_channel_id_from_input(channel_input)
+    if uc or not handle:
+        return uc
+    return metadata_store.get_handle(handle)[1]
 
-    timeout = aiohttp.ClientTimeout(total=30)
-    async with aiohttp.ClientSession(timeout=timeout) as session:
-        # channelId 解決（空なら未指定扱い）
-        channel_id = ""
-        if (channel_id_input or "").strip():
-            try:
-                channel_id = await _resolve_channel_id(session, channel_id_input)
-            except QuotaExceededError as e:
-                # ここで踏んだ場合、RSSも試せない（解決にAPIが必要）
-                return [{"error": str(e), "mode": "error"}]
-            if not channel_id:
-                return [{"error": "channel-id を解決できませんでした（UC〜 or https://www.youtube.com/channel/UC... 推奨）", "mode": "error"}]
 
-        # 1) search.list で videoId 集める（重い）
-        video_ids: list[str] = []
-        channel_ids: set[str] = set()
-        page_token = ""
+async def _search_via_index(
+    channel_id_input: str,
+    key_word: str,
+    published_from: str,
+    published_to: str,
+    video_count: str,
+    order: str,
+    source: str = "index",
+) -> SearchResult:
+    """video_index + metadata_store だけで検索する。統計は保存時点の値（古いことがある）"""
+    if not video_index.available():
+        return SearchResult(error="ローカルインデックスが使えません（VIDEO_INDEX=0 / META_STORE=0 / SQLite に FTS5 trigram が無い）")
 
-        try:
-            while len(video_ids) < limit:
-                params = {
-                    "part": "snippet",
-                    "type": "video",
-                    "maxResults": min(50, limit - len(video_ids)),
-                    "order": o,
-                    "key": API_KEY,
-                    "regionCode": "JP",
-                    "publishedAfter": after,
-                    "publishedBefore": before,
-                }
-                kw = (key_word or "").strip()
-                if kw:
-                    params["q"] = kw
-                if channel_id:
-                    params["channelId"] = channel_id
-                if page_token:
-                    params["pageToken"] = page_token
-
-                body = await _api_get_json(session, "search", params, "search.list")
-                items = body.get("items") or []
-                for item in items:
-                    vid = (((item.get("id") or {}).get("videoId")) or "").strip()
-                    ch = (((item.get("snippet") or {}).get("channelId")) or "").strip()
-                    if vid:
-                        video_ids.append(vid)
-                    if ch:
-                        channel_ids.add(ch)
-
-                page_token = (body.get("nextPageToken") or "").strip()
-                if not page_token:
-                    break
-
-        except QuotaExceededError:
-            # フォールバック：チャンネル指定ありならRSSで最低限
-            if channel_id:
+    limit = max(1, _to_int(video_count, 200))
+    published_from, published_to = _default_dates(published_from, published_to)
+    o = _normalize_order(order)
+
+    channel_id = ""
+    if (channel_id_input or "").strip():
+        channel_id, handle = _extract_channel_id_from_input(channel_id_input)
+        if not channel_id and handle:
+            hit, channel_id = metadata_store.get_handle(handle)
+            if not hit and api_keys.pool:
                 try:
-                    return await _search_via_rss(channel_id, key_word, published_from, published_to, limit)
+                    channel_id = await _resolve_channel_id(get_session(), channel_id_input)
                 except Exception as e:
-                    return [{"error": f"quotaExceeded + RSS fallback failed: {e}", "mode": "error"}]
-            return [{"error": "quotaExceeded（channel-id指定が無いとRSSフォールバック不可）", "mode": "error"}]
-        except Exception as e:
-            return [{"error": str(e), "mode": "error"}]
+                    return SearchResult(error=str(e))
+        if not channel_id:
+            return SearchResult(error="channel-id を解決できませんでした（UC〜 or https://www.youtube.com/channel/UC... 推奨）")
+
+    # 再生数順は統計を見てから並べるので、件数で切るのはその後
+    ids = video_index.search(
+        key_word, channel_id, published_from, published_to, 0 if o == "viewCount" else limit, o
+    )
+    videos_map = metadata_store.get_videos(ids)
+    channels_map = metadata_store.get_channels({v.get("channelId") for v in videos_map.values()})
+
+    rows = ResultSet.from_rows(_build_row(vid, videos_map[vid], channels_map) for vid in ids if vid in videos_map)
+    if o == "viewCount":
+        rows = rows.subset(rows.top_k("viewCount", limit), rerank=True)
+    if not video_index.ready():
+        # 起動直後の取り込み（video_index.backfill）が終わるまでは欠けがあるので、完全な結果としては扱わない
+        return SearchResult(rows=rows, fetched=len(rows), source=source, notice="ローカルインデックスを取り込み中です（結果が欠けることがあります）")
+    return SearchResult(rows=rows, fetched=len(rows), complete=True, source=source)
+
+
+def _search_params(order: str, after: str, before: str, key_word: str, channel_id: str) -> dict:
+    params = {
+        "part": "snippet",
+        "type": "video",
+        "order": order,
+        "key": API_KEY,
+        "regionCode": "JP",
+        "publishedAfter": after,
+        "publishedBefore": before,
+    }
+    if key_word:
+        params["q"] = key_word
+    if channel_id:
+        params["channelId"] = channel_id
+    return params
+
+
+async def iter_search(
+    channel_id_input: str,
+    key_word: str,
+    published_from: str,
+    published_to: str,
+    video_count: str,
+    order: str = "date",
+    page_token: str = "",
+    viewcount_min: str = "",
+    source: str = "search",
+    shards: int | str = 1,
+):
+    """
+    search.list のページごとに、enrich 済み（フィルタ前）の SearchResult を yield する async generator。
+    rows の rank 列はそのページ内の位置（SearchResult.extend で通しの位置になる）。
+    エラー時は error 付きの SearchResult を1つ yield して終わる。
+
+    search.list は裏のタスクで先へ先へとページングし（パイプライン）、
+    ここでは各ページの videos.list / channels.list が揃った順に返す。
+
+    order=viewCount かつ viewcount_min 指定時は、ページごとに enrich を待って最小再生数を見て、
+    Min を下回ったらそれ以上ページングしない（以降のページは全部フィルタで落ちるため）。
+    このときは最後に、打ち切り情報（view_floor / pages_saved / quota_saved）だけの SearchResult を yield する。
+
+    source="uploads" はチャンネル指定必須。search.list（100 units）の代わりにアップロード再生リストを
+    playlistItems.list（1 unit）で新しい順に辿り、キーワード・期間はローカルで絞る（order は無視）。
+
+    source="index" はこれまでに enrich した動画のローカル全文インデックスだけで答える（API を使わない）。
+
+    shards>1（source=search のみ）は期間を分割して並行に取り、まとめた SearchResult を1つ yield する（_search_sharded）。
+    """
+    if _normalize_source(source) == "index":
+        yield await _search_via_index(channel_id_input, key_word, published_from, published_to, video_count, order)
+        return
+
+    # ウォッチ中（channel_sync で同期済み）のチャンネルはローカルで答える（source="watch"）
+    watched = _cached_channel_id(channel_id_input)
+    if watched and watch_store.serves(watched, _default_dates(published_from, published_to)[0]):
+        yield await _search_via_index(watched, key_word, published_from, published_to, video_count, order, source="watch")
+        return
+
+    if not api_keys.pool:
+        yield SearchResult(error="Missing API_KEY")
+        return
 
-        if not video_ids:
-            return []
+    limit = max(1, _to_int(video_count, 200))
+    published_from, published_to = _default_dates(published_from, published_to)
+
+    after = published_from + "T00:00:00Z"
+    before = published_to + "T23:59:59Z"
+    src = _normalize_source(source)
+    o = "date" if src == "uploads" else _normalize_order(order)
+    vmin = _to_int(viewcount_min, 0)
+    stop_below = vmin if (o == "viewCount" and vmin > 0) else None
 
-        # 2) videos.list で統計/詳細（最大50ずつ）
-        videos_map: dict[str, dict] = {}
+    session = get_session()
+    # channelId 解決（空なら未指定扱い）
+    channel_id = ""
+    if (channel_id_input or "").strip():
         try:
-            for i in range(0, len(video_ids), 50):
-                chunk = video_ids[i : i + 50]
-                params = {"part": "snippet,statistics,contentDetails", "id": ",".join(chunk), "key": API_KEY}
-                body = await _api_get_json(session, "videos", params, "videos.list")
-                for it in (body.get("items") or []):
-                    vid = (it.get("id") or "").strip()
-                    sn = it.get("snippet") or {}
-                    st = it.get("statistics") or {}
-                    cd = it.get("contentDetails") or {}
-                    videos_map[vid] = {
-                        "publishedAt": _iso_to_jst_str(sn.get("publishedAt", "")),
-                        "title": sn.get("title", ""),
-                        "description": sn.get("description", ""),
-                        "thumbnails": (((sn.get("thumbnails") or {}).get("high") or {}).get("url")) or "",
-                        "channelId": sn.get("channelId", ""),
-                        "channelTitle": sn.get("channelTitle", ""),
-                        "viewCount": _to_int(st.get("viewCount", 0), 0),
-                        "likeCount": _to_int(st.get("likeCount", 0), 0),
-                        "commentCount": _to_int(st.get("commentCount", 0), 0),
-                        "videoDuration": _duration_iso8601_to_hms(cd.get("duration", "")),
-                    }
+            channel_id = await _resolve_channel_id(session, channel_id_input)
         except QuotaExceededError as e:
-            return [{"error": str(e), "mode": "error"}]
-        except Exception as e:
-            return [{"error": str(e), "mode": "error"}]
-
-        # 3) channels.list で登録者数等（最大50ずつ）
-        channels_map: dict[str, dict] = {}
+            # ここで踏んだ場合、RSSも試せない（解決にAPIが必要）
+            yield SearchResult(error=str(e))
+            return
+        if not channel_id:
+            yield SearchResult(error="channel-id を解決できませんでした（UC〜 or https://www.youtube.com/channel/UC... 推奨）")
+            return
+    if src == "uploads" and not channel_id:
+        yield SearchResult(error="source=uploads は channel-id の指定が必要です")
+        return
+
+    kw = (key_word or "").strip()
+    base_params = _search_params(o, after, before, kw, channel_id)
+
+    n_shards = _to_int(shards, 1)
+    if src == "search" and n_shards > 1 and not page_token:
         try:
-            ch_list = list(channel_ids)
-            for i in range(0, len(ch_list), 50):
-                chunk = ch_list[i : i + 50]
-                params = {"part": "snippet,statistics", "id": ",".join(chunk), "key": API_KEY}
-                body = await _api_get_json(session, "channels", params, "channels.list")
-                for it in (body.get("items") or []):
-                    cid = (it.get("id") or "").strip()
-                    sn = it.get("snippet") or {}
-                    st = it.get("statistics") or {}
-                    icon = (((sn.get("thumbnails") or {}).get("default") or {}).get("url")) or ""
-                    channels_map[cid] = {
-                        "subscriberCount": _to_int(st.get("subscriberCount", 0), 0),
-                        "channel_icon": [f"https://www.youtube.com/channel/{cid}", icon or "images/logo.svg"],
-                    }
+            yield await _search_sharded(session, BatchExecutor(), base_params, after, before, limit, o, n_shards)
         except QuotaExceededError as e:
-            return [{"error": str(e), "mode": "error"}]
-        except Exception:
-            # 登録者が取れなくても検索結果は出す（0扱い）
-            pass
+            yield SearchResult(error=f"quotaExceeded（期間分割中）: {e}")
+        except Exception as e:
+            yield SearchResult(error=str(e))
+        return
+
+    # 1) search.list で videoId を集めつつ（重い）、ページが返るたびに
+    #    2) videos.list / 3) channels.list をバックグラウンドで走らせる（パイプライン）
+    #    ※ ローカルの metadata_store で足りる ID は API に投げない
+    executor = BatchExecutor()
+    pages: asyncio.Queue = asyncio.Queue()
+    video_tasks: list[asyncio.Task] = []
+    channel_tasks: list[asyncio.Task] = []
+
+    async def produce():
+        seen_channels: set[str] = set()
+        fetched = 0
+        try:
+            if src == "uploads":
+                playlist_id = await _uploads_playlist_id(session, executor, channel_id)
+                if not playlist_id:
+                    raise RuntimeError("アップロード再生リストが見つかりませんでした")
+                pager = _iter_upload_pages(session, playlist_id, channel_id, kw, after, before, limit, page_token)
+            else:
+                pager = _iter_search_pages(session, base_params, limit, page_token)
+            async for vids, chs, next_token in pager:
+                fetched += len(vids)
+                vt = asyncio.create_task(_enrich_videos(session, executor, vids)) if vids else None
+                if vt:
+                    video_tasks.append(vt)
+                new_chs = [c for c in chs if c not in seen_channels]
+                seen_channels.update(new_chs)
+                if new_chs:
+                    channel_tasks.append(asyncio.create_task(_enrich_channels(session, executor, new_chs)))
+                await pages.put((vids, vt, len(channel_tasks), next_token))
+
+                if stop_below is not None and vt and next_token and fetched < limit:
+                    # 次の search.list（100 units）を叩く前に、このページの再生数を確認
+                    await asyncio.wait([vt])
+                    if vt.exception() is None:
+                        views = [v["viewCount"] for v in vt.result().values()]
+                        if views and min(views) < stop_below:
+                            pages_saved = -(-(limit - fetched) // 50)
+                            await pages.put(("stop", min(views), pages_saved))
+                            break
+        except Exception as e:
+            await pages.put(e)
+            return
+        await pages.put(None)
+
+    producer = asyncio.create_task(produce())
+    channels_map: dict[str, dict] = {}
+    channels_done = 0
+    last_token = page_token
+    yielded = False
+    try:
+        while True:
+            item = await pages.get()
+            if item is None:
+                return
+
+            if isinstance(item, QuotaExceededError):
+                if yielded:
+                    # 途中まで取れた分は活かす（続きはクォータ回復後に last_token から）
+                    yield SearchResult(complete=False, next_page_token=last_token, notice="quotaExceeded: 途中までの結果です")
+                    return
+                # フォールバック：チャンネル指定ありならRSSで最低限
+                if channel_id:
+                    try:
+                        rss_rows = await _search_via_rss(channel_id, key_word, published_from, published_to, limit)
+                    except Exception as e:
+                        yield SearchResult(error=f"quotaExceeded + RSS fallback failed: {e}")
+                        return
+                    yield SearchResult(rows=rss_rows, fetched=len(rss_rows), complete=True, mode="rss")
+                    return
+                yield SearchResult(error="quotaExceeded（channel-id指定が無いとRSSフォールバック不可）")
+                return
+            if isinstance(item, Exception):
+                yield SearchResult(error=str(item))
+                return
+            if item[0] == "stop":
+                _, floor, pages_saved = item
+                yield SearchResult(
+                    complete=False,
+                    next_page_token=last_token,
+                    view_floor=floor,
+                    pages_saved=pages_saved,
+                    quota_saved=pages_saved * COST["search.list"],
+                )
+                continue
 
-    # 4) フィルタ & 出力
-    out: list[dict] = []
-    for vid in video_ids:
-        v = videos_map.get(vid)
-        if not v:
-            continue
+            vids, vt, n_channel_tasks, next_token = item
 
-        vc = int(v["viewCount"])
-        cid = v.get("channelId") or ""
-        sc = int((channels_map.get(cid, {}) or {}).get("subscriberCount", 0) or 0)
+            # 2) このページの videos.list
+            try:
+                videos_map = await vt if vt else {}
+            except Exception as e:
+                yield SearchResult(error=str(e))
+                return
 
-        if vc < vmin:
-            continue
-        if vmax >= 0 and vc > vmax:
-            continue
-        if sc < smin:
-            continue
-        if smax >= 0 and sc > smax:
-            continue
+            # 3) このページまでに出てきたチャンネルの channels.list（登録者数等）
+            for t in channel_tasks[channels_done:n_channel_tasks]:
+                try:
+                    channels_map.update(await t)
+                except QuotaExceededError as e:
+                    yield SearchResult(error=str(e))
+                    return
+                except Exception:
+                    # 登録者が取れなくても検索結果は出す（0扱い）
+                    pass
+            channels_done = n_channel_tasks
+
+            # 4) 出力（search.list の順。フィルタは SearchResult.select で）
+            page = SearchResult(fetched=len(vids), complete=not next_token, next_page_token=next_token, pages=1, source=src)
+            for rank, vid in enumerate(vids):
+                v = videos_map.get(vid)
+                if not v:
+                    continue
+                page.rows.append(_build_row(vid, v, channels_map), rank)
+            last_token = next_token
+            yielded = True
+            yield page
+    finally:
+        producer.cancel()
+        cancel_all(video_tasks + channel_tasks)
+
+
+async def search_unfiltered(
+    channel_id_input: str,
+    key_word: str,
+    published_from: str,
+    published_to: str,
+    video_count: str,
+    order: str = "date",
+    page_token: str = "",
+    viewcount_min: str = "",
+    source: str = "search",
+    shards: int | str = 1,
+) -> SearchResult:
+    """
+    search.list → videos.list / channels.list まで済ませた、フィルタ前の結果をまとめて返す。
+    page_token を渡すと、前回の SearchResult.next_page_token の続きから video_count 件取る。
+    viewcount_min は再生数順での打ち切り判定にだけ使う（フィルタ自体は SearchResult.select で）。
+    """
+    result = SearchResult(next_page_token=page_token, source=_normalize_source(source))
+    async for page in iter_search(
+        channel_id_input, key_word, published_from, published_to, video_count, order, page_token, viewcount_min, source, shards
+    ):
+        if page.error or page.mode == "rss" or page.shards:
+            return page
+        result.extend(page)
+        result.notice = page.notice or result.notice
+    return result
 
-        out.append(
-            {
-                "publishedAt": v["publishedAt"],
-                "title": v["title"],
-                "description": v["description"],
-                "viewCount": vc,
-                "likeCount": v["likeCount"],
-                "commentCount": v["commentCount"],
-                "videoDuration": v["videoDuration"],
-                "thumbnails": v["thumbnails"],
-                "video_url": f"https://www.youtube.com/watch?v={vid}",
-                "name": v.get("channelTitle", ""),
-                "subscriberCount": sc,
-                "channel_icon": (channels_map.get(cid, {}) or {}).get("channel_icon", [f"https://www.youtube.com/channel/{cid}", "images/logo.svg"]),
-            }
+
+async def search_youtube(
+    channel_id_input: str,
+    key_word: str,
+    published_from: str,
+    published_to: str,
+    viewcount_min: str,
+    subscribercount_min: str,
+    video_count: str,
+    viewcount_max: str = "",
+    subscribercount_max: str = "",
+    order: str = "date",
+    source: str = "search",
+    shards: int | str = 1,
+) -> list[dict]:
+    """
+    返す dict は index.html の cols に合わせて固定キーで返す。
+    source="uploads" はチャンネルのアップロード再生リストを辿る（チャンネル指定必須・新しい順）。
+    shards=N は期間を最大 N 分割して並行に取る（件数上限 ~500 を超えて深く取れる。分割数は件数から決め、密な期間は自動でさらに分割）。
+    """
+    res = await search_unfiltered(
+        channel_id_input, key_word, published_from, published_to, video_count, order,
+        viewcount_min=viewcount_min, source=source, shards=shards,
+    )
+    if res.error:
+        return [{"error": res.error, "mode": "error"}]
+    # RSS には再生数/登録者数が無いのでフィルタしない（select が見分ける）
+    return res.select(None, viewcount_min, viewcount_max, subscribercount_min, subscribercount_max).to_dicts()
+
+
+# ---------------------------
+# Date-range sharding
+# ---------------------------
+_ISO = "%Y-%m-%dT%H:%M:%SZ"
+
+
+@dataclass
+class _Shard:
+    after: datetime
+    before: datetime
+    vids: list[str] = field(default_factory=list)
+    chs: list[str] = field(default_factory=list)
+    next_token: str = ""
+    total: int = 0  # pageInfo.totalResults（概算）
+    pages: int = 0
+    need: int = 0
+    error: BaseException | None = None  # 1ページ目 or 続きの取得で失敗した（vids は取れたところまで）
+
+    def params(self, base_params: dict) -> dict:
+        return {**base_params, "publishedAfter": self.after.strftime(_ISO), "publishedBefore": self.before.strftime(_ISO)}
+
+    def splittable(self) -> bool:
+        return self.before - self.after > timedelta(days=1)
+
+    def halves(self) -> list["_Shard"]:
+        mid = self.after + (self.before - self.after) / 2
+        mid = mid.replace(microsecond=0)
+        # 新しい側を先に（date 順で上から埋めるため）
+        return [_Shard(mid + timedelta(seconds=1), self.before), _Shard(self.after, mid)]
+
+
+def _split_window(after: datetime, before: datetime, n: int) -> list[_Shard]:
+    """[after, before] を n 等分（新しい順）。境界の1秒は重ならないようにずらす"""
+    n = max(1, n)
+    step = (before - after) / n
+    edges = [(after + step * k).replace(microsecond=0) for k in range(n)] + [before]
+    out = [_Shard(edges[k] + (timedelta(seconds=1) if k else timedelta(0)), edges[k + 1]) for k in range(n)]
+    return out[::-1]
+
+
+async def _probe_shard(session: aiohttp.ClientSession, base_params: dict, shard: _Shard):
+    """1ページ目を取り、件数の目安（totalResults）を見る"""
+    params = shard.params(base_params)
+    params["maxResults"] = 50
+    body = await _api_get_json(session, "search", params, "search.list")
+    for item in (body.get("items") or []):
+        vid = (((item.get("id") or {}).get("videoId")) or "").strip()
+        ch = (((item.get("snippet") or {}).get("channelId")) or "").strip()
+        if vid:
+            shard.vids.append(vid)
+        if ch and ch not in shard.chs:
+            shard.chs.append(ch)
+    shard.next_token = (body.get("nextPageToken") or "").strip()
+    shard.total = _to_int((body.get("pageInfo") or {}).get("totalResults"), len(shard.vids))
+    shard.pages = 1
+
+
+def _allocate(shards: list[_Shard], limit: int, order: str):
+    """
+    各分割から何件取るか。date 順は新しい分割から順に limit を埋める（古い分割は1ページ目だけ）。
+    それ以外の順序は全体の上位がどこにあるか分からないので、各分割から limit まで。
+    """
+    remaining = limit
+    for sh in shards:
+        avail = max(sh.total, len(sh.vids))
+        if order == "date":
+            sh.need = min(avail, remaining)
+            remaining -= sh.need
+        else:
+            sh.need = min(avail, limit)
+
+
+async def _page_shard(session: aiohttp.ClientSession, base_params: dict, shard: _Shard):
+    want = min(shard.need, SHARD_CAP) - len(shard.vids)
+    if want <= 0 or not shard.next_token:
+        return
+    async for vids, chs, next_token in _iter_search_pages(session, shard.params(base_params), want, shard.next_token):
+        shard.vids.extend(vids)
+        shard.chs.extend(c for c in chs if c not in shard.chs)
+        shard.next_token = next_token
+        shard.pages += 1
+
+
+def _merge_shard_rows(shards: list[_Shard], rows_by_vid: dict[str, dict], order: str) -> ResultSet:
+    if order == "relevance":
+        # 各分割の順位を保ったまま交互に（1位同士 → 2位同士 → ...）
+        keyed = [(rank, i, vid) for i, sh in enumerate(shards) for rank, vid in enumerate(sh.vids)]
+        keyed.sort()
+        vids = [vid for _r, _i, vid in keyed]
+    else:
+        vids = [vid for sh in shards for vid in sh.vids]
+    rows = ResultSet.from_rows(rows_by_vid[v] for v in dict.fromkeys(vids) if v in rows_by_vid)
+    if order == "viewCount":
+        return rows.sorted("viewCount")
+    if order == "date":
+        return rows.sorted("publishedTs")
+    return rows
+
+
+async def _gather_shards(coros, shards: list[_Shard]) -> list[BaseException]:
+    """分割ごとの取得を並行に。失敗は shard.error に入れて返す（取れた分割は捨てない）"""
+    errors: list[BaseException] = []
+    for sh, r in zip(shards, await asyncio.gather(*coros, return_exceptions=True)):
+        if isinstance(r, BaseException):
+            if not isinstance(r, Exception):
+                raise r
+            sh.error = r
+            errors.append(r)
+    return errors
+
+
+async def _search_sharded(
+    session: aiohttp.ClientSession,
+    executor: BatchExecutor,
+    base_params: dict,
+    after: str,
+    before: str,
+    limit: int,
+    order: str,
+    shards: int,
+) -> SearchResult:
+    """
+    publishedAfter〜publishedBefore を分割して search.list を並行にページングし、依頼された順序でまとめ直す。
+    1ページ目（100 units）を分割の数だけ払うので、最初の分割数は limit から決める（約 limit/50。shards を超えない）。
+    1ページ目の totalResults を見て、取りたい件数が SHARD_CAP を超える分割だけさらに半分に割る（最大 MAX_SHARDS）。
+    一部の分割が失敗しても（クォータ切れ等）取れた分割はまとめて返す（complete=False + notice）。
+    """
+    lo = datetime.strptime(after, _ISO).replace(tzinfo=timezone.utc)
+    hi = datetime.strptime(before, _ISO).replace(tzinfo=timezone.utc)
+    n_first = min(shards, MAX_SHARDS, max(1, -(-limit // 50)))
+    parts = _split_window(lo, hi, n_first)
+    errors = await _gather_shards([_probe_shard(session, base_params, sh) for sh in parts], parts)
+
+    quota_hit = any(isinstance(e, QuotaExceededError) for e in errors)
+    while not quota_hit:
+        _allocate(parts, limit, order)
+        dense = [sh for sh in parts if sh.need > SHARD_CAP and sh.next_token and sh.splittable()]
+        if not dense or len(parts) + len(dense) > MAX_SHARDS:
+            break
+        children: dict[int, list[_Shard]] = {id(sh): sh.halves() for sh in dense}
+        kids = [c for cs in children.values() for c in cs]
+        errors += await _gather_shards([_probe_shard(session, base_params, c) for c in kids], kids)
+        quota_hit = any(isinstance(e, QuotaExceededError) for e in errors)
+        # 子の1ページ目が取れなかった分割は割らずに親のまま残す
+        parts = [
+            c
+            for sh in parts
+            for c in (children[id(sh)] if id(sh) in children and not any(k.error for k in children[id(sh)]) else [sh])
+        ]
+
+    if not quota_hit:
+        _allocate(parts, limit, order)
+        live = [sh for sh in parts if sh.error is None]
+        errors += await _gather_shards([_page_shard(session, base_params, sh) for sh in live], live)
+
+    all_vids = list(dict.fromkeys(v for sh in parts for v in sh.vids))
+    if errors and not all_vids:
+        raise errors[0]
+    all_chs = list(dict.fromkeys(c for sh in parts for c in sh.chs))
+    videos_map, channels_map = await asyncio.gather(
+        _enrich_videos(session, executor, all_vids),
+        _enrich_channels(session, executor, all_chs),
+        return_exceptions=True,
+    )
+    if isinstance(videos_map, BaseException):
+        raise videos_map
+    if isinstance(channels_map, BaseException):
+        channels_map = {}
+
+    rows_by_vid = {vid: _build_row(vid, videos_map[vid], channels_map) for vid in all_vids if vid in videos_map}
+    rows = _merge_shard_rows(parts, rows_by_vid, order)
+    notice = ""
+    if errors:
+        first = errors[0]
+        notice = (
+            "quotaExceeded: 途中までの結果です（期間分割の一部）"
+            if isinstance(first, QuotaExceededError)
+            else f"期間分割の一部が取れませんでした: {first}"
         )
+    return SearchResult(
+        rows=rows,
+        fetched=len(all_vids),
+        # 分割ごとの続きのトークンは1本にまとめられないので、続きは取らない（足りないかどうかだけ持つ）
+        complete=not errors and all(not sh.next_token for sh in parts),
+        notice=notice,
+        pages=sum(sh.pages for sh in parts),
+        shards=len(parts),
+    )
 
+
+# ---------------------------
+# Multi-query search
+# ---------------------------
+@dataclass
+class MultiSearchResult:
+    """
+    search_multi の結果。results[i] は queries[i] の（フィルタ前の）SearchResult。
+    merged は全クエリの行を動画単位で重複排除したもの（"queries" に何番目のクエリで出たかが入る）。
+    """
+    queries: list[tuple[str, str]] = field(default_factory=list)  # (channel_id_input, key_word)
+    results: list[SearchResult] = field(default_factory=list)
+    merged: list[dict] = field(default_factory=list)
+    video_ids_total: int = 0  # クエリごとの videoId 数の合計
+    video_ids_unique: int = 0  # 重複排除後（videos.list に回したのはこちら）
+    channel_ids_total: int = 0
+    channel_ids_unique: int = 0
+
+    def stats(self) -> dict:
+        return {
+            "queries": len(self.queries),
+            "video_ids_total": self.video_ids_total,
+            "video_ids_unique": self.video_ids_unique,
+            "channel_ids_total": self.channel_ids_total,
+            "channel_ids_unique": self.channel_ids_unique,
+            "pages": sum(r.pages for r in self.results),
+        }
+
+    def select_merged(
+        self, viewcount_min: str = "", viewcount_max: str = "", subscribercount_min: str = "", subscribercount_max: str = ""
+    ) -> list[dict]:
+        """merged に再生数/登録者数の絞り込みをかける（RSS の行は数字が無いのでそのまま後ろに）"""
+        rows = [r for r in self.merged if r.get("mode") != "rss"]
+        return filter_rows(rows, viewcount_min, viewcount_max, subscribercount_min, subscribercount_max) + [
+            r for r in self.merged if r.get("mode") == "rss"
+        ]
+
+
+async def _collect_ids(
+    session: aiohttp.ClientSession,
+    executor: BatchExecutor,
+    channel_id_input: str,
+    key_word: str,
+    after: str,
+    before: str,
+    order: str,
+    limit: int,
+    src: str,
+) -> tuple[SearchResult, list[str], list[str], str]:
+    """
+    search.list（or アップロード再生リスト）のフェーズだけ。enrich はしない。
+    return (枠だけの結果, video_ids, channel_ids, RSS で埋めるべき UC…)。
+    最後の要素はクォータ切れで1件も取れなかったチャンネル指定のクエリだけ（それ以外は ""）。
+    """
+    res = SearchResult(source=src)
+    vids: list[str] = []
+    chs: list[str] = []
+    channel_id = ""
+    try:
+        if (channel_id_input or "").strip():
+            channel_id = await _resolve_channel_id(session, channel_id_input)
+            if not channel_id:
+                res.error = "channel-id を解決できませんでした（UC〜 or https://www.youtube.com/channel/UC... 推奨）"
+                return res, [], [], ""
+        kw = (key_word or "").strip()
+        if src == "uploads":
+            if not channel_id:
+                res.error = "source=uploads は channel-id の指定が必要です"
+                return res, [], [], ""
+            playlist_id = await _uploads_playlist_id(session, executor, channel_id)
+            if not playlist_id:
+                res.error = "アップロード再生リストが見つかりませんでした"
+                return res, [], [], ""
+            pager = _iter_upload_pages(session, playlist_id, channel_id, kw, after, before, limit)
+        else:
+            pager = _iter_search_pages(session, _search_params(order, after, before, kw, channel_id), limit)
+        async for page_vids, page_chs, next_token in pager:
+            vids.extend(page_vids)
+            chs.extend(c for c in page_chs if c not in chs)
+            res.pages += 1
+            res.next_page_token = next_token
+            res.complete = not next_token
+    except QuotaExceededError as e:
+        if not vids:
+            res.error = str(e)
+            if channel_id:
+                return res, [], [], channel_id
+        else:
+            res.notice = "quotaExceeded: 途中までの結果です"
+    except Exception as e:
+        res.error = str(e)
+    res.fetched = len(vids)
+    return res, vids, chs, ""
+
+
+def _merge_rows(results: list[SearchResult], order: str) -> list[dict]:
+    seen: dict[str, dict] = {}
+    best_rank: dict[str, int] = {}
+    for qi, res in enumerate(results):
+        for row, rank in zip(res.rows, res.rows.ranks().tolist()):
+            url = row["video_url"]
+            if url in seen:
+                seen[url]["queries"].append(qi)
+                best_rank[url] = min(best_rank[url], rank)
+            else:
+                seen[url] = {**row, "queries": [qi]}
+                best_rank[url] = rank
+    rows = list(seen.values())
+    o = _normalize_order(order)
+    if o == "viewCount":
+        rows.sort(key=lambda r: -int(r.get("viewCount") or 0))
+    elif o == "relevance":
+        rows.sort(key=lambda r: (best_rank[r["video_url"]], r["queries"][0]))
+    else:
+        rows.sort(key=lambda r: r.get("publishedAt") or "", reverse=True)
+    return rows
+
+
+async def search_multi(
+    queries: list[tuple[str, str]],
+    published_from: str,
+    published_to: str,
+    video_count: str,
+    order: str = "date",
+    source: str = "search",
+) -> MultiSearchResult:
+    """
+    複数の (channel_id_input, key_word) をまとめて検索する（フィルタ前）。
+    search.list のフェーズは全クエリ並行で走らせ、出てきた video/channel ID を重複排除してから
+    videos.list / channels.list を1回ずつ（50件ずつのバッチ）回す。
+    ローカルで答えられるクエリ（source=index / ウォッチ中チャンネル）は iter_search と同じくローカルで。
+    """
+    out = MultiSearchResult(queries=list(queries))
+    limit = max(1, _to_int(video_count, 200))
+    published_from, published_to = _default_dates(published_from, published_to)
+    after = published_from + "T00:00:00Z"
+    before = published_to + "T23:59:59Z"
+    src = _normalize_source(source)
+    o = "date" if src == "uploads" else _normalize_order(order)
+
+    def _local(channel_input: str) -> bool:
+        if src == "index":
+            return True
+        watched = _cached_channel_id(channel_input)
+        return bool(watched) and watch_store.serves(watched, published_from)
+
+    session = get_session()
+    executor = BatchExecutor()
+
+    async def one(channel_input: str, key_word: str):
+        if _local(channel_input) or not api_keys.pool:
+            res = await search_unfiltered(channel_input, key_word, published_from, published_to, str(limit), o, source=src)
+            return res, None, None, ""
+        return await _collect_ids(session, executor, channel_input, key_word, after, before, o, limit, src)
+
+    collected = await asyncio.gather(*(one(c, w) for c, w in out.queries))
+
+    # クォータ切れで取れなかったチャンネル指定のクエリは、RSS をまとめて並行に取って埋める（iter_search と同じフォールバック）
+    rss_channels = [cid for *_x, cid in collected if cid]
+    feeds = await rss_feed.fetch_many(rss_channels) if rss_channels else {}
+    for i, (res, _vids, _chs, cid) in enumerate(collected):
+        if not cid:
+            continue
+        if cid in feeds:
+            rows = _rss_rows(cid, feeds[cid], out.queries[i][1], published_from, published_to, limit)
+            res = SearchResult(rows=rows, fetched=len(rows), complete=True, mode="rss", source=src)
+        else:
+            res.error = f"quotaExceeded + RSS fallback failed: {res.error}"
+        collected[i] = (res, None, None, "")
+
+    all_vids: list[str] = []
+    all_chs: list[str] = []
+    for _res, vids, chs, _cid in collected:
+        if vids is None:
+            continue
+        out.video_ids_total += len(vids)
+        out.channel_ids_total += len(chs)
+        all_vids.extend(vids)
+        all_chs.extend(chs)
+    all_vids = list(dict.fromkeys(all_vids))
+    all_chs = list(dict.fromkeys(all_chs))
+    out.video_ids_unique = len(all_vids)
+    out.channel_ids_unique = len(all_chs)
+
+    videos_map, channels_map = await asyncio.gather(
+        _enrich_videos(session, executor, all_vids),
+        _enrich_channels(session, executor, all_chs),
+        return_exceptions=True,
+    )
+    enrich_error = ""
+    if isinstance(videos_map, BaseException):
+        enrich_error = str(videos_map)
+        videos_map = {}
+    if isinstance(channels_map, BaseException):
+        # 登録者が取れなくても検索結果は出す（0扱い）
+        channels_map = {}
+
+    for res, vids, _chs, _cid in collected:
+        if vids is not None:
+            if enrich_error and not res.error:
+                res.error = enrich_error
+            for rank, vid in enumerate(vids):
+                v = videos_map.get(vid)
+                if v:
+                    res.rows.append(_build_row(vid, v, channels_map), rank)
+        out.results.append(res)
+
+    out.merged = _merge_rows([r for r in out.results if not r.error], o)
     return out
@@ -0,0 +1,56 @@
+# singleflight.py
+# 同じキーの処理が実行中なら、新しく走らせずにその結果を待つ（in-flight の重複排除）。
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, TypeVar
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    def __init__(self):
+        self._inflight: Dict[Hashable, "asyncio.Future[Any]"] = {}
+        self._waiters: Dict[Hashable, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._inflight)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._inflight
+
+    def waiting(self, key: Hashable) -> int:
+        """key の結果を do() で待っている数"""
+        return self._waiters.get(key, 0)
+
+    def start(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> "asyncio.Future[T]":
+        """
+        key が実行中ならその Future を、なければ fn() を起動して登録した Future を返す（待たない）。
+        呼んだ時点で登録されるので、直後に来た do() は相乗りする。
+        """
+        fut = self._inflight.get(key)
+        if fut is None:
+            fut = asyncio.ensure_future(fn())
+            self._inflight[key] = fut
+
+            def _done(f, k=key):
+                if self._inflight.get(k) is f:
+                    self._inflight.pop(k, None)
+                # 誰も待っていないまま失敗しても警告を出さない
+                if not f.cancelled():
+                    f.exception()
+
+            fut.add_done_callback(_done)
+        return fut
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        """
+        key が実行中ならそれを待ち、なければ fn() を起動して待つ。
+        待っている側がキャンセルされても本体は止めない（他の待ち手がいるため shield する）。
+        """
+        fut = self.start(key, fn)
+        self._waiters[key] = self._waiters.get(key, 0) + 1
+        try:
+            return await asyncio.shield(fut)
+        finally:
+            n = self._waiters.pop(key, 1) - 1
+            if n > 0:
+                self._waiters[key] = n
@@ -0,0 +1,244 @@
+# tests/conftest.py
+# テスト共通: YouTube Data API は FakeYouTube（メモリ上の動画一覧）/ FakeComments（コメント）に差し替え、
+# SQLite はテストごとに一時ディレクトリの新しいファイルを使う（本物のキー・data/ には触らない）。
+#   python -m pytest -q
+import os
+import sys
+import asyncio
+import tempfile
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Set, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# モジュールが import 時に読む設定
+os.environ["DATA_DIR"] = tempfile.mkdtemp(prefix="yt-test-")
+os.environ["API_KEYS"] = "test-key"
+os.environ.pop("LOCAL_DB_PATH", None)
+os.environ.pop("WATCH_CHANNELS", None)
+
+import pytest
+
+import http_client
+import local_db
+import search_youtube
+
+UTC = timezone.utc
+
+
+def iso(dt: datetime) -> str:
+    return dt.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+class FakeYouTube:
+    """
+    search.list / videos.list / channels.list / playlistItems.list（アップロード一覧）だけを持つ YouTube Data API の代わり。
+    動画 i は start + step*i に公開、再生数は i が大きい（新しい）ほど少ない。
+    search.list は本物と同じく1つの検索で cap 件まで（それ以上は nextPageToken を返さない）。
+    quota_on に search.list の何回目（1始まり）かを入れると、その回で QuotaExceededError を出す。
+    delay は1回の呼び出しにかかる秒数（途中で止めたときに先を取りに行かないかを見る用）。
+    """
+
+    def __init__(
+        self,
+        n: int = 600,
+        start: datetime = datetime(2024, 1, 1, tzinfo=UTC),
+        step: timedelta = timedelta(hours=6),
+        channels: int = 7,
+        cap: int = 500,
+    ):
+        self.videos = [
+            {
+                "id": f"v{i:09d}",
+                "published": start + step * i,
+                "views": 1_000_000 - i * 100,
+                "channel": f"UC{i % channels:022d}",
+                "title": f"video {i}",
+            }
+            for i in range(n)
+        ]
+        self.by_id = {v["id"]: v for v in self.videos}
+        self.cap = cap
+        self.calls: List[Tuple[str, Dict[str, Any]]] = []
+        self.quota_on: Set[int] = set()
+        self.delay = 0.0
+
+    def count(self, endpoint: str) -> int:
+        return sum(1 for e, _p in self.calls if e == endpoint)
+
+    async def __call__(self, session, endpoint: str, params: dict, quota_method: str, retries: int = 4):
+        self.calls.append((endpoint, dict(params)))
+        nth = self.count(endpoint)
+        await asyncio.sleep(self.delay)
+        if endpoint == "search":
+            if nth in self.quota_on:
+                raise search_youtube.QuotaExceededError("search failed 403: quotaExceeded")
+            return self._search(params)
+        if endpoint == "videos":
+            return {"items": [self._video(self.by_id[v]) for v in params["id"].split(",") if v in self.by_id]}
+        if endpoint == "channels":
+            return {"items": [self._channel(c) for c in (params.get("id") or "").split(",") if c]}
+        if endpoint == "playlistItems":
+            return self._uploads(params)
+        return {"items": []}
+
+    def _search(self, params: dict) -> dict:
+        after = params.get("publishedAfter") or ""
+        before = params.get("publishedBefore") or "9999"
+        hits = [v for v in self.videos if after <= iso(v["published"]) <= before]
+        if params.get("order") == "viewCount":
+            hits.sort(key=lambda v: -v["views"])
+        else:
+            hits.sort(key=lambda v: v["published"], reverse=True)
+        total = len(hits)
+        hits = hits[: self.cap]
+        start = int(params.get("pageToken") or 0)
+        end = start + int(params.get("maxResults") or 50)
+        body: Dict[str, Any] = {
+            "items": [{"id": {"videoId": v["id"]}, "snippet": {"channelId": v["channel"]}} for v in hits[start:end]],
+            "pageInfo": {"totalResults": total},
+        }
+        if end < len(hits):
+            body["nextPageToken"] = str(end)
+        return body
+
+    def _uploads(self, params: dict) -> dict:
+        # UU... はチャンネル UC... のアップロード（新しい順・1ページ 50 件）
+        channel = "UC" + params["playlistId"][2:]
+        hits = sorted((v for v in self.videos if v["channel"] == channel), key=lambda v: v["published"], reverse=True)
+        start = int(params.get("pageToken") or 0)
+        end = start + int(params.get("maxResults") or 50)
+        body: Dict[str, Any] = {
+            "items": [
+                {
+                    "snippet": {"title": v["title"], "description": ""},
+                    "contentDetails": {"videoId": v["id"], "videoPublishedAt": iso(v["published"])},
+                }
+                for v in hits[start:end]
+            ]
+        }
+        if end < len(hits):
+            body["nextPageToken"] = str(end)
+        return body
+
+    @staticmethod
+    def _video(v: dict) -> dict:
+        return {
+            "id": v["id"],
+            "snippet": {
+                "publishedAt": iso(v["published"]),
+                "title": v["title"],
+                "description": "",
+                "channelId": v["channel"],
+                "channelTitle": "ch",
+            },
+            "statistics": {"viewCount": str(v["views"]), "likeCount": "1", "commentCount": "0"},
+            "contentDetails": {"duration": "PT3M"},
+        }
+
+    @staticmethod
+    def _channel(cid: str) -> dict:
+        return {
+            "id": cid,
+            "snippet": {"thumbnails": {"default": {"url": "icon"}}},
+            "statistics": {"subscriberCount": "10"},
+            "contentDetails": {"relatedPlaylists": {"uploads": "UU" + cid[2:]}},
+        }
+
+
+def _comment(cid):
+    return {
+        "id": cid,
+        "snippet": {
+            "publishedAt": "2024-01-01T00:00:00Z",
+            "textDisplay": cid,
+            "likeCount": 0,
+            "authorDisplayName": "a",
+            "authorProfileImageUrl": "p",
+        },
+    }
+
+
+class FakeComments:
+    """
+    スレッド n の返信数は n % 5（4 のときだけ 7 件）。埋め込みは本物と同じく最大 5 件なので、
+    7 件のスレッドだけ comments.list（1ページ 5 件）を辿る必要がある。
+    """
+
+    def __init__(self, threads=250, page=100):
+        self.threads = threads
+        self.page = page
+        self.calls = []
+
+    @staticmethod
+    def replies(n):
+        return 7 if n % 5 == 4 else n % 5
+
+    def expected_order(self):
+        out = []
+        for n in range(self.threads):
+            out.append((str(n + 1), f"t{n}"))
+            out += [(f"{n + 1}-{j + 1}", f"t{n}.r{j}") for j in range(self.replies(n))]
+        return out
+
+    def respond(self, endpoint, params):
+        self.calls.append(endpoint)
+        if endpoint == "commentThreads":
+            start = int(params.get("pageToken") or 0)
+            end = min(start + self.page, self.threads)
+            items = []
+            for n in range(start, end):
+                total = self.replies(n)
+                items.append({
+                    "snippet": {"totalReplyCount": total, "topLevelComment": _comment(f"t{n}")},
+                    "replies": {"comments": [_comment(f"t{n}.r{j}") for j in range(min(total, 5))]},
+                })
+            body = {"items": items}
+            if end < self.threads:
+                body["nextPageToken"] = str(end)
+            return body
+        n = int(params["parentId"][1:])
+        start = int(params.get("pageToken") or 0)
+        end = min(start + 5, self.replies(n))
+        body = {"items": [_comment(f"t{n}.r{j}") for j in range(start, end)]}
+        if end < self.replies(n):
+            body["nextPageToken"] = str(end)
+        return body
+
+    async def __call__(self, session, endpoint, params, quota_method, retries=4):
+        await asyncio.sleep(0)
+        return self.respond(endpoint, params)
+
+
+@pytest.fixture(autouse=True)
+def fresh_db(tmp_path, monkeypatch):
+    # 接続はスレッドごとに使い回されるので、置き場所と一緒に作り直させる
+    monkeypatch.setattr(local_db, "DB_PATH", str(tmp_path / "test.sqlite3"))
+    monkeypatch.setattr(local_db, "_local", threading.local())
+    # API は差し替えるので本物のセッションは作らない
+    monkeypatch.setattr(search_youtube, "get_session", lambda: None)
+    monkeypatch.setattr(http_client, "get_session", lambda: None)
+
+
+@pytest.fixture
+def youtube(monkeypatch) -> FakeYouTube:
+    yt = FakeYouTube()
+    monkeypatch.setattr(search_youtube, "_api_get_json", yt)
+    return yt
+
+
+@pytest.fixture
+def comments(monkeypatch) -> FakeComments:
+    fake = FakeComments()
+    monkeypatch.setattr(search_youtube, "_api_get_json", fake)
+    return fake
+
+
+def run(coro) -> Any:
+    return asyncio.run(coro)
+
+
+def video_ids(rows) -> List[str]:
+    return [r["video_url"].rsplit("=", 1)[-1] for r in rows]
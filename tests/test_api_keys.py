@@ -0,0 +1,116 @@
+# キープールの quotaExceeded フェイルオーバー（search_youtube._api_get_json の HTTP 層まで通す）
+import json
+import urllib.parse
+
+import pytest
+
+import api_keys
+import search_youtube
+from quota_tracker import QuotaTracker
+
+from conftest import run
+
+QUOTA_BODY = {"error": {"code": 403, "errors": [{"reason": "quotaExceeded"}]}}
+
+
+class _Resp:
+    def __init__(self, status, body):
+        self.status = status
+        self._body = body
+        self.headers = {}
+
+    async def text(self):
+        return json.dumps(self._body)
+
+    async def json(self):
+        return self._body
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+class FakeSession:
+    """exhausted に入っているキーには quotaExceeded を返す"""
+
+    def __init__(self, exhausted=()):
+        self.exhausted = set(exhausted)
+        self.keys = []
+
+    def get(self, url):
+        key = dict(urllib.parse.parse_qsl(urllib.parse.urlparse(url).query))["key"]
+        self.keys.append(key)
+        if key in self.exhausted:
+            return _Resp(403, QUOTA_BODY)
+        return _Resp(200, {"items": [{"id": "ok"}]})
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    p = api_keys.ApiKeyPool(["k1", "k2"], tracker=QuotaTracker(limit=100))
+    monkeypatch.setattr(api_keys, "pool", p)
+    return p
+
+
+def _get(session, video_id):
+    return run(search_youtube._api_get_json(session, "videos", {"id": video_id, "key": "ignored"}, "videos.list"))
+
+
+def test_fails_over_and_skips_exhausted_key(pool):
+    session = FakeSession(exhausted={"k1"})
+    assert _get(session, "a")["items"] == [{"id": "ok"}]
+    assert _get(session, "b")["items"] == [{"id": "ok"}]
+    # k1 は1回 quotaExceeded を返したらその日は使わない
+    assert session.keys.count("k1") == 1
+    assert session.keys.count("k2") == 2
+
+    usage = pool._tracker.by_key()
+    assert usage[pool.id_of("k1")]["exhausted"]
+    assert not usage[pool.id_of("k2")]["exhausted"]
+    # 失敗した試行もユニットは使う
+    assert usage[pool.id_of("k1")]["units"] == 1
+    assert usage[pool.id_of("k2")]["units"] == 2
+    assert pool._tracker.used == 3
+
+
+def test_all_keys_exhausted_raises(pool):
+    session = FakeSession(exhausted={"k1", "k2"})
+    with pytest.raises(search_youtube.QuotaExceededError):
+        _get(session, "a")
+    assert sorted(session.keys) == ["k1", "k2"]
+    assert pool.pick() == ""
+
+
+def test_picks_least_used_key(pool):
+    pool.record("k1", "search.list")
+    session = FakeSession()
+    _get(session, "a")
+    assert session.keys == ["k2"]
+
+
+def test_pick_reads_usage_from_memory(pool, monkeypatch):
+    pool.pick()
+    reads = []
+    by_key = pool._tracker.by_key
+    monkeypatch.setattr(pool._tracker, "by_key", lambda: reads.append(1) or by_key())
+
+    # 台帳は読み直さず、record() / mark_exhausted() の分だけで選び分ける
+    picked = []
+    for _ in range(4):
+        k = pool.pick()
+        picked.append(k)
+        pool.record(k, "search.list")
+    assert sorted(picked) == ["k1", "k1", "k2", "k2"]
+    pool.mark_exhausted("k2")
+    assert [pool.pick() for _ in range(3)] == ["k1"] * 3
+    assert reads == []
+
+    # 他のワーカーの分は USAGE_SYNC_SEC ごとに取り込む
+    monkeypatch.setattr(api_keys, "USAGE_SYNC_SEC", 0)
+    pool._tracker.add("search.list", 5, key_id=pool.id_of("k1"))
+    pool._tracker.flush()
+    pool._tracker.mark_exhausted(pool.id_of("k1"))
+    assert pool.pick() == ""
+    assert reads
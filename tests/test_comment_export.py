@@ -0,0 +1,78 @@
+# /comment/export: CSV（BOM 付き可）/ JSONL を流す。途中で失敗したらエラー行を最後に付けて終える
+import io
+import csv
+import gzip
+import json
+
+import app
+import search_youtube
+
+from conftest import run
+
+VIDEO = "abcdefghijk"
+
+
+def _get(query, headers=None):
+    async def go():
+        resp = await app.app.test_client().get(f"/comment/export?video-id={VIDEO}" + query, headers=headers or {})
+        return resp, await resp.get_data()
+
+    return run(go())
+
+
+def _fail_on_second_page(comments, monkeypatch):
+    respond = comments.respond
+
+    def failing(endpoint, params):
+        if endpoint == "commentThreads" and params.get("pageToken"):
+            raise search_youtube.QuotaExceededError("commentThreads failed 403: quotaExceeded")
+        return respond(endpoint, params)
+
+    monkeypatch.setattr(comments, "respond", failing)
+
+
+def test_csv_with_bom(comments):
+    resp, body = _get("&replies=1&bom=1")
+    assert resp.status_code == 200 and resp.mimetype == "text/csv"
+    assert resp.headers["Content-Disposition"] == f'attachment; filename="comments_{VIDEO}.csv"'
+    text = body.decode("utf-8")
+    assert text.startswith("﻿no,publishedAt,text,")
+    rows = list(csv.DictReader(io.StringIO(text[1:])))
+    assert [(r["no"], r["text"]) for r in rows] == comments.expected_order()
+    assert rows[0]["commentUrl"] == f"https://www.youtube.com/watch?v={VIDEO}&lc=t0"
+    by_no = {r["no"]: r for r in rows}
+    assert (by_no["4"]["replyCount"], by_no["4-3"]["replyCount"]) == ("3", "0")
+
+
+def test_jsonl_threads_only_with_limit(comments):
+    resp, body = _get("&format=jsonl&limit=7")
+    assert resp.mimetype == "application/x-ndjson"
+    rows = [json.loads(line) for line in body.decode().splitlines()]
+    assert [r["no"] for r in rows] == [str(n) for n in range(1, 8)]
+    assert set(rows[0]) == set(app.COMMENT_EXPORT_FIELDS)
+    # BOM は CSV のときだけ
+    assert not _get("&format=jsonl&bom=1")[1].startswith("﻿".encode())
+
+
+def test_error_row_ends_the_stream(comments, monkeypatch):
+    _fail_on_second_page(comments, monkeypatch)
+    first_page = [e for e in comments.expected_order() if int(e[0].split("-")[0]) <= 100]
+
+    _resp, body = _get("&format=jsonl&replies=1")
+    rows = [json.loads(line) for line in body.decode().splitlines()]
+    assert rows[-1] == {"error": "commentThreads failed 403: quotaExceeded", "mode": "error"}
+    got = [(r["no"], r["text"]) for r in rows[:-1]]
+    assert got and got == first_page[: len(got)]
+
+    _resp, body = _get("&replies=1")
+    rows = list(csv.DictReader(io.StringIO(body.decode())))
+    assert (rows[-1]["no"], rows[-1]["text"]) == ("error", "commentThreads failed 403: quotaExceeded")
+    assert [(r["no"], r["text"]) for r in rows[:-1]] == got
+
+
+def test_gzip_and_bad_params(comments):
+    resp, body = _get("&format=jsonl&limit=3", headers={"Accept-Encoding": "gzip"})
+    assert resp.headers["Content-Encoding"] == "gzip"
+    assert len(gzip.decompress(body).decode().splitlines()) == 3
+    assert _get("&format=xml")[0].status_code == 400
+    assert run(app.app.test_client().get("/comment/export?video-id=")).status_code == 400
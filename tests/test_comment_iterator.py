@@ -0,0 +1,59 @@
+# get_comment.iter_comments: crawl と同じ並びで1件ずつ流し、途中で止めたら先を取りに行かない
+import contextlib
+
+import get_comment
+import get_comment_by_id
+from get_comment_by_id import CrawlStats
+
+from conftest import run
+
+
+async def _collect(limit=0, stop_after=0, replies=True, **kw):
+    out = []
+    async with contextlib.aclosing(get_comment.iter_comments("vid", replies=replies, limit=limit, **kw)) as it:
+        async for row in it:
+            out.append(row)
+            if stop_after and len(out) >= stop_after:
+                break
+    return out
+
+
+def test_same_rows_as_crawl(comments):
+    crawled, _stats = run(get_comment_by_id.crawl("vid"))
+    comments.calls.clear()
+    stats = CrawlStats("vid")
+    rows = run(_collect(stats=stats, concurrency=4))
+    assert rows == crawled
+    assert stats.comments == len(rows)
+    assert stats.thread_pages == 3
+
+
+def test_threads_only(comments):
+    rows = run(_collect(replies=False))
+    assert [r["no"] for r in rows] == [str(n) for n in range(1, 251)]
+    assert "comments" not in comments.calls
+
+
+def test_limit_stops_fetching(comments):
+    rows = run(_collect(limit=30, concurrency=2))
+    assert [(r["no"], r["comment"]) for r in rows] == comments.expected_order()[:30]
+    # 1ページ目で足りるので次のページは取らない。返信は流したスレッドの少し先までしか辿らない
+    assert comments.calls.count("commentThreads") == 1
+    assert comments.calls.count("comments") <= 2 * 3
+
+
+def test_break_cancels_prefetch(comments):
+    rows = run(_collect(stop_after=5, concurrency=2))
+    assert len(rows) == 5
+    assert comments.calls.count("commentThreads") <= 2
+    assert comments.calls.count("comments") <= 2 * 3
+
+
+def test_make_row(comments):
+    rows = run(_collect(limit=4, make_row=lambda c, no, rc: {"no": no, "id": c["id"], "replies": rc}))
+    assert rows == [
+        {"no": "1", "id": "t0", "replies": 0},
+        {"no": "2", "id": "t1", "replies": 1},
+        {"no": "2-1", "id": "t1.r0", "replies": 0},
+        {"no": "3", "id": "t2", "replies": 2},
+    ]
@@ -0,0 +1,77 @@
+# コメント取得: スレッド → その返信の並び、埋め込み返信の再利用、返信のページ送り、クォータの計上
+import asyncio
+import json
+import urllib.parse
+
+import get_comment_by_id
+import http_client
+
+from conftest import FakeComments, run
+
+
+def test_crawl_order_and_reply_calls(comments):
+    rows, stats = run(get_comment_by_id.crawl("vid", concurrency=4))
+    assert [(r["no"], r["comment"]) for r in rows] == comments.expected_order()
+    # 返信の親はスレッドのコメント
+    assert {r["parentId"] for r in rows if r["no"] == "5-3"} == {"t4"}
+
+    assert stats.thread_pages == 3
+    assert stats.threads == 250
+    # comments.list は埋め込みで足りないスレッド（7件）だけ、2ページずつ
+    assert comments.calls.count("comments") == 50 * 2
+    assert stats.reply_calls == 100
+    assert stats.embedded_threads == 150
+    assert stats.comments == len(rows)
+
+
+class _Resp:
+    def __init__(self, status, body):
+        self.status = status
+        self._body = body
+        self.headers = {"Retry-After": "0"}
+
+    async def text(self):
+        return json.dumps(self._body)
+
+    async def json(self):
+        return self._body
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+class FakeSession:
+    """HTTP 層の代わり。最初の fail_first 回は 503 を返す"""
+
+    def __init__(self, fake: FakeComments, fail_first=0):
+        self.fake = fake
+        self.fail_first = fail_first
+        self.requests = 0
+
+    def get(self, url):
+        self.requests += 1
+        if self.fail_first > 0:
+            self.fail_first -= 1
+            return _Resp(503, {"error": {"code": 503}})
+        u = urllib.parse.urlparse(url)
+        endpoint = u.path.rsplit("/", 1)[-1]
+        return _Resp(200, self.fake.respond(endpoint, dict(urllib.parse.parse_qsl(u.query))))
+
+
+def test_quota_units_count_requests_actually_sent(monkeypatch):
+    fake = FakeComments(threads=3)  # 1ページ・返信は埋め込みで足りる
+    session = FakeSession(fake, fail_first=1)
+    monkeypatch.setattr(http_client, "get_session", lambda: session)
+
+    async def go():
+        # 同じ動画を同時に2回: 同じ呼び出しは相乗りになる
+        return await asyncio.gather(get_comment_by_id.crawl("vid"), get_comment_by_id.crawl("vid"))
+
+    (rows_a, a), (rows_b, b) = run(go())
+    assert rows_a == rows_b
+    # 503 のリトライも1回分として数える。相乗りした側は 0
+    assert session.requests == 2
+    assert sorted([a.quota_units, b.quota_units]) == [0, 2]
@@ -0,0 +1,113 @@
+# クォータ台帳: add() はメモリに溜めて FLUSH_SEC ごとにまとめて書く。読み出しは未書き込み分も含む
+import asyncio
+
+import pytest
+
+import quota_tracker
+from quota_tracker import QuotaTracker
+
+from conftest import run
+
+
+def _db_units(t: QuotaTracker) -> int:
+    r = t._db().execute("SELECT COALESCE(SUM(units), 0) FROM quota_usage").fetchone()
+    return int(r[0])
+
+
+@pytest.fixture
+def no_auto_flush(monkeypatch):
+    monkeypatch.setattr(quota_tracker, "FLUSH_SEC", 3600)
+
+
+def test_reads_include_pending_and_flush_writes_once(no_auto_flush):
+    t = QuotaTracker(limit=10_000)
+    t.add("search.list", key_id="k_a")
+    t.add("videos.list", times=3, key_id="k_a")
+    t.add("videos.list", key_id="k_b")
+
+    assert t.used == 104
+    assert t.by_method() == {"search.list": {"units": 100, "calls": 1}, "videos.list": {"units": 4, "calls": 4}}
+    assert t.by_key()["k_a"] == {"units": 103, "calls": 4, "exhausted": False}
+    assert t.snapshot_dict()["remaining_est"] == 10_000 - 104
+
+    t.flush()
+    assert _db_units(t) == 104
+    assert t.used == 104  # 書いた分を二重に数えない
+    t.flush()
+    assert _db_units(t) == 104
+
+
+def test_flushes_in_background_on_the_loop(monkeypatch):
+    monkeypatch.setattr(quota_tracker, "FLUSH_SEC", 0.05)
+    t = QuotaTracker()
+
+    async def go():
+        for _ in range(100):
+            t.add("videos.list")
+        written_now = _db_units(t)
+        await asyncio.sleep(0.3)
+        return written_now, _db_units(t)
+
+    # ループ上の add() は1回ずつは書かない。少し後にまとめて書かれる
+    assert run(go()) == (0, 100)
+
+
+def test_other_trackers_see_flushed_usage(no_auto_flush):
+    # 別ワーカー相当（同じ台帳ファイル・別インスタンス）
+    a, b = QuotaTracker(), QuotaTracker()
+
+    async def go():
+        a.add("search.list")
+        before = b.used
+        a.flush()
+        return before, b.used
+
+    assert run(go()) == (0, 100)
+
+
+def test_exhausted_flag_survives_pending_usage():
+    t = QuotaTracker()
+    t.mark_exhausted("k_a")
+    t.add("videos.list", key_id="k_a")
+    assert t.by_key()["k_a"] == {"units": 1, "calls": 1, "exhausted": True}
+
+
+@pytest.mark.parametrize("times", [0, -3])
+def test_times_is_at_least_one(times):
+    t = QuotaTracker()
+    t.add("videos.list", times=times)
+    assert t.used == 1
+
+
+def test_writes_immediately_outside_the_loop():
+    t = QuotaTracker()
+    t.add("videos.list")
+    t.add("videos.list", times=2)
+    assert _db_units(t) == 3
+
+
+def test_failed_background_flush_is_logged_and_retried(monkeypatch, caplog):
+    monkeypatch.setattr(quota_tracker, "FLUSH_SEC", 0.01)
+    t = QuotaTracker()
+    real_db = t._db
+    fail = [True]
+
+    def db():
+        if fail[0]:
+            raise RuntimeError("disk full")
+        return real_db()
+
+    monkeypatch.setattr(t, "_db", db)
+
+    async def go():
+        t.add("search.list")
+        await asyncio.sleep(0.1)
+        # 書けなかった分は残っていて、次の add() で予約し直して書く
+        assert t._pending
+        fail[0] = False
+        t.add("videos.list")
+        await asyncio.sleep(0.1)
+
+    run(go())
+    assert "quota ledger flush failed" in caplog.text
+    assert _db_units(t) == 101
@@ -0,0 +1,97 @@
+# 外向きHTTPのレート制御: トークンバケット、同時実行数、Retry-After / 共有バックオフ
+import time
+import asyncio
+from email.utils import format_datetime
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import rate_limit
+from rate_limit import HostLimiter
+
+from conftest import run
+
+
+async def _acquire_times(lim: HostLimiter, n: int):
+    t0 = time.monotonic()
+    out = []
+    for _ in range(n):
+        async with lim.slot():
+            out.append(time.monotonic() - t0)
+    return out
+
+
+def test_token_bucket_allows_burst_then_paces():
+    lim = HostLimiter("t", rps=50, burst=2, concurrency=10)
+    times = run(_acquire_times(lim, 5))
+    # バースト分（2件）はすぐ、残り3件は 1/50 秒ずつ
+    assert times[1] < 0.01
+    assert times[-1] >= 3 / 50 * 0.9
+    assert lim.stats()["acquired"] == 5
+
+
+def test_concurrency_cap():
+    lim = HostLimiter("t", rps=1000, burst=1000, concurrency=2)
+    peak = []
+
+    async def call():
+        async with lim.slot():
+            peak.append(lim.in_flight)
+            await asyncio.sleep(0.01)
+
+    async def go():
+        await asyncio.gather(*(call() for _ in range(6)))
+
+    run(go())
+    assert max(peak) == 2
+    assert lim.in_flight == 0 and lim.waiting == 0
+
+
+def test_retry_after_delays_the_next_acquire():
+    lim = HostLimiter("t", rps=1000, burst=1000, concurrency=10)
+    assert lim.backoff("0.1") == pytest.approx(0.1)
+    times = run(_acquire_times(lim, 1))
+    assert times[0] >= 0.09
+    s = lim.stats()
+    assert s["throttled"] == 1 and s["retry_after_honored"] == 1
+
+
+def test_concurrent_callers_share_one_backoff():
+    lim = HostLimiter("t", rps=1000, burst=1000, concurrency=10)
+
+    async def call(t0):
+        async with lim.slot():
+            return time.monotonic() - t0
+
+    async def go():
+        t0 = time.monotonic()
+        # 1つの呼び出し元が 429 を受けたら、これから slot() を取る全員が一緒に待つ
+        lim.backoff("0.1")
+        return await asyncio.gather(*(call(t0) for _ in range(5)))
+
+    waited = run(go())
+    assert min(waited) >= 0.09
+    # 待ったのは1回の backoff 分だけ（各自でリトライ待ちを重ねない）
+    assert max(waited) < 0.5 and lim.throttled == 1
+
+
+def test_backoff_without_retry_after_grows_and_resets(monkeypatch):
+    monkeypatch.setattr(rate_limit, "BACKOFF_BASE_SEC", 1.0)
+    monkeypatch.setattr(rate_limit, "BACKOFF_MAX_SEC", 4.0)
+    lim = HostLimiter("t", rps=10, burst=10, concurrency=1)
+    delays = [lim.backoff() for _ in range(4)]
+    for d, cap in zip(delays, [1.0, 2.0, 4.0, 4.0]):
+        assert cap / 2 <= d < cap
+    lim.ok()
+    assert 0.5 <= lim.backoff() < 1.0
+
+
+def test_parse_retry_after():
+    assert rate_limit.parse_retry_after("3") == 3.0
+    assert rate_limit.parse_retry_after("") is None
+    assert rate_limit.parse_retry_after("soon") is None
+    later = format_datetime(datetime.now(timezone.utc) + timedelta(seconds=30), usegmt=True)
+    assert 25 <= rate_limit.parse_retry_after(later) <= 30
+    # 異常に長い Retry-After は頭打ち
+    lim = HostLimiter("t", rps=1, burst=1, concurrency=1)
+    assert lim.backoff("86400") == rate_limit.RETRY_AFTER_MAX_SEC
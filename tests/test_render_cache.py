@@ -0,0 +1,100 @@
+# 描画キャッシュ: 圧縮の選択、ETag / If-None-Match → 304、LRU + TTL、/scraping/page での使われ方
+import gzip
+
+import app
+import render_cache
+from render_cache import RenderCache, Rendered
+
+from conftest import run
+
+BODY = "<tr><td>row</td></tr>\n" * 200
+
+
+def test_negotiate():
+    assert render_cache.negotiate("gzip, deflate") == "gzip"
+    assert render_cache.negotiate("gzip;q=0, identity") == ""
+    assert render_cache.negotiate("") == ""
+    if render_cache.brotli is not None:
+        assert render_cache.negotiate("gzip, br") == "br"
+
+
+def test_etag_and_304_across_encodings():
+    r = Rendered.of(BODY, ttl=60)
+    status, headers, body = r.respond("gzip", "")
+    assert status == 200
+    assert headers["Content-Encoding"] == "gzip"
+    assert headers["ETag"] == f'"{r.etag}-gz"'
+    assert gzip.decompress(body) == BODY.encode()
+
+    status, plain_headers, body = r.respond("", "")
+    assert plain_headers["ETag"] == f'"{r.etag}"' and body == BODY.encode()
+
+    # 304 は今返す表現の ETag と強い比較で一致したときだけ
+    for enc, tag in (("gzip", headers["ETag"]), ("", plain_headers["ETag"]), ("gzip", '"other", ' + headers["ETag"])):
+        status, _h, body = r.respond(enc, tag)
+        assert (status, body) == (304, b"")
+    # 別の圧縮の ETag・W/ 付きは別物として本文を返す
+    for enc, tag in (("", headers["ETag"]), ("gzip", plain_headers["ETag"]), ("", "W/" + plain_headers["ETag"]), ("gzip", '"other"')):
+        assert r.respond(enc, tag)[0] == 200
+
+
+def test_small_bodies_are_not_compressed():
+    status, headers, body = Rendered.of("<p>x</p>", ttl=60).respond("gzip", "")
+    assert "Content-Encoding" not in headers and body == b"<p>x</p>"
+
+
+def test_lru_and_ttl():
+    c = RenderCache(max_bytes=len(BODY) * 2 + 10)
+    c.put("a", BODY, "text/html", 60)
+    c.put("b", BODY, "text/html", 60)
+    assert c.get("a") is not None  # a を最近使った側へ
+    c.put("c", BODY, "text/html", 60)
+    assert c.get("b") is None
+    assert c.get("a") is not None and c.get("c") is not None
+
+    c.put("gone", BODY, "text/html", -1)
+    assert c.get("gone") is None
+    # key=None / ttl<=0 は登録しない
+    c.put(None, BODY, "text/html", 60)
+    assert c.stats()["entries"] == 2
+
+
+def test_encoded_variants_count_toward_the_limit():
+    raw = len(BODY.encode())
+    c = RenderCache(max_bytes=raw * 2 + 10)
+    a = c.put("a", BODY, "text/html", 60)
+    c.put("b", BODY, "text/html", 60)
+    assert c.stats()["entries"] == 2
+    # put() の後で作った圧縮版も数えるので、上限を超えたら古い方から追い出す
+    a.respond("gzip", "")
+    assert c.stats()["bytes"] <= c.max_bytes
+    assert c.get("a") is None and c.get("b") is not None
+
+
+def test_result_page_is_cached_and_revalidated(youtube):
+    app.CACHE.clear()
+    render_cache.cache.clear()
+    url = "/scraping/page?word=w&from=2024-01-01&to=2024-12-31&video-count=120&kind=normal&page=2&sort=views"
+
+    async def go():
+        client = app.app.test_client()
+        first = await client.get(url, headers={"Accept-Encoding": "gzip"})
+        body = await first.get_data()
+        calls = len(youtube.calls)
+        again = await client.get(url, headers={"Accept-Encoding": "gzip"})
+        same = await again.get_data()
+        not_modified = await client.get(url, headers={"Accept-Encoding": "gzip", "If-None-Match": first.headers["ETag"]})
+        plain = await client.get(url, headers={"If-None-Match": first.headers["ETag"]})
+        return first, body, calls, again, same, not_modified, await not_modified.get_data(), plain
+
+    first, body, calls, again, same, not_modified, nm_body, plain = run(go())
+    assert first.status_code == 200
+    assert first.headers.get("Content-Encoding") == "gzip"
+    assert first.headers.get("X-Result-Page")
+    assert again.headers["ETag"] == first.headers["ETag"] and same == body
+    # 2回目以降は検索も描画もしない
+    assert len(youtube.calls) == calls
+    assert not_modified.status_code == 304 and nm_body == b""
+    assert not_modified.headers.get("X-Result-Page") == first.headers.get("X-Result-Page")
+    # 圧縮しない表現は別の ETag
+    assert plain.status_code == 200 and plain.headers["ETag"] != first.headers["ETag"]
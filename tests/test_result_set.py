@@ -0,0 +1,90 @@
+# ResultSet（列持ちの検索結果）: append/extend の rank、subset、top_k の同点、文字列のまま持つ列
+import numpy as np
+
+from result_set import ResultSet
+
+
+def _row(i, views=0, **kw):
+    row = {
+        "publishedAt": f"2024-01-01 00:00:{i % 60:02d}",
+        "title": f"t{i}",
+        "viewCount": views,
+        "videoDuration": "3:02",
+        "video_url": f"https://www.youtube.com/watch?v=v{i}",
+        "subscriberCount": 10,
+    }
+    row.update(kw)
+    return row
+
+
+def _ids(rs):
+    return [r["title"] for r in rs]
+
+
+def test_append_and_extend_with_rank_offset():
+    a = ResultSet()
+    a.append(_row(0))
+    a.append(_row(1), rank=5)
+    b = ResultSet.from_rows([_row(2), _row(3)])
+    a.extend(b, rank_offset=50)
+    assert _ids(a) == ["t0", "t1", "t2", "t3"]
+    assert a.ranks().tolist() == [0, 5, 50, 51]
+    # 元の方は変わらない
+    assert b.ranks().tolist() == [0, 1]
+    a.extend(a)
+    assert len(a) == 8 and a.ranks().tolist()[4:] == [0, 5, 50, 51]
+
+
+def test_subset_rerank():
+    rs = ResultSet.from_rows([_row(i, views=i) for i in range(5)], ranks=[10, 11, 12, 13, 14])
+    sub = rs.subset([4, 1, 3])
+    assert _ids(sub) == ["t4", "t1", "t3"]
+    assert sub.ranks().tolist() == [14, 11, 13]
+    assert rs.subset([4, 1, 3], rerank=True).ranks().tolist() == [0, 1, 2]
+    assert rs.sorted("viewCount").ranks().tolist() == [0, 1, 2, 3, 4]
+    assert _ids(rs.sorted("viewCount")) == ["t4", "t3", "t2", "t1", "t0"]
+
+
+def test_top_k_keeps_ties_at_the_boundary_in_order():
+    views = [5, 9, 7, 7, 7, 1, 7]
+    rs = ResultSet.from_rows([_row(i, views=v) for i, v in enumerate(views)])
+    # 7 が4件並ぶ境界で切る: 同点は元の順（安定ソート）で先の方を取る
+    top = rs.top_k("viewCount", 3)
+    assert top.tolist() == [1, 2, 3]
+    assert top.tolist() == rs.argsort("viewCount")[:3].tolist()
+    for k in range(len(views) + 2):
+        assert rs.top_k("viewCount", k).tolist() == rs.argsort("viewCount")[:k].tolist()
+        assert rs.top_k("viewCount", k, descending=False).tolist() == rs.argsort("viewCount", False)[:k].tolist()
+    idx = np.array([6, 5, 4, 3])
+    assert rs.top_k("viewCount", 2, idx=idx).tolist() == [6, 4]
+
+
+def test_unparseable_duration_round_trips():
+    rs = ResultSet.from_rows([_row(0, videoDuration="P1DT2H"), _row(1, videoDuration=""), _row(2)])
+    assert [r["videoDuration"] for r in rs] == ["P1DT2H", "", "3:02"]
+    assert rs.column("durationSec").tolist() == [-1, -1, 182]
+    # subset / extend の後も行番号に付いていく
+    assert rs.subset([2, 0]).row(1)["videoDuration"] == "P1DT2H"
+    more = ResultSet.from_rows([_row(3)])
+    more.extend(rs)
+    assert more.row(1)["videoDuration"] == "P1DT2H"
+
+
+def test_extra_keys_are_kept():
+    rs = ResultSet.from_rows([_row(0), _row(1, mode="rss", isShorts=True), _row(2)])
+    assert "mode" not in rs.row(0)
+    assert rs.row(1)["mode"] == "rss"
+    assert rs.row(1, keys=("title", "mode")) == {"title": "t1", "mode": "rss"}
+    assert rs.column("isShorts").tolist() == [False, True, False]
+    shorts = rs.filter(kind="shorts")
+    assert shorts.to_dicts()[0]["mode"] == "rss"
+    assert rs.subset([2, 1]).row(1)["mode"] == "rss"
+
+
+def test_filter_never_returns_self():
+    rs = ResultSet.from_rows([_row(i, views=100) for i in range(3)])
+    same = rs.filter(viewcount_min=1)
+    assert same is not rs and _ids(same) == _ids(rs)
+    same.append(_row(9))
+    assert len(rs) == 3
+    assert _ids(rs.filter(viewcount_min=101)) == []
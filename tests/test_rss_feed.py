@@ -0,0 +1,169 @@
+# チャンネル RSS: 逐次パース、ETag での条件付き GET（304）、取れないときは手元の古い分、fetch_many の失敗チャンネル
+import json
+
+import pytest
+
+import rss_feed
+
+from conftest import run
+
+CH = "UC" + "1" * 22
+
+FEED = b"""<?xml version="1.0" encoding="UTF-8"?>
+<feed xmlns:yt="http://www.youtube.com/xml/schemas/2015" xmlns:media="http://search.yahoo.com/mrss/" xmlns="http://www.w3.org/2005/Atom">
+ <title>ch</title>
+ <entry>
+  <id>yt:video:aaaaaaaaaaa</id>
+  <yt:videoId>aaaaaaaaaaa</yt:videoId>
+  <title>\xe6\x96\xb0\xe3\x81\x97\xe3\x81\x84\xe5\x8b\x95\xe7\x94\xbb</title>
+  <author><name>ch</name></author>
+  <published>2024-05-02T00:00:00+00:00</published>
+  <media:group>
+   <media:title>new</media:title>
+   <media:thumbnail url="https://i.ytimg.com/vi/aaaaaaaaaaa/hqdefault.jpg" width="480" height="360"/>
+   <media:description>desc a</media:description>
+  </media:group>
+ </entry>
+ <entry>
+  <id>yt:video:bbbbbbbbbbb</id>
+  <yt:videoId>bbbbbbbbbbb</yt:videoId>
+  <title>old</title>
+  <author><name>ch</name></author>
+  <published>2024-05-01T00:00:00+00:00</published>
+ </entry>
+ <entry><title>no video id</title></entry>
+</feed>
+"""
+
+
+class _Content:
+    def __init__(self, body, size):
+        self._body = body
+        self._size = size
+
+    async def iter_chunked(self, n):
+        for i in range(0, len(self._body), self._size):
+            yield self._body[i : i + self._size]
+
+
+class _Resp:
+    def __init__(self, status, body=b"", headers=None, chunk=7):
+        self.status = status
+        self.headers = headers or {}
+        self.content = _Content(body, chunk)
+        self._body = body
+
+    async def text(self):
+        return self._body.decode()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+class FakeFeeds:
+    """channel_id ごとに FEED を返す。ETag が合えば 304、fail に入れたチャンネルは 500"""
+
+    def __init__(self):
+        self.fail = set()
+        self.requests = []
+
+    def get(self, url, headers=None, timeout=None):
+        cid = url.rsplit("=", 1)[-1]
+        self.requests.append((cid, dict(headers or {})))
+        if cid in self.fail:
+            return _Resp(500, b"oops")
+        if (headers or {}).get("If-None-Match") == '"v1"':
+            return _Resp(304)
+        return _Resp(200, FEED, {"ETag": '"v1"', "Last-Modified": "Wed, 01 May 2024 00:00:00 GMT"})
+
+
+@pytest.fixture
+def feeds(monkeypatch):
+    fake = FakeFeeds()
+    monkeypatch.setattr(rss_feed, "get_session", lambda: fake)
+    monkeypatch.setattr(rss_feed, "_feeds", {})
+    monkeypatch.setattr(rss_feed, "_stats", dict.fromkeys(rss_feed._stats, 0))
+    return fake
+
+
+def _expire(monkeypatch):
+    # 次の fetch は再検証に行く
+    monkeypatch.setattr(rss_feed, "FRESH_SEC", -1)
+
+
+def test_streaming_parser_matches_whole_parse():
+    whole = rss_feed.parse_feed(FEED)
+    assert [e["videoId"] for e in whole] == ["aaaaaaaaaaa", "bbbbbbbbbbb"]
+    assert whole[0] == {
+        "videoId": "aaaaaaaaaaa",
+        "title": "新しい動画",
+        "description": "desc a",
+        "publishedAt": "2024-05-02T00:00:00+00:00",
+        "authorName": "ch",
+        "thumbnail": "https://i.ytimg.com/vi/aaaaaaaaaaa/hqdefault.jpg",
+    }
+    assert whole[1]["description"] == "" and whole[1]["thumbnail"] == ""
+
+    # マルチバイト文字やタグの途中で切れたチャンクでも同じ
+    p = rss_feed._EntryParser()
+    for i in range(0, len(FEED), 5):
+        p.feed(FEED[i : i + 5])
+    assert p.close() == whole
+    # 読み終えた <entry> は木から外してある
+    assert [el.tag for el in p._root] == [rss_feed._ATOM + "title"]
+
+
+def test_fresh_entries_do_not_hit_the_network(feeds):
+    first = run(rss_feed.fetch(CH))
+    assert run(rss_feed.fetch(CH)) == first
+    assert len(feeds.requests) == 1
+    assert rss_feed.stats()["memory_hits"] == 1
+
+
+def test_revalidates_with_etag_and_keeps_entries_on_304(feeds, monkeypatch):
+    first = run(rss_feed.fetch(CH))
+    stored = rss_feed._db().execute("SELECT entries_json, fetched_at FROM rss_feeds WHERE channel_id=?", (CH,)).fetchone()
+
+    _expire(monkeypatch)
+    again = run(rss_feed.fetch(CH))
+    assert again == first
+    assert feeds.requests[1][1] == {"If-None-Match": '"v1"', "If-Modified-Since": "Wed, 01 May 2024 00:00:00 GMT"}
+    s = rss_feed.stats()
+    assert (s["fetched"], s["not_modified"]) == (1, 1)
+
+    # 304 は fetched_at だけ更新（エントリは書き直さない）
+    row = rss_feed._db().execute("SELECT entries_json, fetched_at FROM rss_feeds WHERE channel_id=?", (CH,)).fetchone()
+    assert row[0] == stored[0] and row[1] > stored[1]
+    assert [e["videoId"] for e in json.loads(row[0])] == ["aaaaaaaaaaa", "bbbbbbbbbbb"]
+
+    # 別ワーカー（メモリが空）も SQLite の ETag から条件付き GET
+    monkeypatch.setattr(rss_feed, "_feeds", {})
+    assert run(rss_feed.fetch(CH)) == first
+    assert feeds.requests[2][1].get("If-None-Match") == '"v1"'
+
+
+def test_serves_stale_entries_when_the_fetch_fails(feeds, monkeypatch):
+    first = run(rss_feed.fetch(CH))
+    _expire(monkeypatch)
+    feeds.fail.add(CH)
+    assert run(rss_feed.fetch(CH)) == first
+    assert rss_feed.stats()["stale_served"] == 1
+
+    # 手元に何も無ければエラー
+    other = "UC" + "2" * 22
+    feeds.fail.add(other)
+    with pytest.raises(RuntimeError):
+        run(rss_feed.fetch(other))
+    assert rss_feed.stats()["errors"] == 1
+
+
+def test_fetch_many_drops_failing_channels(feeds):
+    bad = "UC" + "3" * 22
+    feeds.fail.add(bad)
+    out = run(rss_feed.fetch_many([CH, bad, CH, ""]))
+    assert list(out) == [CH]
+    assert [e["videoId"] for e in out[CH]] == ["aaaaaaaaaaa", "bbbbbbbbbbb"]
+    assert sorted(c for c, _h in feeds.requests) == sorted([CH, bad])
@@ -0,0 +1,77 @@
+# /scraping/page: 並べ替え（sort / dir）とページ切り出し、X-Result-* ヘッダ
+import json
+
+import pytest
+
+import app
+import render_cache
+
+from conftest import run, video_ids
+
+BASE = "/scraping/page?word=w&from=2024-01-01&to=2024-12-31&video-count=120&kind=normal"
+
+
+@pytest.fixture
+def get(youtube):
+    app.CACHE.clear()
+    render_cache.cache.clear()
+
+    def get(query):
+        async def go():
+            resp = await app.app.test_client().get(BASE + query)
+            return resp, await resp.get_data()
+
+        return run(go())
+
+    return get
+
+
+def _json_ids(get, query):
+    resp, body = get(query + "&format=json")
+    assert resp.status_code == 200
+    data = json.loads(body)
+    return video_ids(data["rows"]), data
+
+
+def test_sorts_then_pages(get, youtube):
+    all_ids, meta = _json_ids(get, "&per-page=500")
+    assert len(all_ids) == 120 and meta["sort"] == ""
+    views = {v: youtube.by_id[v]["views"] for v in all_ids}
+    published = {v: youtube.by_id[v]["published"] for v in all_ids}
+
+    by_views = sorted(all_ids, key=lambda v: -views[v])
+    ids, meta = _json_ids(get, "&sort=views&page=2&per-page=50")
+    assert ids == by_views[50:100]
+    assert {k: meta[k] for k in ("total", "page", "pages", "per_page", "sort", "dir")} == {
+        "total": 120, "page": 2, "pages": 3, "per_page": 50, "sort": "views", "dir": "desc",
+    }
+
+    ids, _meta = _json_ids(get, "&sort=date&dir=asc&page=1&per-page=30")
+    assert ids == sorted(all_ids, key=lambda v: published[v])[:30]
+
+    # 全部同じ長さ: 同点は検索結果の順のまま
+    ids, _meta = _json_ids(get, "&sort=duration&page=3&per-page=50")
+    assert ids == all_ids[100:]
+
+    # 知らない sort は検索結果の順、dir は desc 扱い
+    ids, meta = _json_ids(get, "&sort=bogus&dir=up&page=1&per-page=10")
+    assert ids == all_ids[:10] and (meta["sort"], meta["dir"]) == ("", "desc")
+
+
+def test_html_fragment_headers_and_page_clamp(get):
+    resp, body = get("&sort=views&page=99&per-page=50")
+    assert resp.status_code == 200 and resp.mimetype == "text/html"
+    assert {k: resp.headers[k] for k in ("X-Result-Total", "X-Result-Page", "X-Result-Pages", "X-Result-Per-Page")} == {
+        "X-Result-Total": "120", "X-Result-Page": "3", "X-Result-Pages": "3", "X-Result-Per-Page": "50",
+    }
+    assert body.count(b"<tr>") == 20  # 最後のページは残りの 20 件
+
+    resp, _body = get("&page=0&per-page=100000")
+    assert (resp.headers["X-Result-Page"], resp.headers["X-Result-Per-Page"]) == ("1", str(app.PAGE_SIZE_MAX))
+
+
+def test_fields_projection(get):
+    resp, body = get("&sort=views&per-page=5&format=json&fields=video_url,viewCount")
+    rows = json.loads(body)["rows"]
+    assert len(rows) == 5 and all(set(r) == {"video_url", "viewCount"} for r in rows)
+    assert [r["viewCount"] for r in rows] == sorted((r["viewCount"] for r in rows), reverse=True)
@@ -0,0 +1,30 @@
+# /scraping 系のクエリ → form: 無指定の項目は default_form と同じ値になる
+import pytest
+
+import app
+
+from conftest import run
+
+
+async def _form(qs):
+    async with app.app.test_request_context("/scraping?" + qs):
+        return app._search_form()
+
+
+@pytest.mark.parametrize(
+    "qs, stream",
+    [
+        ("word=w", "1"),  # リンク・ブックマーク（stream 無し）は既定どおり逐次表示
+        ("word=w&stream=0", "0"),  # フォームでチェックを外した（hidden の 0 だけ）
+        ("word=w&stream=0&stream=1", "1"),  # チェックあり（hidden の後ろにチェックボックスの 1）
+    ],
+)
+def test_stream_param(qs, stream):
+    assert run(_form(qs))["stream"] == stream
+
+
+def test_missing_params_follow_default_form():
+    form = run(_form(""))
+    defaults = app.default_form()
+    for k in ("stream", "order", "source", "shards", "video_count", "dir", "per_page"):
+        assert form[k] == defaults[k], k
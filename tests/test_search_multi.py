@@ -0,0 +1,25 @@
+# /api/search/multi: クエリ間で重複排除した merged にも再生数の絞り込みがかかる
+import json
+
+import app
+
+from conftest import run, video_ids
+
+
+def test_merged_rows_are_deduped_and_filtered(youtube):
+    app.CACHE.clear()
+    url = "/api/search/multi?word=a&word=b&from=2024-01-01&to=2024-12-31&video-count=100&viewcount-level=945000"
+
+    async def go():
+        resp = await app.app.test_client().get(url)
+        return resp.status_code, json.loads(await resp.get_data())
+
+    status, body = run(go())
+    assert status == 200
+    # FakeYouTube は q を見ないので2つのクエリは同じ動画を返す → merged では1行ずつ
+    first, second = (q["rows"] for q in body["queries"])
+    assert video_ids(first) == video_ids(second)
+    assert 0 < len(first) < 100 and all(r["viewCount"] >= 945000 for r in first)
+    assert video_ids(body["merged"]) == video_ids(first)
+    assert all(r["queries"] == [0, 1] for r in body["merged"])
+    assert body["stats"]["video_ids_unique"] * 2 == body["stats"]["video_ids_total"]
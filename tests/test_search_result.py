@@ -0,0 +1,105 @@
+# SearchResult.covers / extend と、app のキャッシュ（フィルタ前の結果を件数違いで使い回す）
+import app
+import search_youtube
+from search_youtube import SearchResult
+
+from conftest import run, video_ids
+
+
+def _rows(n, start=0):
+    return [{"title": f"t{i}", "viewCount": 1000 - i, "video_url": f"https://www.youtube.com/watch?v=v{i}"} for i in range(start, start + n)]
+
+
+def _search_kwargs(**kw):
+    d = dict(channel_id="", word="w", from_date="2024-01-01", to_date="2024-12-31",
+             view_min="", view_max="", sub_min="", sub_max="", video_count="100", order="date")
+    d.update(kw)
+    return d
+
+
+def test_covers():
+    assert SearchResult(rows=_rows(3), fetched=3, complete=True).covers(500)
+    assert SearchResult(rows=_rows(100), fetched=100, next_page_token="x").covers(100)
+    assert not SearchResult(rows=_rows(100), fetched=100, next_page_token="x").covers(101)
+    assert not SearchResult(error="boom", complete=True).covers(1)
+    # 再生数順で打ち切った結果は、打ち切り時の最小再生数より大きい Min なら件数が足りなくても賄える
+    floor = SearchResult(rows=_rows(50), fetched=50, next_page_token="x", view_floor=900)
+    assert floor.covers(500, viewcount_min=1000)
+    assert not floor.covers(500, viewcount_min=900)
+
+
+def test_extend_offsets_rank_and_takes_paging_state():
+    res = SearchResult(rows=_rows(50), fetched=52, next_page_token="p1", pages=1)
+    more = SearchResult(rows=_rows(50, start=50), fetched=50, next_page_token="", complete=True, pages=1)
+    res.extend(more)
+
+    assert len(res.rows) == 100
+    assert res.fetched == 102
+    assert res.complete and not res.can_extend()
+    assert res.pages == 2
+    assert list(res.rows.ranks()[48:52]) == [48, 49, 52, 53]
+    # rank で切るので、videos.list が返さなかった分も件数に数える
+    assert len(res.select(52)) == 50
+
+
+def test_cache_is_extended_on_a_copy(youtube):
+    app.CACHE.clear()
+    _rows100, first = run(app.run_search(**_search_kwargs()))
+    assert youtube.count("search") == 2
+    assert len(first.rows) == 100
+
+    rows200, second = run(app.run_search(**_search_kwargs(video_count="200")))
+    # 足りない分だけ続きのページを取る
+    assert youtube.count("search") == 4
+    assert len(rows200) == 200
+    assert video_ids(rows200)[:100] == video_ids(first.rows)
+    # 先に渡した結果は書き換えない（他の読み手が持っている）
+    assert second is not first
+    assert len(first.rows) == 100 and first.fetched == 100
+    key = search_youtube.search_key("", "w", "2024-01-01", "2024-12-31", "date", "search", "1")
+    assert app.cache_get(key) is second
+
+    # キャッシュで足りる件数・フィルタは API を呼ばない
+    rows, _res = run(app.run_search(**_search_kwargs(video_count="150", view_min="950000")))
+    assert youtube.count("search") == 4
+    assert len(rows) == 51  # 新しい順の 150 件のうち再生数 95万以上
+
+
+def test_failed_extension_keeps_the_cached_result(youtube):
+    app.CACHE.clear()
+    _rows, first = run(app.run_search(**_search_kwargs()))
+    assert youtube.count("search") == 2
+
+    # 続きのページでクォータ切れ: 最初から取り直さず、キャッシュ済みの 100 件を注意書き付きで返す
+    youtube.quota_on = {3, 4, 5, 6, 7, 8}
+    rows, res = run(app.run_search(**_search_kwargs(video_count="200")))
+    assert youtube.count("search") == 3
+    assert not res.error
+    assert "quotaExceeded" in res.notice
+    assert video_ids(rows) == video_ids(first.rows)
+    key = search_youtube.search_key("", "w", "2024-01-01", "2024-12-31", "date", "search", "1")
+    assert app.cache_get(key) is first and not first.notice
+
+    # 回復したら続きから（最初のページは取り直さない）
+    youtube.quota_on = set()
+    rows, res = run(app.run_search(**_search_kwargs(video_count="200")))
+    assert len(rows) == 200 and not res.notice
+    assert [p.get("pageToken") for e, p in youtube.calls if e == "search"][3:] == ["100", "150"]
+
+
+def test_failed_extension_while_streaming(youtube):
+    app.CACHE.clear()
+    run(app.run_search(**_search_kwargs()))
+    youtube.quota_on = {3}
+
+    async def stream():
+        out = []
+        async for rows, res in app.iter_run_search(**_search_kwargs(video_count="200")):
+            out.append((len(rows), res))
+        return out
+
+    out = run(stream())
+    assert youtube.count("search") == 3
+    assert sum(n for n, _r in out) == 100
+    last = out[-1][1]
+    assert not last.error and "quotaExceeded" in last.notice
@@ -0,0 +1,67 @@
+# 期間分割（shards）: 分割ごとの結果のまとめ直し、limit に合わせた打ち切り、一部失敗時の部分結果
+from datetime import timedelta
+
+import pytest
+
+import search_youtube
+
+from conftest import FakeYouTube, run, video_ids
+
+
+@pytest.fixture
+def year(monkeypatch) -> FakeYouTube:
+    # 2024年に1日10本（3660本）。1つの検索では新しい方から 500 本までしか取れない
+    yt = FakeYouTube(n=3660, step=timedelta(hours=2.4))
+    monkeypatch.setattr(search_youtube, "_api_get_json", yt)
+    return yt
+
+
+def _search(limit, order="date", shards=4):
+    return run(search_youtube.search_unfiltered("", "w", "2024-01-01", "2024-12-31", str(limit), order, shards=shards))
+
+
+def _newest(yt, n):
+    return [v["id"] for v in sorted(yt.videos, key=lambda v: v["published"], reverse=True)[:n]]
+
+
+def test_date_order_merges_shards_beyond_the_cap(year):
+    res = _search(1500)
+    assert not res.error and not res.notice
+    assert res.shards > 4  # 500 件を超える分割はさらに割る
+    ids = video_ids(res.select(1500))
+    assert ids == _newest(year, 1500)
+    assert len(set(video_ids(res.rows))) == len(res.rows)
+
+
+def test_viewcount_order_is_global(year):
+    res = _search(300, order="viewCount")
+    views = [r["viewCount"] for r in res.select(300)]
+    assert len(views) == 300
+    assert views == sorted(views, reverse=True)
+    assert views[0] == max(v["views"] for v in year.videos)
+
+
+def test_small_limit_does_not_probe_every_shard(year):
+    # 1ページ目は1分割 100 units なので、分割数は limit から決める（shards は上限）
+    res = _search(100, shards=32)
+    assert year.count("search") <= 3
+    assert video_ids(res.select(100)) == _newest(year, 100)
+
+
+def test_partial_quota_keeps_fetched_shards(year):
+    year.quota_on = {3}
+    res = _search(300, shards=8)
+    assert not res.error
+    assert not res.complete
+    assert "quotaExceeded" in res.notice
+    assert len(res.rows) > 0
+    # 取れた分割の中では新しい順のまま
+    ids = video_ids(res.rows)
+    assert ids[:50] == _newest(year, 50)
+
+
+def test_all_shards_failing_is_an_error(year):
+    year.quota_on = set(range(1, 100))
+    res = _search(300, shards=8)
+    assert "quotaExceeded" in res.error
+    assert len(res.rows) == 0
@@ -0,0 +1,101 @@
+# 同じ検索・同じ API 呼び出しの相乗り（SingleFlight / app._search_flight / search_youtube._api_flight）
+import asyncio
+
+import app
+import search_youtube
+from singleflight import SingleFlight
+
+from conftest import run
+
+
+def _kw(**kw):
+    d = dict(channel_id="", word="w", from_date="2024-01-01", to_date="2024-12-31",
+             view_min="", view_max="", sub_min="", sub_max="", video_count="200", order="date")
+    d.update(kw)
+    return d
+
+
+def test_singleflight_shares_and_counts_waiters():
+    sf = SingleFlight()
+    started = []
+
+    async def work():
+        started.append(1)
+        await asyncio.sleep(0.01)
+        return len(started)
+
+    async def go():
+        a = asyncio.ensure_future(sf.do("k", work))
+        b = asyncio.ensure_future(sf.do("k", work))
+        await asyncio.sleep(0)
+        waiting = sf.waiting("k")
+        res = await asyncio.gather(a, b)
+        return waiting, res
+
+    waiting, res = run(go())
+    assert waiting == 2
+    assert res == [1, 1]
+    assert "k" not in sf and sf.waiting("k") == 0
+
+
+def test_api_flight_key_includes_retries(monkeypatch):
+    sent = []
+
+    async def once(session, endpoint, params, quota_method, retries=4):
+        sent.append(retries)
+        await asyncio.sleep(0.01)
+        return {"retries": retries}
+
+    monkeypatch.setattr(search_youtube, "_api_get_json_once", once)
+
+    async def go():
+        p = {"id": "a", "key": "x"}
+        return await asyncio.gather(
+            search_youtube._api_get_json(None, "videos", p, "videos.list"),
+            search_youtube._api_get_json(None, "videos", dict(p, key="y"), "videos.list"),
+            search_youtube._api_get_json(None, "videos", p, "videos.list", retries=0),
+        )
+
+    res = run(go())
+    assert sorted(sent) == [0, 4]
+    assert [r["retries"] for r in res] == [4, 4, 0]
+
+
+def test_streamed_search_is_shared(youtube):
+    app.CACHE.clear()
+
+    async def stream():
+        n = 0
+        async for rows, _res in app.iter_run_search(**_kw()):
+            n += len(rows)
+        return n
+
+    async def plain():
+        await asyncio.sleep(0)
+        rows, _res = await app.run_search(**_kw())
+        return len(rows)
+
+    async def go():
+        return await asyncio.gather(stream(), plain(), stream())
+
+    assert run(go()) == [200, 200, 200]
+    assert youtube.count("search") == 4
+
+
+def test_disconnected_stream_stops_fetching(youtube):
+    app.CACHE.clear()
+    youtube.delay = 0.01
+
+    async def go():
+        it = app.iter_run_search(**_kw(video_count="500"))
+        await it.__anext__()
+        await it.aclose()
+        at_close = youtube.count("search")
+        await asyncio.sleep(0.2)
+        return at_close, len(app._search_flight)
+
+    # 待っている相手がいなければ取得ごと止める（キャンセルが届くまでに出た1回を除き、切断後は search.list を叩かない）
+    at_close, inflight = run(go())
+    assert inflight == 0
+    assert youtube.count("search") <= at_close + 1
+    assert youtube.count("search") < 10
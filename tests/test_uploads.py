@@ -0,0 +1,67 @@
+# source=uploads: アップロード再生リストを新しい順に辿り、期間・キーワードはローカルで絞る
+import json
+
+import app
+import search_youtube
+import video_index
+
+from conftest import run, video_ids
+
+CHANNEL = "UC" + "0" * 22  # FakeYouTube の動画 0, 7, 14, ... （6時間おき × 7 = 42時間おき）
+
+
+def _uploads(youtube, ids_from="2024-01-01", ids_to="2024-12-31", word=""):
+    mine = [v for v in youtube.videos if v["channel"] == CHANNEL]
+    return [
+        v["id"]
+        for v in sorted(mine, key=lambda v: v["published"], reverse=True)
+        if ids_from <= v["published"].strftime("%Y-%m-%d") <= ids_to
+        and video_index.keyword_match(video_index.keyword_terms(word), v["title"])
+    ]
+
+
+def _search(limit, date_from="2024-01-01", date_to="2024-12-31", word=""):
+    return run(search_youtube.search_unfiltered(CHANNEL, word, date_from, date_to, str(limit), source="uploads"))
+
+
+def test_uploads_newest_first_without_search_list(youtube):
+    res = _search(60)
+    assert not res.error
+    assert youtube.count("search") == 0
+    assert youtube.count("playlistItems") == 2
+    assert video_ids(res.take(60)) == _uploads(youtube)[:60]
+
+
+def test_uploads_stop_at_the_start_of_the_window(youtube):
+    # 1ページ目（新しい 50 件）の途中で期間の始まりより古い動画が出たら、次のページは取らない
+    newest = max(v["published"] for v in youtube.videos if v["channel"] == CHANNEL)
+    start = newest.strftime("%Y-%m-%d")
+    res = _search(200, date_from=start)
+    assert youtube.count("playlistItems") == 1
+    assert res.complete
+    assert video_ids(res.rows) == _uploads(youtube, ids_from=start)
+
+
+def test_uploads_keyword_filter(youtube):
+    res = _search(200, word="video 161|196")
+    assert video_ids(res.rows) == ["v000000196", "v000000161"]
+    assert video_ids(res.rows) == _uploads(youtube, word="video 161|196")
+
+
+def test_streamed_uploads_respect_video_count(youtube):
+    app.CACHE.clear()
+    qs = f"channel-id={CHANNEL}&source=uploads&from=2024-01-01&to=2024-12-31&video-count=20"
+
+    async def go():
+        client = app.app.test_client()
+        streamed = await client.get("/api/search?format=ndjson&" + qs)
+        lines = [json.loads(x) for x in (await streamed.get_data()).decode().splitlines()]
+        app.CACHE.clear()
+        plain = await client.get("/api/search?" + qs)
+        return lines, json.loads(await plain.get_data())
+
+    lines, plain = run(go())
+    rows, done = lines[:-1], lines[-1]
+    assert done["done"] and done["count"] == 20
+    assert len(rows) == 20
+    assert [r["video_url"] for r in rows] == [r["video_url"] for r in plain["rows"]]
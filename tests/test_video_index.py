@@ -0,0 +1,120 @@
+# ローカル全文インデックス（source=index）: 取り込み・キーワード解釈・絞り込み
+import pytest
+
+import metadata_store
+import search_youtube
+import video_index
+
+from conftest import run, video_ids
+
+VIDEOS = {
+    "a1": ("ゲーム実況 テスト配信", "UCaaaaaaaaaaaaaaaaaaaaaa", "2024-03-01 10:00:00", 500),
+    "a2": ("げーむ まとめ", "UCaaaaaaaaaaaaaaaaaaaaaa", "2024-03-05 10:00:00", 900),
+    "b1": ("Python Tutorial てすと", "UCbbbbbbbbbbbbbbbbbbbbbb", "2024-04-01 10:00:00", 100),
+    "b2": ("料理 レシピ", "UCbbbbbbbbbbbbbbbbbbbbbb", "2024-05-01 10:00:00", 300),
+    "b3": ("ＰＹＴＨＯＮ 入門 まとめ", "UCbbbbbbbbbbbbbbbbbbbbbb", "2024-06-01 10:00:00", 700),
+}
+
+
+def _entry(title, channel_id, published_at, views):
+    return {
+        "publishedAt": published_at,
+        "title": title,
+        "description": "",
+        "thumbnails": "",
+        "channelId": channel_id,
+        "channelTitle": "ch",
+        "viewCount": views,
+        "likeCount": 0,
+        "commentCount": 0,
+        "videoDuration": "00:03:00",
+    }
+
+
+ENTRIES = {vid: _entry(*v) for vid, v in VIDEOS.items()}
+
+
+@pytest.fixture
+def index(monkeypatch):
+    monkeypatch.setattr(video_index, "_usable", None)
+    monkeypatch.setattr(video_index, "_backfilled", False)
+    if not video_index.available():
+        pytest.skip("SQLite に FTS5 trigram が無い")
+    # 半分はインデックス導入前から videos にあった分（backfill で入る）、残りは保存と同時に入る分
+    metadata_store.put_videos({k: ENTRIES[k] for k in ("a1", "a2", "b1")})
+    assert video_index.backfill() == 3
+    search_youtube._put_videos({k: ENTRIES[k] for k in ("b2", "b3")})
+    return video_index
+
+
+def _expected(query):
+    terms = video_index.keyword_terms(query)
+    return {vid for vid, e in ENTRIES.items() if video_index.keyword_match(terms, e["title"] + "\n" + e["description"])}
+
+
+@pytest.mark.parametrize(
+    "query, hits",
+    [
+        ("テスト", {"a1", "b1"}),  # カタカナ/ひらがなを区別しない
+        ("python", {"b1", "b3"}),  # 大文字小文字・全角半角を区別しない
+        ("げーむ -まとめ", {"a1"}),  # -xxx は除外
+        ("料理", {"b2"}),  # 2文字以下は instr で見る
+        ("まとめ 入門", {"b3"}),  # 空白は AND
+        ("テスト|レシピ", {"a1", "b1", "b2"}),  # | は OR
+        ("python | 料理", {"b1", "b2", "b3"}),  # 空白つきの | ・2文字以下が混ざった OR
+        ("げーむ まとめ|実況", {"a1", "a2"}),  # AND と OR: げーむ AND (まとめ OR 実況)
+        ("まとめ OR 料理 -python", {"a2", "b2"}),
+        ("", set(VIDEOS)),
+    ],
+)
+def test_search_matches_keyword_match(index, query, hits):
+    assert set(index.search(query)) == hits
+    # uploads / RSS のローカル絞り込みと同じ解釈
+    assert _expected(query) == hits
+
+
+def test_keyword_terms_or_groups():
+    assert video_index.keyword_terms("a|b") == ([["a", "b"]], [])
+    assert video_index.keyword_terms("a | b c") == ([["a", "b"], ["c"]], [])
+    assert video_index.keyword_terms("a -b|c") == ([["a"]], ["b", "c"])
+    assert video_index.keyword_match(video_index.keyword_terms("abc|xyz"), "only xyz here")
+    assert not video_index.keyword_match(video_index.keyword_terms("abc|xyz"), "neither")
+
+
+def test_search_filters_channel_and_dates(index):
+    assert index.search("", channel_id="UCaaaaaaaaaaaaaaaaaaaaaa") == ["a2", "a1"]
+    assert index.search("", published_from="2024-04-01", published_to="2024-05-01") == ["b2", "b1"]
+
+
+def test_source_index_uses_no_api(index, youtube):
+    res = run(search_youtube.search_unfiltered("", "まとめ", "2024-01-01", "2024-12-31", "10", "viewCount", source="index"))
+    assert youtube.calls == []
+    assert not res.error and res.complete
+    assert video_ids(res.rows) == ["a2", "b3"]  # 保存時点の再生数の多い順
+
+
+def test_not_complete_until_backfilled(monkeypatch, youtube):
+    monkeypatch.setattr(video_index, "_usable", None)
+    monkeypatch.setattr(video_index, "_backfilled", False)
+    if not video_index.available():
+        pytest.skip("SQLite に FTS5 trigram が無い")
+    res = run(search_youtube.search_unfiltered("", "", "2024-01-01", "2024-12-31", "10", "date", source="index"))
+    assert not res.error and not res.complete
+    assert res.notice
+
+
+def test_backfill_fills_gaps_in_a_partial_index(monkeypatch):
+    monkeypatch.setattr(video_index, "_usable", None)
+    monkeypatch.setattr(video_index, "_backfilled", False)
+    if not video_index.available():
+        pytest.skip("SQLite に FTS5 trigram が無い")
+    metadata_store.put_videos(ENTRIES)
+    # 起動時の取り込みより先にリクエストが一部を入れた / 前回の取り込みが途中で落ちた
+    video_index.index_videos({"b2": ENTRIES["b2"]})
+    assert video_index.search("") == ["b2"]
+
+    assert video_index.backfill() == 4
+    assert video_index.ready()
+    assert set(video_index.search("")) == set(VIDEOS)
+    # 足りない行が無ければ何もしない
+    assert video_index.backfill() == 0
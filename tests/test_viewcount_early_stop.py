@@ -0,0 +1,34 @@
+# order=viewCount + 再生数Min: Min を下回るページが出たらそれ以上 search.list を叩かない
+import search_youtube
+
+from conftest import run
+
+
+def _search(video_count="500", viewcount_min="995000", order="viewCount"):
+    return run(search_youtube.search_unfiltered(
+        "", "w", "2024-01-01", "2024-12-31", video_count, order, viewcount_min=viewcount_min
+    ))
+
+
+def test_stops_paging_below_min(youtube):
+    res = _search()
+
+    # 1ページ目（再生数 1,000,000〜995,100）は全部 Min 以上、2ページ目の途中で下回る
+    assert youtube.count("search") == 2
+    assert res.view_floor == 990_100
+    assert res.pages_saved == 8
+    assert res.quota_saved == 800
+    assert not res.complete and res.can_extend()
+    assert len(res.select(500, viewcount_min="995000")) == 51
+    # 同じ Min 以上の検索はこの結果で賄える（続きは全部フィルタで落ちる）
+    assert res.covers(500, 995_000)
+    assert not res.covers(500, 990_000)
+
+
+def test_no_early_stop_without_min_or_other_order(youtube):
+    _search(viewcount_min="")
+    assert youtube.count("search") == 10
+    youtube.calls.clear()
+    res = _search(order="date")
+    assert youtube.count("search") == 10
+    assert res.view_floor is None and res.quota_saved == 0
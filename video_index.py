@@ -0,0 +1,239 @@
+# video_index.py
+# metadata_store に溜まった動画（タイトル＋概要）の全文インデックス（SQLite FTS5 / trigram）。
+# 日本語は分かち書きせず3文字単位で引く。表記ゆれは NFKC + casefold + カタカナ→ひらがな で寄せる。
+# source=index の検索はここだけで答える（API・クォータを使わない）。
+import os
+import sys
+import json
+import time
+import asyncio
+import sqlite3
+import unicodedata
+from typing import Any, Dict, List, Tuple
+
+import local_db
+import metadata_store
+
+ENABLED = (os.environ.get("VIDEO_INDEX") or "1").strip() != "0"
+
+_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS video_fts USING fts5(body, tokenize='trigram');
+"""
+# videos テーブルの rowid をそのまま video_fts の rowid に使う。
+# チャンネル・期間は videos 側（videos_channel インデックス）で絞る。
+
+_SQL_CHUNK = 500
+_KANA = {c: c - 0x60 for c in range(0x30A1, 0x30F7)}  # ァ..ヶ → ぁ..ゖ
+
+
+def normalize(text: str) -> str:
+    return unicodedata.normalize("NFKC", text or "").casefold().translate(_KANA)
+
+
+_usable: bool | None = None  # FTS5 / trigram が使えるか（初回に確かめる）
+_backfilled = False
+_task: asyncio.Task | None = None
+
+
+def _db():
+    metadata_store._db()  # videos テーブルと JOIN するので先に作っておく
+    return local_db.ensure_schema("video_index", _SCHEMA)
+
+
+def available() -> bool:
+    """インデックスが使えるか（スキーマを作るだけ。取り込み済みかどうかは ready() で見る）"""
+    global _usable
+    if not ENABLED or not metadata_store.ENABLED:
+        return False
+    if _usable is None:
+        try:
+            _db()
+            _usable = True
+        except sqlite3.OperationalError:
+            # FTS5 / trigram の無い SQLite（3.34 未満）
+            _usable = False
+    return _usable
+
+
+def ready() -> bool:
+    """backfill まで済んでいるか（フラグを見るだけなので検索リクエストの中から呼んでよい）"""
+    return _backfilled and available()
+
+
+def backfill() -> int:
+    """
+    videos にあってインデックスに無い行を取り込む（インデックス導入前から溜まっていた分・
+    途中で落ちた取り込みの残り・index_videos より先に保存された分）。起動のたびに走らせてよい。
+    全件を見るので重い。イベントループでは呼ばず、startup() がスレッドで走らせる。
+    """
+    global _backfilled
+    if not available():
+        return 0
+    conn = _db()
+    # 「空なら取り込む」ではなく足りない行だけ（部分的に入っていても欠けが残らない）
+    entries = _load_entries(conn, missing_only=True)
+    _index(conn, entries)
+    _backfilled = True
+    return len(entries)
+
+
+async def startup():
+    global _task
+    if _task is None and available():
+        _task = asyncio.create_task(asyncio.to_thread(backfill))
+
+
+def _body(e: Dict[str, Any]) -> str:
+    return normalize((e.get("title") or "") + "\n" + (e.get("description") or ""))
+
+
+def index_videos(entries: Dict[str, Dict[str, Any]]):
+    """metadata_store.put_videos の直後に呼ぶ（videos に行がある前提）"""
+    if not entries or not available():
+        return
+    _index(_db(), entries)
+
+
+def _index(conn: sqlite3.Connection, entries: Dict[str, Dict[str, Any]]):
+    ids = [x for x in entries if x]
+    for i in range(0, len(ids), _SQL_CHUNK):
+        chunk = ids[i : i + _SQL_CHUNK]
+        rowids = dict(
+            conn.execute(f"SELECT id, rowid FROM videos WHERE id IN ({local_db.placeholders(len(chunk))})", chunk).fetchall()
+        )
+        rows = [(rowids[x], _body(entries[x])) for x in chunk if x in rowids]
+        # 読んでから書く遅延トランザクションは他スレッドの書き込みと競ると busy_timeout を待たずに locked になる
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany("DELETE FROM video_fts WHERE rowid=?", [(r[0],) for r in rows])
+            conn.executemany("INSERT INTO video_fts (rowid, body) VALUES (?,?)", rows)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+
+def _load_entries(conn: sqlite3.Connection, missing_only: bool = False) -> Dict[str, Dict[str, Any]]:
+    sql = "SELECT id, static_json FROM videos WHERE static_json IS NOT NULL"
+    if missing_only:
+        sql += " AND rowid NOT IN (SELECT rowid FROM video_fts)"
+    return {vid: json.loads(static_json) for vid, static_json in conn.execute(sql)}
+
+
+def rebuild() -> int:
+    """videos テーブル全体から作り直す（インデックス導入前に溜まっていた分の取り込み用）"""
+    conn = _db()
+    entries = _load_entries(conn)
+    conn.execute("DELETE FROM video_fts")
+    _index(conn, entries)
+    return len(entries)
+
+
+def keyword_terms(key_word: str) -> Tuple[List[List[str]], List[str]]:
+    """
+    YouTube の q と同じ解釈で (含む語のグループ, 除く語) に分ける（normalize 済み）。
+    空白区切りは AND、| （前後の空白あり/なし・単独の OR）はその両側のどれか、-xxx は除外。
+    グループはそれぞれ「どれか1つを含む」: "a b|c" → [["a"], ["b", "c"]]（a AND (b OR c)）。
+    キーワードの解釈はここ1つ（source=uploads のローカル絞り込み・RSS も search_youtube から同じものを使う）
+    """
+    groups: List[List[str]] = []
+    exc: List[str] = []
+    join_next = False
+    for t in normalize(key_word).split():
+        if t in ("|", "or"):
+            join_next = bool(groups)
+            continue
+        if t.startswith("-") and len(t) > 1:
+            exc.extend(x for x in t[1:].split("|") if x)
+            join_next = False
+            continue
+        alts = [x for x in t.split("|") if x]
+        if not alts:
+            join_next = bool(groups)
+            continue
+        if groups and (join_next or t.startswith("|")):
+            groups[-1].extend(alts)
+        else:
+            groups.append(alts)
+        join_next = t.endswith("|")
+    return groups, exc
+
+
+def keyword_match(terms: Tuple[List[List[str]], List[str]], text: str) -> bool:
+    """keyword_terms の結果で text（タイトル＋概要など）を判定する。インデックスの MATCH / instr と同じ正規化"""
+    groups, exc = terms
+    if not groups and not exc:
+        return True
+    hay = normalize(text)
+    return all(any(t in hay for t in g) for g in groups) and not any(t in hay for t in exc)
+
+
+def _quote(term: str) -> str:
+    return '"' + term.replace('"', '""') + '"'
+
+
+def search(
+    key_word: str,
+    channel_id: str = "",
+    published_from: str = "",
+    published_to: str = "",
+    limit: int = 200,
+    order: str = "date",
+) -> List[str]:
+    """
+    動画IDのリストを返す。published_from / published_to は YYYY-MM-DD（JST、両端含む）。
+    order: date=新しい順 / relevance=bm25（キーワードがあるとき）。viewCount の並べ替えは呼び出し側で。
+    """
+    if not available():
+        return []
+    groups, exc = keyword_terms(key_word)
+    # 全部3文字以上のグループは trigram の MATCH（インデックスを使う）、2文字以下を含むグループは本文を instr で見る
+    long_groups = [g for g in groups if min(map(len, g)) >= 3]
+    where: List[str] = []
+    args: List[Any] = []
+    if long_groups:
+        where.append("video_fts MATCH ?")
+        args.append(" AND ".join("(" + " OR ".join(_quote(t) for t in g) + ")" for g in long_groups))
+    for g in groups:
+        if min(map(len, g)) < 3:
+            where.append("(" + " OR ".join("instr(video_fts.body, ?) > 0" for _t in g) + ")")
+            args.extend(g)
+    for t in exc:
+        where.append("instr(video_fts.body, ?) = 0")
+        args.append(t)
+    if channel_id:
+        where.append("v.channel_id = ?")
+        args.append(channel_id)
+    if published_from:
+        where.append("v.published_at >= ?")
+        args.append(published_from)
+    if published_to:
+        where.append("v.published_at <= ?")
+        args.append(published_to + " 23:59:59")
+
+    order_by = "bm25(video_fts)" if (order == "relevance" and long_groups) else "v.published_at DESC"
+    sql = (
+        "SELECT v.id FROM video_fts JOIN videos v ON v.rowid = video_fts.rowid"
+        + (" WHERE " + " AND ".join(where) if where else "")
+        + f" ORDER BY {order_by}"
+    )
+    if limit and limit > 0:
+        sql += " LIMIT ?"
+        args.append(int(limit))
+    return [r[0] for r in _db().execute(sql, args)]
+
+
+if __name__ == "__main__":
+    # python video_index.py rebuild / python video_index.py "キーワード" [channel_id]
+    if len(sys.argv) > 1 and sys.argv[1] == "rebuild":
+        t0 = time.perf_counter()
+        n = rebuild() if available() else 0
+        print(f"indexed {n} videos in {time.perf_counter() - t0:.2f}s")
+    else:
+        backfill()
+        q = sys.argv[1] if len(sys.argv) > 1 else ""
+        ch = sys.argv[2] if len(sys.argv) > 2 else ""
+        t0 = time.perf_counter()
+        ids = search(q, ch)
+        print(f"{len(ids)} hits in {(time.perf_counter() - t0) * 1000:.1f} ms")
+        print("\n".join(ids[:20]))
@@ -0,0 +1,46 @@
+# watch_store.py
+# ウォッチリスト（WATCH_CHANNELS）の設定と同期状態の台帳（SQLite）。
+# 同期は channel_sync、検索側（search_youtube）はここの serves() だけを見る
+# （channel_sync は search_youtube の取得処理を使うので、search_youtube からは channel_sync を import しない）。
+import os
+import re
+import time
+
+import local_db
+import video_index
+
+WATCH_CHANNELS = [c for c in re.split(r"[\s,]+", os.environ.get("WATCH_CHANNELS") or "") if c]
+SYNC_INTERVAL_SEC = int(os.environ.get("WATCH_SYNC_INTERVAL_SEC") or "900")  # 新着チェック（既定 15分）
+# 同期がこれより古いチャンネルはローカルで答えない（同期が止まっていたら API に戻す）
+STALE_SEC = int(os.environ.get("WATCH_STALE_SEC") or str(3 * SYNC_INTERVAL_SEC))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS watch_channels (
+    channel_id TEXT PRIMARY KEY,
+    input TEXT NOT NULL DEFAULT '',
+    high_water TEXT NOT NULL DEFAULT '',
+    covered_from TEXT NOT NULL DEFAULT '',
+    synced_at REAL NOT NULL DEFAULT 0,
+    stats_at REAL NOT NULL DEFAULT 0,
+    last_error TEXT NOT NULL DEFAULT ''
+);
+CREATE TABLE IF NOT EXISTS sync_lease (
+    name TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    expires REAL NOT NULL
+);
+"""
+
+
+def db():
+    return local_db.ensure_schema("watch_store", _SCHEMA)
+
+
+def serves(channel_id: str, published_from: str) -> bool:
+    """このチャンネル・期間の検索をローカル（同期済みストア）で答えてよいか"""
+    if not WATCH_CHANNELS or not channel_id or not video_index.ready():
+        return False
+    r = db().execute("SELECT covered_from, synced_at FROM watch_channels WHERE channel_id=?", (channel_id,)).fetchone()
+    if not r or not r[0]:
+        return False
+    return time.time() - r[1] <= STALE_SEC and r[0] <= (published_from or "")